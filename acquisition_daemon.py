@@ -0,0 +1,395 @@
+# coding: utf-8
+
+# ---------------------------------------------------------------------------
+# 測定デーモン (センサーを読むのはこのプロセスだけにする)
+#
+# app.py / data_logger.py / nettyuusyou.py / matome.py がそれぞれセンサーを開くと、
+# 同時に動かしたときにI2Cの通信が何倍にもなり、センサーの設定も上書きし合います。
+# このデーモンだけがセンサーを読み (sensor_manager.SensorManager)、測定値を
+# Unixドメインソケットで購読中のプロセスに配信します。
+#
+# 通信は1行に1つのJSON (改行区切り) です:
+#   {"type": "hello", "sensors": [...], "interval": 5, "profile": "weather"}  接続直後に1回
+#   {"type": "sample", "seq": 12, "sensor_id": "1-76", "timestamp": 1754000000.0,
+#    "temperature": 28.1, "pressure": 1008.2, "humidity": 61.5}
+# 接続直後には各センサーの最新の測定値も送るので、購読側はすぐに値を使えます。
+#
+# 配信は別スレッド (selectors) で行い、測定スレッドは各購読者の送信バッファに
+# 行を追加するだけです。購読者の接続・切断や受信の遅れは測定に影響しません。
+# 受信が追いつかず送信バッファが SUBSCRIBER_BUFFER_LIMIT バイトを超えた購読者は切断します。
+#
+# 起動: python acquisition_daemon.py [--profile weather] [--interval 5] [--bus 1]
+# 購読: app.py / data_logger.py / nettyuusyou.py / matome.py を --daemon 付きで起動
+# ---------------------------------------------------------------------------
+
+import argparse
+import json
+import logging
+import os
+import selectors
+import signal
+import socket
+import threading
+import time
+
+from bme280_profiles import add_profile_arguments, describe, profile_from_args
+from scheduler import PeriodicScheduler
+from sensor_manager import SENSOR_ADDRESSES, Reading, SensorManager
+
+logger = logging.getLogger(__name__)
+
+# ソケットファイルの場所 (環境変数 BME280_SOCKET で変更可能)
+SOCKET_PATH = os.getenv('BME280_SOCKET', '/tmp/bme280.sock')
+DEFAULT_INTERVAL = 5         # 測定間隔 (秒)
+SCHEDULE_POLICY = 'skip'     # 予定時刻に間に合わなかったときの動作 (scheduler.py 参照)
+SUBSCRIBER_BUFFER_LIMIT = 1 << 20  # 購読者ごとの未送信データの上限 (バイト)
+
+
+def encode_message(message):
+    return (json.dumps(message, separators=(',', ':')) + '\n').encode('utf-8')
+
+
+class SampleServer:
+    """測定値を購読者に配信するUnixドメインソケットのサーバー"""
+
+    def __init__(self, path=SOCKET_PATH, hello=None, buffer_limit=SUBSCRIBER_BUFFER_LIMIT):
+        self.path = path
+        self.hello = dict(hello or {}, type='hello')
+        self.buffer_limit = buffer_limit
+        self.selector = selectors.DefaultSelector()
+        self.lock = threading.Lock()  # clients と latest の更新を直列化する
+        self.clients = {}  # 購読者のソケット → 未送信のデータ (bytearray)
+        self.latest = {}   # センサーID → 最新の測定値 (エンコード済みの行)
+        self.seq = 0
+        self.dropped = 0   # 受信が追いつかずに切断した購読者の数
+        self.listener = None
+        self.thread = None
+        self.running = False
+        # 測定スレッドから配信スレッドの select() を起こすためのソケット
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+
+    def start(self):
+        # 前回の異常終了でソケットファイルが残っていれば消す (使用中なら起動しない)
+        if os.path.exists(self.path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.path)
+            except OSError:
+                os.unlink(self.path)
+            else:
+                raise OSError(f"{self.path} は別のデーモンが使用中です")
+            finally:
+                probe.close()
+        self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.listener.bind(self.path)
+        self.listener.listen()
+        self.listener.setblocking(False)
+        self.selector.register(self.listener, selectors.EVENT_READ)
+        self.selector.register(self._wake_r, selectors.EVENT_READ)
+        self.running = True
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+
+    def publish(self, reading):
+        """測定値を全購読者の送信バッファに追加する (測定スレッドから呼ぶ, 待たない)"""
+        with self.lock:
+            self.seq += 1
+            line = encode_message(dict(reading._asdict(), type='sample', seq=self.seq))
+            self.latest[reading.sensor_id] = line
+            for pending in self.clients.values():
+                pending += line
+        self._wake()
+
+    def _wake(self):
+        try:
+            self._wake_w.send(b'\0')
+        except BlockingIOError:
+            pass  # 既に起こしてある
+
+    def subscriber_count(self):
+        return len(self.clients)
+
+    def _serve(self):
+        while self.running:
+            for key, events in self.selector.select(timeout=1.0):
+                if key.fileobj is self.listener:
+                    self._accept()
+                elif key.fileobj is self._wake_r:
+                    try:
+                        while self._wake_r.recv(4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                elif events & selectors.EVENT_READ:
+                    # 購読者からは何も送られてこないので、読めるのは切断されたとき
+                    try:
+                        data = key.fileobj.recv(4096)
+                    except BlockingIOError:
+                        continue
+                    except OSError:
+                        data = b''
+                    if not data:
+                        self._remove(key.fileobj)
+            self._flush()
+
+    def _accept(self):
+        try:
+            sock, _ = self.listener.accept()
+        except BlockingIOError:
+            return
+        sock.setblocking(False)
+        with self.lock:
+            pending = bytearray(encode_message(self.hello))
+            for line in self.latest.values():
+                pending += line
+            self.clients[sock] = pending
+        self.selector.register(sock, selectors.EVENT_READ)
+        logger.info(f"購読者が接続しました (購読者 {len(self.clients)})")
+
+    def _remove(self, sock):
+        with self.lock:
+            self.clients.pop(sock, None)
+        self.selector.unregister(sock)
+        sock.close()
+        logger.info(f"購読者が切断しました (購読者 {len(self.clients)})")
+
+    def _flush(self):
+        """送れるだけ送り、残った購読者だけ書き込み可能になるのを待つ"""
+        closed = []
+        with self.lock:
+            for sock, pending in self.clients.items():
+                try:
+                    while pending:
+                        sent = sock.send(pending)
+                        del pending[:sent]
+                except BlockingIOError:
+                    pass
+                except OSError:
+                    closed.append(sock)
+                    continue
+                if len(pending) > self.buffer_limit:
+                    logger.warning("受信が追いつかない購読者を切断します")
+                    self.dropped += 1
+                    closed.append(sock)
+                    continue
+                events = selectors.EVENT_READ | (selectors.EVENT_WRITE if pending else 0)
+                if self.selector.get_key(sock).events != events:
+                    self.selector.modify(sock, events)
+        for sock in closed:
+            self._remove(sock)
+
+    def close(self):
+        self.running = False
+        self._wake()
+        if self.thread is not None:
+            self.thread.join()
+        for sock in list(self.clients):
+            self._remove(sock)
+        if self.listener is not None:
+            self.selector.unregister(self.listener)
+            self.listener.close()
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
+        self.selector.close()
+        self._wake_r.close()
+        self._wake_w.close()
+
+
+class Subscriber:
+    """デーモンから測定値を受け取る (切断されたら間隔を延ばしながら再接続する)"""
+
+    def __init__(self, path=SOCKET_PATH, timeout=1.0, retry_interval=1.0, max_retry_interval=30.0):
+        self.path = path
+        self.timeout = timeout  # 受信を待つ時間 (この間隔で is_running() を確認する)
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+        self.sock = None
+        self.buffer = bytearray()
+        self.hello = None   # 接続時にデーモンから受け取った情報 (センサー一覧・測定間隔)
+        self.latest = {}    # センサーID → 最新の Reading
+        self.received = threading.Event()  # 最初の測定値を受け取ったら set
+        self.thread = None
+        self.running = False
+        self.stopping = threading.Event()  # close() で set (再接続の待ちを打ち切る)
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.path)
+        except OSError:
+            sock.close()
+            raise
+        self.sock = sock
+        self.buffer = bytearray()
+
+    def _disconnect(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def _receive(self):
+        """1行受け取ってJSONを返す (timeout 秒以内に届かなければ socket.timeout)"""
+        while b'\n' not in self.buffer:
+            chunk = self.sock.recv(65536)
+            if not chunk:
+                raise ConnectionError("デーモンが切断しました")
+            self.buffer += chunk
+        line, _, rest = self.buffer.partition(b'\n')
+        self.buffer = rest
+        return json.loads(line)
+
+    def readings(self, is_running=lambda: True):
+        """測定値 (sensor_manager.Reading) を受け取った順に返すジェネレーター
+
+        デーモンが止まっていれば再接続を続けます。再接続時に送られてくる
+        受け取り済みの測定値は返しません。
+        """
+        delay = self.retry_interval
+        while is_running():
+            if self.sock is None:
+                try:
+                    self.connect()
+                except OSError as e:
+                    logger.warning(f"測定デーモン ({self.path}) に接続できません: {e} ({delay:.0f}秒後に再試行)")
+                    self._pause(delay, is_running)
+                    delay = min(delay * 2, self.max_retry_interval)
+                    continue
+                delay = self.retry_interval
+            try:
+                message = self._receive()
+            except socket.timeout:
+                continue
+            except (OSError, ValueError) as e:
+                logger.warning(f"測定デーモンとの接続が切れました: {e}")
+                self._disconnect()
+                continue
+
+            if message.get('type') == 'hello':
+                self.hello = message
+                logger.info(f"測定デーモンに接続しました (センサー: "
+                            f"{', '.join(s['sensor_id'] for s in message.get('sensors', []))})")
+            elif message.get('type') == 'sample':
+                reading = Reading(*(message[field] for field in Reading._fields))
+                previous = self.latest.get(reading.sensor_id)
+                if previous is not None and reading.timestamp <= previous.timestamp:
+                    continue
+                self.latest[reading.sensor_id] = reading
+                self.received.set()
+                yield reading
+        self._disconnect()
+
+    def _pause(self, delay, is_running):
+        """delay 秒待つ (close() されるか is_running() が偽になったらすぐに戻る)"""
+        deadline = time.monotonic() + delay
+        while is_running():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self.stopping.wait(min(remaining, self.timeout)):
+                return
+
+    def start(self):
+        """バックグラウンドで受信を続け、latest_reading() で最新値を読めるようにする"""
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        return self
+
+    def _run(self):
+        for _ in self.readings(is_running=lambda: self.running):
+            pass
+
+    def wait(self, timeout=None):
+        """最初の測定値を受け取るまで待つ (受け取れば True)"""
+        return self.received.wait(timeout)
+
+    def latest_reading(self, sensor_id=None, max_age=None):
+        """センサー (None なら最初のセンサー) の最新の測定値
+
+        max_age 秒より古ければ (デーモンが止まっているなど) None を返します。
+        """
+        if sensor_id is None:
+            sensors = self.hello.get('sensors') if self.hello else None
+            sensor_id = sensors[0]['sensor_id'] if sensors else next(iter(self.latest), None)
+        reading = self.latest.get(sensor_id)
+        if reading is None or (max_age is not None and time.time() - reading.timestamp > max_age):
+            return None
+        return reading
+
+    def latest_readings(self, sensor_id=None, max_age=None):
+        """センサー (None なら受け取ったことのあるすべてのセンサー) の最新の測定値のリスト
+
+        max_age 秒より古い測定値は含めません。
+        """
+        sensor_ids = [sensor_id] if sensor_id is not None else list(self.latest)
+        readings = [self.latest_reading(s, max_age) for s in sensor_ids]
+        return [reading for reading in readings if reading is not None]
+
+    def close(self):
+        self.running = False
+        self.stopping.set()
+        if self.thread is not None:
+            self.thread.join()
+        self._disconnect()
+
+
+def add_subscriber_arguments(parser):
+    parser.add_argument('--daemon', nargs='?', const=SOCKET_PATH, default=None, metavar='SOCKET',
+                        help=f'センサーを直接読まずに測定デーモンから受け取る (既定のソケット: {SOCKET_PATH})')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='BME280を読み、測定値を購読中のプロセスに配信します')
+    add_profile_arguments(parser)
+    parser.add_argument('--interval', type=float, default=DEFAULT_INTERVAL, help='測定間隔 (秒)')
+    parser.add_argument('--bus', type=int, action='append', help='センサーを探すI2Cバスの番号 (複数指定可, 既定: 1)')
+    parser.add_argument('--socket', default=SOCKET_PATH, help='配信に使うソケットファイル')
+    args = parser.parse_args()
+    profile = profile_from_args(args, args.interval)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    manager = SensorManager(tuple(args.bus or (1,)), SENSOR_ADDRESSES, profile=profile)
+    sensors = manager.discover()
+    if not sensors:
+        logger.error("BME280が見つかりませんでした。センサー接続を確認してください。")
+        manager.close()
+        return
+    logger.info(f"計測プロファイル: {describe(profile)}")
+
+    server = SampleServer(args.socket, hello={
+        'sensors': [{'sensor_id': s.sensor_id, 'bus': s.bus_number, 'address': s.address} for s in sensors],
+        'interval': args.interval,
+        'profile': profile.name,
+    })
+    try:
+        server.start()
+    except OSError as e:
+        logger.error(f"ソケット {args.socket} を開けませんでした: {e}")
+        manager.close()
+        return
+    logger.info(f"配信を開始しました ({args.socket}, 測定間隔 {args.interval}秒)")
+
+    running = True
+    def stop(signum, frame):
+        nonlocal running
+        running = False
+    signal.signal(signal.SIGTERM, stop)
+
+    scheduler = PeriodicScheduler(args.interval, SCHEDULE_POLICY)
+    try:
+        for tick in scheduler.ticks(is_running=lambda: running):
+            for reading in manager.read_all():
+                server.publish(reading)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        logger.info("測定デーモンを終了します\n" + scheduler.format_stats())
+        server.close()
+        manager.close()
+
+
+if __name__ == '__main__':
+    main()
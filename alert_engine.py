@@ -0,0 +1,227 @@
+# coding: utf-8
+
+# ---------------------------------------------------------------------------
+# アラートの判定 (センサーごとの状態遷移) と通知のまとめ送信
+#
+# AlertEngine はセンサーごとに次の状態を持ちます:
+#
+#   normal ──(危険)──> pending ──(hold_on 秒続いた)──> alerting  … ここで 'triggered'
+#     ^                  │(危険でなくなった)               │(解除条件)
+#     │                  v                                 v
+#     └─────────────── normal <──(hold_off 秒続いた)── clearing  … ここで 'cleared'
+#
+# 危険の判定 (enter) と解除の判定 (exit) を別の関数にすることで、しきい値付近で
+# 値が上下しても通知と解除を繰り返さないようにします (ヒステリシス)。
+#
+# AlertDigest は 'triggered' のイベントを溜め、window 秒に最大1通になるようにまとめます。
+# 前回の送信から window 秒以上経っていれば最初のイベントはすぐに送り、
+# それ以降のイベントは window 秒が経つまで溜めてから1通にまとめて送ります。
+# センサーの数が多くても、各チャネルに送る通知の数はこれで頭打ちになります。
+#
+# measure_values() はルールで判定する値 (温湿度・気圧・WBGT など) をまとめ、
+# make_alert() はまとめたイベントから通知の内容 (送信待ちファイルに保存できる dict) を作り、
+# format_alert_details() はその本文を作ります (nettyuusyou.py / matome.py で共通)。
+# ---------------------------------------------------------------------------
+
+from collections import namedtuple
+from datetime import datetime
+
+from heat_stress import assess
+
+NORMAL = 'normal'
+PENDING = 'pending'
+ALERTING = 'alerting'
+CLEARING = 'clearing'
+
+TRIGGERED = 'triggered'
+CLEARED = 'cleared'
+
+# kind: TRIGGERED / CLEARED, timestamp: UNIX秒, values: 判定に使った測定値 (dict)
+AlertEvent = namedtuple('AlertEvent', ['sensor_id', 'kind', 'timestamp', 'values'])
+
+
+class SensorAlertState:
+    """1台のセンサーの状態"""
+
+    __slots__ = ('state', 'since', 'changed_at', 'values')
+
+    def __init__(self):
+        self.state = NORMAL
+        self.since = None       # pending / clearing になった時刻
+        self.changed_at = None  # 最後に alerting / normal が切り替わった時刻
+        self.values = None      # 最後に判定した測定値
+
+
+class AlertEngine:
+    """センサーごとの状態遷移でアラートの発生と解除を判定する
+
+    enter(values) は危険なら True、exit(values) は解除してよければ True を返す関数です。
+    exit は enter より緩い条件にしてください (しきい値から少し離れるまで解除しない)。
+    """
+
+    def __init__(self, enter, exit, hold_on=0, hold_off=0):
+        self.enter = enter
+        self.exit = exit
+        self.hold_on = hold_on    # 危険な状態がこの秒数続いたら発生
+        self.hold_off = hold_off  # 解除の条件がこの秒数続いたら解除
+        self.states = {}
+
+    def update(self, sensor_id, timestamp, values):
+        """測定値を1件判定し、発生・解除したときだけ AlertEvent を返す"""
+        st = self.states.get(sensor_id)
+        if st is None:
+            st = self.states[sensor_id] = SensorAlertState()
+        st.values = values
+
+        if st.state in (NORMAL, PENDING):
+            if not self.enter(values):
+                st.state = NORMAL
+                return None
+            if st.state == NORMAL:
+                st.state = PENDING
+                st.since = timestamp
+            if timestamp - st.since < self.hold_on:
+                return None
+            st.state = ALERTING
+            st.changed_at = timestamp
+            return AlertEvent(sensor_id, TRIGGERED, timestamp, values)
+
+        if not self.exit(values):
+            st.state = ALERTING
+            return None
+        if st.state == ALERTING:
+            st.state = CLEARING
+            st.since = timestamp
+        if timestamp - st.since < self.hold_off:
+            return None
+        st.state = NORMAL
+        st.changed_at = timestamp
+        return AlertEvent(sensor_id, CLEARED, timestamp, values)
+
+    def state(self, sensor_id):
+        st = self.states.get(sensor_id)
+        return st.state if st is not None else NORMAL
+
+    def alerting(self):
+        """アラート中 (解除待ちを含む) のセンサーID"""
+        return [sensor_id for sensor_id, st in self.states.items() if st.state in (ALERTING, CLEARING)]
+
+
+class AlertDigest:
+    """イベントを溜めて、window 秒に最大1回にまとめて取り出す"""
+
+    def __init__(self, window):
+        self.window = window
+        self.pending = []
+        self.last_sent = None
+
+    def add(self, event):
+        self.pending.append(event)
+
+    def due(self, now):
+        """溜まっているイベントを今送ってよいか"""
+        return bool(self.pending) and (self.last_sent is None or now - self.last_sent >= self.window)
+
+    def flush(self, now, force=False):
+        """送ってよければ溜まっているイベントを返す (送れなければ空のリスト)"""
+        if not self.pending or not (force or self.due(now)):
+            return []
+        events, self.pending = self.pending, []
+        self.last_sent = now
+        return events
+
+
+def summarize(events):
+    """イベントをセンサーごとにまとめる (通知の本文用, JSONにできる dict のリスト)
+
+    triggers: 発生した回数, first_at / last_at: 最初と最後の時刻, values: 最後の測定値
+    """
+    by_sensor = {}
+    for event in events:
+        entry = by_sensor.get(event.sensor_id)
+        if entry is None:
+            entry = by_sensor[event.sensor_id] = {'sensor_id': event.sensor_id, 'triggers': 0,
+                                                  'first_at': event.timestamp}
+        entry['triggers'] += 1
+        entry['last_at'] = event.timestamp
+        entry['values'] = dict(event.values)
+    return list(by_sensor.values())
+
+
+def measure_values(temp, pres, humi):
+    """ルールで使える値 (温湿度・気圧と、前計算した表から求めた WBGT・熱指数・危険度)"""
+    wbgt, heat_index, risk = assess(temp, humi)
+    return {'temperature': temp, 'pressure': pres, 'humidity': humi, 'wbgt': wbgt,
+            'heat_index': heat_index, 'risk': risk.name if risk is not None else None}
+
+
+def numeric_fields():
+    """ルールで使える項目 (measure_values() の値のうち数値のもの)"""
+    sample = measure_values(25.0, 1013.25, 50.0)
+    return {name for name, value in sample.items() if isinstance(value, (int, float))}
+
+
+def rules_matched(values):
+    """ルールの条件を満たしているか (values['rules']: RuleEngine の条件を満たしたルール名のリスト)"""
+    return bool(values['rules'])
+
+
+def rules_cleared(values):
+    """すべてのルールの解除の条件を満たしたか (values['cleared']: RuleEngine の判定)"""
+    return values['cleared']
+
+
+def format_time(timestamp, fmt='%Y-%m-%d %H:%M:%S'):
+    """UNIX秒を表示用の時刻の文字列にする"""
+    return datetime.fromtimestamp(timestamp).strftime(fmt)
+
+
+def make_alert(events):
+    """通知する内容 (送信待ちファイルに保存するので、JSONにできる値だけにする)
+
+    まとめて送る検知イベントを、センサーごとに1件にまとめて入れます。
+    """
+    sensors = []
+    for entry in summarize(events):
+        sensors.append({
+            'sensor_id': entry['sensor_id'],
+            'triggers': entry['triggers'],
+            'first_at': format_time(entry['first_at']),
+            'last_at': format_time(entry['last_at']),
+            'temperature': entry['values']['temperature'],
+            'humidity': entry['values']['humidity'],
+            'wbgt': entry['values']['wbgt'],
+            'risk': entry['values']['risk'],
+            'rules': entry['values']['rules'],
+        })
+    return {'detected_at': sensors[0]['first_at'], 'sensors': sensors}
+
+
+def alert_sensors(alert):
+    """通知に含まれるセンサーごとの内容 (以前の形式の1件だけの通知にも対応する)"""
+    if 'sensors' in alert:
+        return alert['sensors']
+    return [{'sensor_id': None, 'triggers': 1, 'first_at': alert['detected_at'],
+             'last_at': alert['detected_at'], 'temperature': alert['temperature'],
+             'humidity': alert['humidity']}]
+
+
+def format_alert_details(alert, temp_unit=' ℃', humi_unit=' %'):
+    """通知の本文のうち、センサーごとの検知時刻と温湿度の部分"""
+    blocks = []
+    for sensor in alert_sensors(alert):
+        lines = []
+        if sensor['sensor_id'] is not None:
+            lines.append(f"センサー: {sensor['sensor_id']}")
+        if sensor.get('rules'):
+            lines.append(f"条件: {', '.join(sensor['rules'])}")
+        if sensor['triggers'] > 1:
+            lines.append(f"検知時刻: {sensor['first_at']} (最後: {sensor['last_at']}, {sensor['triggers']} 回検知)")
+        else:
+            lines.append(f"検知時刻: {sensor['first_at']}")
+        lines.append(f"現在の温度: {sensor['temperature']:.2f}{temp_unit}")
+        lines.append(f"現在の湿度: {sensor['humidity']:.2f}{humi_unit}")
+        if 'wbgt' in sensor:
+            lines.append(f"暑さ指数 (WBGT): {sensor['wbgt']:.1f} ({sensor['risk']})")
+        blocks.append('\n'.join(lines))
+    return '\n\n'.join(blocks)
@@ -1,249 +1,176 @@
 # app.py - 完璧版
-from flask import Flask, render_template, jsonify
+from flask import Flask, Response, render_template, jsonify, make_response, request
 import time
 from datetime import datetime
-import collections
 import threading
 import logging
 import json
+import argparse
+import atexit
+import gzip
+import zlib
+from collections import namedtuple
+
+from acquisition_daemon import Subscriber, add_subscriber_arguments
+from bme280_profiles import add_profile_arguments, describe, max_sample_rate, profile_from_args
+from broadcaster import Broadcaster
+from downsample import METHODS as DOWNSAMPLE_METHODS
+from heat_stress import assess, default_table
+from ring_buffer import SampleRingBuffer
+from rollup import RollupStore
+from scheduler import PeriodicScheduler
+from sensor_manager import SENSOR_ADDRESSES, SensorManager, sensor_path
 
 # ログ設定
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
-# BME280センサー用のクラス
-class BME280Sensor:
-    def __init__(self):
-        self.bus = None
-        self.initialized = False
-        self.digT = []
-        self.digP = []
-        self.digH = []
-        self.t_fine = 0.0
-        self.I2C_BUS = 1
-        self.I2C_ADDR = 0x76
-        self.last_error = None
-        
-    def init_bus(self):
-        """I2Cバスを安全に初期化"""
-        if self.bus is not None:
-            return True
-            
-        try:
-            from smbus2 import SMBus
-            self.bus = SMBus(self.I2C_BUS)
-            return True
-        except ImportError:
-            logger.warning("smbus2がインストールされていません。模擬モードで動作します。")
-            return False
-        except Exception as e:
-            logger.error(f"I2Cバス初期化失敗: {e}")
-            self.last_error = str(e)
-            return False
-    
-    def write_reg(self, reg, data):
-        """レジスタに書き込み"""
-        if not self.init_bus():
-            return False
-        try:
-            self.bus.write_byte_data(self.I2C_ADDR, reg, data)
-            return True
-        except Exception as e:
-            logger.error(f"書き込み失敗 reg={hex(reg)}: {e}")
-            return False
-    
-    def read_byte(self, reg, signed=False):
-        """1バイト読み込み"""
-        if not self.init_bus():
-            return None
+# センサーを探すI2Cバスの番号 (アドレスは sensor_manager.SENSOR_ADDRESSES)
+SENSOR_BUSES = (1,)
+# センサーが見つからないときのデモ用のセンサーID
+DEMO_SENSOR_ID = 'demo'
+# 集計値 (1分・1時間・1日) の保存先 (センサーが複数ならセンサーごとにサブディレクトリを作る)
+# data_logger.py の集計値 (bme280_rollups) とは分ける (同時に動かすと同じ区間を二重に追記するため)
+ROLLUP_DIR = 'bme280_app_rollups'
+# 履歴の保持件数 (5秒間隔で3日分, 約1.6MB)
+HISTORY_CAPACITY = 3 * 24 * 60 * 60 // 5
+# /api/history で期間を指定しなかったときに返す件数
+HISTORY_DEFAULT_COUNT = 50
+# /api/history の1ページの既定件数と上限 (points 指定時の上限も兼ねる)
+HISTORY_PAGE_SIZE = 1000
+HISTORY_MAX_LIMIT = 5000
+# データ収集の間隔 (秒) と、予定時刻に間に合わなかったときの動作 (scheduler.py 参照)
+COLLECT_INTERVAL = 5
+COLLECT_POLICY = 'skip'
+# /data (index.html / index2.html) の既定の表示期間 (秒) と最大件数
+DATA_DEFAULT_WINDOW = 3600
+DATA_DEFAULT_POINTS = 720
+
+# この大きさ (バイト) 以上のJSONはgzip圧縮版も用意する
+GZIP_MIN_SIZE = 512
+
+# ETag の接頭辞 (再起動で版番号が戻っても古いETagと一致しないようにする)
+ETAG_PREFIX = format(int(time.time()), 'x')
+
+# サンプルごとに1回だけエンコードしたJSON (ETag と gzip 圧縮版付き)
+EncodedJSON = namedtuple('EncodedJSON', ['etag', 'body', 'body_gzip'])
+
+def encode_json(tag, data):
+    """データをJSONにエンコードし、ETag と (大きければ) gzip 圧縮版を付ける"""
+    body = json.dumps(data, separators=(',', ':')).encode('utf-8')
+    body_gzip = gzip.compress(body, compresslevel=6) if len(body) >= GZIP_MIN_SIZE else None
+    return EncodedJSON(f'"{ETAG_PREFIX}-{tag}"', body, body_gzip)
+
+# 収集スレッドが公開する最新状態 (作成後は変更しない)
+# version : サンプルを受け取るたびに増える版番号 (ETag に使用)
+# latest  : 最新データ (dict)
+# latest_encoded / history_encoded : /api/latest とパラメータなしの /api/history のエンコード済みJSON
+Snapshot = namedtuple('Snapshot', ['version', 'latest', 'latest_encoded', 'history_encoded'])
+
+class SensorState:
+    """1台のセンサーの履歴・集計値・公開中のスナップショット"""
+
+    def __init__(self, sensor_id, capacity=HISTORY_CAPACITY):
+        self.sensor_id = sensor_id
+        self.history = SampleRingBuffer(capacity)  # 時刻と測定値を連続した配列に保持 (ロックなしで読める)
+        self.snapshot = Snapshot(0, None, None, None)  # 収集スレッドだけが丸ごと差し替える (参照の代入はアトミック)
+        self.rollups = None  # 集計値ストア (create_app で生成)
+        self.rollup_lock = threading.Lock()  # 集計値ストアの更新と検索だけを直列化する
+        self.broadcaster = Broadcaster()  # /api/stream への配信 (直近720件 = 約1時間分を再送用に保持)
+
+# グローバル変数
+sensor_profile = None  # 計測プロファイル (None なら環境変数 BME280_PROFILE, 既定 'weather')
+sensor_buses = SENSOR_BUSES
+manager = None  # 全センサーの検出と読み出し (create_app で生成, 測定デーモンを使うときは None)
+daemon_socket = None  # 測定デーモンのソケット (--daemon 指定時。センサーを直接読まずに購読する)
+sensor_states = {}  # センサーID → SensorState (登録時は辞書ごと差し替えるので、読む側はロック不要)
+primary_sensor_id = None  # ?sensor= を省略したときのセンサー (最初に登録したもの)
+collector_scheduler = PeriodicScheduler(COLLECT_INTERVAL, COLLECT_POLICY)  # ジッター統計は /api/status で確認
+app_running = True
+
+def add_sensor_state(sensor_id, open_rollups=False, separate=False):
+    """センサーの状態を登録する (最初に登録したセンサーが既定になる)
+
+    open_rollups=True ならセンサーごとの集計値ストアも開きます
+    (前回までの集計値を読み込み、終了時に集計中の区間を保存)。
+    保存先は separate (センサーが複数) なら ROLLUP_DIR/<センサーID>、そうでなければ ROLLUP_DIR です
+    (data_logger.py と同じ)。
+    """
+    global sensor_states, primary_sensor_id
+    state = SensorState(sensor_id)
+    if open_rollups:
         try:
-            value = self.bus.read_byte_data(self.I2C_ADDR, reg)
-            if signed and value > 127:
-                value -= 256
-            return value
-        except Exception as e:
-            logger.error(f"読み込み失敗 reg={hex(reg)}: {e}")
-            return None
-    
-    def read_word(self, reg, signed=False):
-        """2バイト読み込み"""
-        lsb = self.read_byte(reg)
-        msb = self.read_byte(reg + 1)
-        if lsb is None or msb is None:
-            return None
-        
-        value = (msb << 8) | lsb
-        if signed and value & 0x8000:
-            value -= 65536
-        return value
-    
-    def setup_sensor(self):
-        """センサー設定"""
-        # 湿度オーバーサンプリング x1
-        if not self.write_reg(0xF2, 0x01): return False
-        # 温度・気圧オーバーサンプリング x1, ノーマルモード
-        if not self.write_reg(0xF4, 0x27): return False
-        # スタンバイ 1000ms, フィルタOFF
-        if not self.write_reg(0xF5, 0xA0): return False
-        return True
+            state.rollups = RollupStore(sensor_path(ROLLUP_DIR, sensor_id) if separate else ROLLUP_DIR)
+        except OSError as e:
+            logger.error(f"集計値ストアを開けませんでした ({sensor_id}): {e}")
+    sensor_states = {**sensor_states, sensor_id: state}
+    if primary_sensor_id is None:
+        primary_sensor_id = sensor_id
+    return state
+
+def heat_fields(temp, hum):
+    """WBGT (屋内の推定値)・熱指数・危険度 (heat_stress.py の前計算した表を補間する)"""
+    wbgt, hi, risk = assess(temp, hum)
+    if risk is None:
+        # 欠測 (NaN) の値はJSONにできないので、値なしで返す
+        return {'wbgt': None, 'heat_index': None, 'risk_level': None, 'risk': None}
+    return {'wbgt': round(wbgt, 1), 'heat_index': round(hi, 1), 'risk_level': risk.level, 'risk': risk.name}
+
+def publish_sample(state, now, temp, pres, hum):
+    """1サンプルを履歴・集計値に追加し、新しいスナップショットを公開する (収集スレッドから呼ぶ)"""
+    data = {
+        'sensor_id': state.sensor_id,
+        'timestamp': datetime.fromtimestamp(now).strftime('%Y-%m-%d %H:%M:%S'),
+        'temperature': round(temp, 1),
+        'pressure': round(pres, 1),
+        'humidity': round(hum, 1),
+        **heat_fields(temp, hum)
+    }
     
-    def read_calibration(self):
-        """校正パラメータ読み込み"""
-        # 温度校正
-        self.digT = [
-            self.read_word(0x88),           # T1
-            self.read_word(0x8A, True),     # T2
-            self.read_word(0x8C, True)      # T3
-        ]
-        if None in self.digT: return False
-        
-        # 気圧校正
-        self.digP = [self.read_word(0x8E)]  # P1
-        for i in range(1, 9):
-            val = self.read_word(0x90 + (i-1)*2, True)
-            if val is None: return False
-            self.digP.append(val)
-        
-        # 湿度校正
-        self.digH = []
-        self.digH.append(self.read_byte(0xA1)) # H1
-        calib_data = self.bus.read_i2c_block_data(self.I2C_ADDR, 0xE1, 7)
-        self.digH.append((calib_data[1] << 8) | calib_data[0]) # H2
-        self.digH.append(calib_data[2]) # H3
-        self.digH.append((calib_data[3] << 4) | (calib_data[4] & 0x0F)) # H4
-        self.digH.append((calib_data[5] << 4) | (calib_data[4] >> 4)) # H5
-        self.digH.append(calib_data[6]) # H6
-        if None in self.digH: return False
-        
-        return True
+    state.history.append(now, temp, pres, hum)
+    if state.rollups is not None:
+        with state.rollup_lock:
+            state.rollups.add(now, (temp, pres, hum))
     
-    def read_raw_data(self):
-        """生データ読み込み"""
-        if not self.init_bus():
-            return None, None, None
-        try:
-            # 8バイト一括読み込み
-            data = self.bus.read_i2c_block_data(self.I2C_ADDR, 0xF7, 8)
-            pres_raw = (data[0] << 12) | (data[1] << 4) | (data[2] >> 4)
-            temp_raw = (data[3] << 12) | (data[4] << 4) | (data[5] >> 4)
-            hum_raw = (data[6] << 8) | data[7]
-            return temp_raw, pres_raw, hum_raw
-        except Exception as e:
-            logger.error(f"生データ読み込み失敗: {e}")
-            return None, None, None
-
-    def compensate_temp(self, raw_temp):
-        """温度補正 (t_fine計算を含む)"""
-        var1 = (raw_temp / 16384.0 - self.digT[0] / 1024.0) * self.digT[1]
-        var2 = ((raw_temp / 131072.0 - self.digT[0] / 8192.0) *
-                (raw_temp / 131072.0 - self.digT[0] / 8192.0)) * self.digT[2]
-        self.t_fine = var1 + var2
-        temperature = self.t_fine / 5120.0
-        return temperature
-
-    def compensate_pressure(self, raw_pres):
-        """気圧補正（データシート準拠版）"""
-        if not self.digP or raw_pres is None or self.t_fine == 0: return None
-        var1 = (self.t_fine / 2.0) - 64000.0
-        var2 = var1 * var1 * self.digP[5] / 32768.0
-        var2 = var2 + var1 * self.digP[4] * 2.0
-        var2 = (var2 / 4.0) + (self.digP[3] * 65536.0)
-        var1 = (self.digP[2] * var1 * var1 / 524288.0 + self.digP[1] * var1) / 524288.0
-        var1 = (1.0 + var1 / 32768.0) * self.digP[0]
-        if var1 == 0:
-            return 0
-        p = 1048576.0 - raw_pres
-        p = (p - (var2 / 4096.0)) * 6250.0 / var1
-        var1 = self.digP[8] * p * p / 2147483648.0
-        var2 = p * self.digP[7] / 32768.0
-        p = p + (var1 + var2 + self.digP[6]) / 16.0
-        return p / 100.0 # hPaに変換
-
-    def compensate_humidity(self, raw_hum):
-        """湿度補正（データシート準拠版）"""
-        if not self.digH or raw_hum is None or self.t_fine == 0: return None
-        v_x1_u32r = self.t_fine - 76800.0
-        v_x1_u32r = (raw_hum - (self.digH[3] * 64.0 + self.digH[4] / 16384.0 * v_x1_u32r)) * \
-                    (self.digH[1] / 65536.0 * (1.0 + self.digH[5] / 67108864.0 * v_x1_u32r * \
-                    (1.0 + self.digH[2] / 67108864.0 * v_x1_u32r)))
-        humidity = v_x1_u32r * (1.0 - self.digH[0] * v_x1_u32r / 524288.0)
-        return max(0.0, min(100.0, humidity))
+    # よく呼ばれるレスポンスはここで1回だけエンコードし、
+    # 新しいスナップショットとして公開する (リクエスト処理側は参照を読むだけ)
+    version = state.snapshot.version + 1
+    tag = f"{state.sensor_id}-{version}"
+    history = [format_sample(sample, state.sensor_id)
+               for sample in state.history.last(HISTORY_DEFAULT_COUNT)]
+    state.snapshot = Snapshot(version, data, encode_json(tag, data), encode_json(tag, history))
     
-    def initialize(self):
-        """センサー初期化"""
-        try:
-            if not self.init_bus():
-                return False
-            
-            if not self.setup_sensor():
-                logger.error("センサー設定失敗")
-                return False
-            
-            if not self.read_calibration():
-                logger.error("校正パラメータ読み込み失敗")
-                return False
-            
-            self.initialized = True
-            logger.info("BME280センサー初期化完了")
-            return True
-            
-        except Exception as e:
-            logger.error(f"センサー初期化エラー: {e}")
-            self.last_error = str(e)
-            return False
-    
-    def read_data(self):
-        """センサーデータ読み込み"""
-        if not self.initialized:
-            return None, None, None
-        
-        temp_raw, pres_raw, hum_raw = self.read_raw_data()
-        if temp_raw is None or pres_raw is None or hum_raw is None:
-            return None, None, None
-        
-        temperature = self.compensate_temp(temp_raw)
-        pressure = self.compensate_pressure(pres_raw)
-        humidity = self.compensate_humidity(hum_raw)
-        
-        return temperature, pressure, humidity
-
-# グローバル変数
-sensor = BME280Sensor()
-data_history = collections.deque(maxlen=50)  # 最大50個のデータ
-latest_data = None
-data_lock = threading.Lock()
-app_running = True
+    # 接続中のクライアントへ配信 (JSON化は1回だけ)
+    state.broadcaster.publish(data)
 
 def data_collector():
     """バックグラウンドデータ収集"""
-    global latest_data
-    logger.info("データ収集開始")
+    logger.info(f"データ収集開始 ({len(manager.sensors)} 台)")
     
-    while app_running:
+    # 前回の読み取り時間に関係なく、開始時刻から5秒刻みの予定時刻に全センサーを測定する
+    for tick in collector_scheduler.ticks(is_running=lambda: app_running):
         try:
-            temp, pres, hum = sensor.read_data()
-            
-            if temp is not None and pres is not None and hum is not None:
-                data = {
-                    'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                    'temperature': round(temp, 1),
-                    'pressure': round(pres, 1),
-                    'humidity': round(hum, 1)
-                }
-                
-                with data_lock:
-                    data_history.append(data)
-                    latest_data = data
-                
-                logger.debug(f"データ更新: {temp:.1f}°C, {pres:.1f}hPa, {hum:.1f}%")
-            else:
-                if sensor.initialized: # 初期化成功後に読み取れなくなった場合
-                    logger.warning("センサーデータ読み込み失敗")
-            
+            for reading in manager.read_all():
+                publish_sample(sensor_states[reading.sensor_id], reading.timestamp,
+                               reading.temperature, reading.pressure, reading.humidity)
+                logger.debug(f"データ更新 [{reading.sensor_id}]: {reading.temperature:.1f}°C, "
+                             f"{reading.pressure:.1f}hPa, {reading.humidity:.1f}%")
+        except Exception as e:
+            logger.error(f"データ収集エラー: {e}")
+
+def daemon_subscriber():
+    """測定デーモンから受け取った測定値を公開する (新しいセンサーはその場で登録)"""
+    logger.info(f"測定デーモンの購読開始 ({daemon_socket})")
+    subscriber = Subscriber(daemon_socket)
+    for reading in subscriber.readings(is_running=lambda: app_running):
+        try:
+            state = sensor_states.get(reading.sensor_id)
+            if state is None:
+                separate = len(subscriber.hello.get('sensors', [])) > 1 if subscriber.hello else True
+                state = add_sensor_state(reading.sensor_id, open_rollups=True, separate=separate)
+            publish_sample(state, reading.timestamp, reading.temperature, reading.pressure, reading.humidity)
         except Exception as e:
             logger.error(f"データ収集エラー: {e}")
-        
-        time.sleep(5)  # 5秒間隔
 
 # Flaskアプリ
 app = Flask(__name__)
@@ -314,6 +241,33 @@ def index():
         <script>
             let autoUpdate = true;
             let updateInterval;
+            let eventSource = null;
+            
+            function showData(data) {
+                const statusEl = document.getElementById('status');
+                
+                document.getElementById('temp').textContent = data.temperature !== undefined ? data.temperature : '--';
+                document.getElementById('press').textContent = data.pressure !== undefined ? data.pressure : '--';
+                document.getElementById('hum').textContent = data.humidity !== undefined ? data.humidity : '--';
+                document.getElementById('last-update').textContent = '最終更新: ' + (data.timestamp || '不明');
+
+                if (data.demo) {
+                    statusEl.textContent = 'デモモードで動作中';
+                    statusEl.className = 'status demo';
+                } else if (data.error) {
+                    statusEl.textContent = 'エラー: ' + data.error;
+                    statusEl.className = 'status offline';
+                } else {
+                    statusEl.textContent = 'オンライン';
+                    statusEl.className = 'status online';
+                }
+            }
+            
+            function showConnectionError() {
+                const statusEl = document.getElementById('status');
+                statusEl.textContent = 'サーバー接続エラー';
+                statusEl.className = 'status offline';
+            }
             
             function updateData() {
                 fetch('/api/latest')
@@ -323,106 +277,413 @@ def index():
                         }
                         return response.json();
                     })
-                    .then(data => {
-                        const statusEl = document.getElementById('status');
-                        
-                        document.getElementById('temp').textContent = data.temperature !== undefined ? data.temperature : '--';
-                        document.getElementById('press').textContent = data.pressure !== undefined ? data.pressure : '--';
-                        document.getElementById('hum').textContent = data.humidity !== undefined ? data.humidity : '--';
-                        document.getElementById('last-update').textContent = '最終更新: ' + (data.timestamp || '不明');
-
-                        if (data.demo) {
-                            statusEl.textContent = 'デモモードで動作中';
-                            statusEl.className = 'status demo';
-                        } else if (data.error) {
-                            statusEl.textContent = 'エラー: ' + data.error;
-                            statusEl.className = 'status offline';
-                        } else {
-                            statusEl.textContent = 'オンライン';
-                            statusEl.className = 'status online';
-                        }
-                    })
+                    .then(showData)
                     .catch(error => {
                         console.error('エラー:', error);
-                        const statusEl = document.getElementById('status');
-                        statusEl.textContent = 'サーバー接続エラー';
-                        statusEl.className = 'status offline';
+                        showConnectionError();
                     });
             }
             
+            function startAutoUpdate() {
+                // サーバーからのプッシュ (SSE) を使い、非対応のブラウザではポーリングする
+                if (window.EventSource) {
+                    if (!eventSource) {
+                        eventSource = new EventSource('/api/stream');
+                        eventSource.addEventListener('sample', event => showData(JSON.parse(event.data)));
+                        // 切断されてもブラウザが自動で再接続し、Last-Event-ID 以降の分を受け取る
+                        eventSource.onerror = showConnectionError;
+                    }
+                } else if (!updateInterval) {
+                    updateInterval = setInterval(updateData, 5000);
+                }
+            }
+            
+            function stopAutoUpdate() {
+                if (eventSource) {
+                    eventSource.close();
+                    eventSource = null;
+                }
+                clearInterval(updateInterval);
+                updateInterval = null;
+            }
+            
             function toggleAutoUpdate() {
                 autoUpdate = !autoUpdate;
                 document.getElementById('auto-status').textContent = autoUpdate ? 'ON' : 'OFF';
                 
                 if (autoUpdate) {
-                    if (!updateInterval) {
-                        updateInterval = setInterval(updateData, 5000);
-                    }
+                    startAutoUpdate();
                 } else {
-                    clearInterval(updateInterval);
-                    updateInterval = null;
+                    stopAutoUpdate();
                 }
             }
             
             // 初期化
             document.addEventListener('DOMContentLoaded', () => {
                 updateData();
-                updateInterval = setInterval(updateData, 5000);
+                startAutoUpdate();
             });
         </script>
     </body>
     </html>
     '''
 
+def encoded_json_response(encoded):
+    """エンコード済みJSONを返す (If-None-Match が一致すれば304, 対応していればgzip)"""
+    if encoded.etag in request.headers.get('If-None-Match', ''):
+        response = Response(status=304)
+    elif encoded.body_gzip is not None and 'gzip' in request.headers.get('Accept-Encoding', ''):
+        response = Response(encoded.body_gzip, mimetype='application/json')
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = Response(encoded.body, mimetype='application/json')
+    response.headers['ETag'] = encoded.etag
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
+def requested_state():
+    """?sensor= で指定したセンサー (省略時は既定のセンサー) の状態。登録されていなければ None"""
+    return sensor_states.get(request.args.get('sensor') or primary_sensor_id)
+
+def unknown_sensor_response():
+    sensor_id = request.args.get('sensor') or primary_sensor_id
+    if sensor_id is None:
+        return jsonify({'error': 'センサーのデータはまだありません', 'sensors': []}), 404
+    return jsonify({'error': f"センサー '{sensor_id}' はありません",
+                    'sensors': list(sensor_states)}), 404
+
+@app.route('/api/sensors')
+def api_sensors():
+    """センサー一覧API (各センサーのIDと最新データ)"""
+    sensors = {s['sensor_id']: s for s in manager.status()} if manager is not None else {}
+    return jsonify([{
+        'sensor_id': sensor_id,
+        'primary': sensor_id == primary_sensor_id,
+        'demo': sensor_id == DEMO_SENSOR_ID,
+        'data_count': len(state.history),
+        'latest': state.snapshot.latest,
+        'status': sensors.get(sensor_id)
+    } for sensor_id, state in sensor_states.items()])
+
 @app.route('/api/latest')
 def api_latest():
-    """最新データAPI"""
-    with data_lock:
-        if latest_data:
-            return jsonify(latest_data)
-        else:
-            # センサーが初期化されていない場合、デモデータを返す
-            return jsonify({
-                'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
-                'temperature': 25.0,
-                'pressure': 1013.2,
-                'humidity': 55.0,
-                'demo': True
-            })
+    """最新データAPI (sensor: センサーID, 省略時は最初のセンサー)"""
+    state = requested_state()
+    if state is None:
+        return unknown_sensor_response()
+    current = state.snapshot
+    if current.latest_encoded is not None:
+        return encoded_json_response(current.latest_encoded)
+    # センサーが初期化されていない場合、デモデータを返す
+    return jsonify({
+        'sensor_id': state.sensor_id,
+        'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'temperature': 25.0,
+        'pressure': 1013.2,
+        'humidity': 55.0,
+        **heat_fields(25.0, 55.0),
+        'demo': True
+    })
+
+@app.route('/api/stream')
+def api_stream():
+    """最新データのプッシュ配信 (Server-Sent Events)
+
+    新しいサンプルが届くたびに 'sample' イベントを送ります (sensor: センサーID)。
+    再接続時は Last-Event-ID ヘッダー (または lastEventId パラメータ) 以降のイベントを先に送ります。
+    """
+    state = requested_state()
+    if state is None:
+        return unknown_sensor_response()
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('lastEventId')
+    try:
+        last_event_id = int(last_event_id) if last_event_id else None
+    except ValueError:
+        last_event_id = None
+
+    stream = state.broadcaster.stream(last_event_id, is_running=lambda: app_running)
+    return Response(stream, mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/api/history')
 def api_history():
-    """履歴データAPI"""
-    with data_lock:
-        return jsonify(list(data_history))
+    """履歴データAPI
+
+    sensor  : センサーID (省略時は最初のセンサー)
+    from/to : 期間 (UNIX秒 または ISO形式)
+    limit   : 最大件数 (期間指定時の既定は HISTORY_PAGE_SIZE, 上限 HISTORY_MAX_LIMIT)
+    cursor  : 前のレスポンスの X-Next-Cursor ヘッダーの値。続きのページを返す
+    points  : 期間内を約 points 件に間引いて返す (method=lttb / minmax / mean, channel=temperature など)
+              method=mean は集計値 (1分・1時間・1日) の平均を返す
+    パラメータを省略した場合は直近 HISTORY_DEFAULT_COUNT 件を返します。
+    """
+    args = request.args
+    state = requested_state()
+    if state is None:
+        return unknown_sensor_response()
+    try:
+        start = parse_time_param(args.get('from'))
+        end = parse_time_param(args.get('to'))
+        cursor = parse_time_param(args.get('cursor'))
+        limit = int(args['limit']) if args.get('limit') else None
+        points = int(args['points']) if args.get('points') else None
+    except ValueError as e:
+        return jsonify({'error': f'パラメータが不正です: {e}'}), 400
+    if (limit is not None and limit <= 0) or (points is not None and points <= 0):
+        return jsonify({'error': 'limit / points は1以上にしてください'}), 400
+
+    # 前回と同じ版・同じパラメータなら結果は変わらないので304を返す
+    current = state.snapshot
+    version = current.version
+    if set(args) <= {'sensor'} and current.history_encoded is not None:
+        return encoded_json_response(current.history_encoded)
+    etag = f'"{ETAG_PREFIX}-{state.sensor_id}-{version}-{zlib.crc32(request.query_string):08x}"'
+    if version and etag in request.headers.get('If-None-Match', ''):
+        return Response(status=304, headers={'ETag': etag, 'Cache-Control': 'no-cache'})
+
+    if points is not None:
+        response = make_response(history_downsampled(state, start, end, min(points, HISTORY_MAX_LIMIT),
+                                                     args.get('method', 'lttb'), args.get('channel', 'temperature')))
+        if version and response.status_code == 200:
+            response.headers['ETag'] = etag
+        return response
+
+    limit = min(limit or (HISTORY_DEFAULT_COUNT if start is None and end is None and cursor is None
+                          else HISTORY_PAGE_SIZE), HISTORY_MAX_LIMIT)
+    def read_page(view):
+        lo, hi = view.range_indices(start, end)
+        if cursor is not None:
+            lo = max(lo, view.bisect_right(cursor))
+        samples = view.slice(lo, min(hi, lo + limit))
+        next_cursor = repr(samples[-1][0]) if lo + limit < hi else None
+        return samples, next_cursor
+
+    if start is None and end is None and cursor is None:
+        samples, next_cursor = state.history.last(limit), None
+    else:
+        samples, next_cursor = state.history.read(read_page)
+
+    response = jsonify([format_sample(sample, state.sensor_id) for sample in samples])
+    if next_cursor is not None:
+        response.headers['X-Next-Cursor'] = next_cursor
+    if version:
+        response.headers['ETag'] = etag
+    return response
+
+def history_downsampled(state, start, end, points, method, channel):
+    """期間内の履歴を約 points 件に間引いて返す"""
+    if method == 'mean':
+        if state.rollups is None:
+            return jsonify({'error': '集計値はまだ利用できません'}), 503
+        end = end or time.time()
+        start = start if start is not None else end - 86400
+        with state.rollup_lock:
+            tier = state.rollups.choose_tier(start, end, points)
+            buckets = [b.to_dict() for b in tier.query(start, end)]
+        return jsonify([format_sample((b['start'], b['temperature']['mean'],
+                                       b['pressure']['mean'], b['humidity']['mean']), state.sensor_id)
+                        for b in buckets if b['count']])
+
+    func = DOWNSAMPLE_METHODS.get(method)
+    if func is None:
+        return jsonify({'error': f"method は {list(DOWNSAMPLE_METHODS) + ['mean']} のいずれかです"}), 400
+    if channel not in ('temperature', 'pressure', 'humidity'):
+        return jsonify({'error': 'channel は temperature / pressure / humidity のいずれかです'}), 400
+
+    samples = state.history.window(start, end)
+    return jsonify([format_sample(sample, state.sensor_id) for sample in func(samples, points, channel)])
+
+def format_sample(sample, sensor_id):
+    """(時刻, 温度, 気圧, 湿度) をAPIの形式に変換する"""
+    ts, temp, pres, hum = sample
+    return {
+        'sensor_id': sensor_id,
+        'timestamp': datetime.fromtimestamp(ts).strftime('%Y-%m-%d %H:%M:%S'),
+        'temperature': round(temp, 1),
+        'pressure': round(pres, 1),
+        'humidity': round(hum, 1),
+        **heat_fields(temp, hum)
+    }
+
+def parse_time_param(value):
+    """クエリパラメータの時刻 (UNIX秒 または ISO形式) をUNIX秒に変換する"""
+    if value is None or value == '':
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return datetime.fromisoformat(value).timestamp()
+
+def format_dashboard_sample(sample, sensor_id):
+    """(時刻, 温度, 気圧, 湿度) を index.html / index2.html の形式に変換する"""
+    ts, temp, pres, hum = sample
+    return {
+        'sensor_id': sensor_id,
+        'timestamp': datetime.fromtimestamp(ts).isoformat(timespec='microseconds'),
+        'temperature': round(temp, 2),
+        'pressure': round(pres, 2),
+        'humidity': round(hum, 2)
+    }
+
+@app.route('/dashboard')
+def dashboard():
+    """グラフ付きのページ (templates/index.html)"""
+    return render_template('index.html')
+
+@app.route('/dashboard2')
+def dashboard2():
+    """グラフ付きのページ (templates/index2.html)"""
+    return render_template('index2.html')
+
+@app.route('/data')
+def data_api():
+    """index.html / index2.html 用のデータAPI
+
+    sensor     : センサーID (省略時は最初のセンサー)
+    window     : 直近何秒分を返すか (既定 DATA_DEFAULT_WINDOW)
+    max_points : 最大件数。超える場合はLTTB (温度基準) で間引く (既定 DATA_DEFAULT_POINTS)
+    since      : この時刻より新しいサンプルだけを返す (前回受け取った最後の timestamp)
+    ページは最初に表示期間の分を受け取り、以降は /api/stream で届いたサンプルを追加します
+    (SSE 非対応のブラウザでは since を付けて新しいサンプルだけを受け取ります)。
+    """
+    args = request.args
+    state = requested_state()
+    if state is None:
+        return unknown_sensor_response()
+    try:
+        window = float(args.get('window') or DATA_DEFAULT_WINDOW)
+        max_points = int(args.get('max_points') or DATA_DEFAULT_POINTS)
+        since = parse_time_param(args.get('since'))
+    except ValueError as e:
+        return jsonify({'error': f'パラメータが不正です: {e}'}), 400
+    if window <= 0 or max_points <= 0:
+        return jsonify({'error': 'window / max_points は正の値にしてください'}), 400
+
+    start = time.time() - window
+    if since is not None:
+        # timestamp はマイクロ秒に丸めて返しているので、1ミリ秒の余裕を見て同じサンプルを除く
+        start = max(start, since + 0.001)
+    samples = state.history.window(start)
+    if len(samples) > max_points:
+        samples = DOWNSAMPLE_METHODS['lttb'](samples, max_points)
+    return jsonify([format_dashboard_sample(sample, state.sensor_id) for sample in samples])
+
+@app.route('/api/rollup')
+def api_rollup():
+    """集計値API
+
+    sensor : センサーID (省略時は最初のセンサー)
+    tier   : '1m' / '1h' / '1d' (省略時は points に収まる最も細かい階層)
+    from/to: 期間 (UNIX秒 または ISO形式, 省略時は直近24時間)
+    points : tier 省略時の最大区間数 (既定 500)
+    """
+    state = requested_state()
+    if state is None:
+        return unknown_sensor_response()
+    if state.rollups is None:
+        return jsonify({'error': '集計値はまだ利用できません'}), 503
+    try:
+        end = parse_time_param(request.args.get('to')) or time.time()
+        start = parse_time_param(request.args.get('from')) or end - 86400
+        points = int(request.args.get('points', 500))
+    except ValueError as e:
+        return jsonify({'error': f'パラメータが不正です: {e}'}), 400
+
+    with state.rollup_lock:
+        tier_name = request.args.get('tier')
+        if tier_name is None:
+            tier_name = state.rollups.choose_tier(start, end, points).name
+        elif tier_name not in state.rollups.by_name:
+            return jsonify({'error': f'tier は {list(state.rollups.by_name)} のいずれかです'}), 400
+        buckets = [b.to_dict() for b in state.rollups.query(tier_name, start, end)]
+
+    for b in buckets:
+        b['timestamp'] = datetime.fromtimestamp(b['start']).strftime('%Y-%m-%d %H:%M:%S')
+    return jsonify({'sensor_id': state.sensor_id, 'tier': tier_name, 'buckets': buckets})
 
 @app.route('/api/status')
 def api_status():
     """ステータスAPI"""
-    with data_lock:
-        return jsonify({
-            'sensor_initialized': sensor.initialized,
-            'data_count': len(data_history),
-            'last_error': sensor.last_error,
-            'app_start_time': app.config.get('START_TIME')
-        })
+    if manager is not None:
+        sensors = manager.status()
+    else:
+        # 測定デーモンから受け取っている場合は受信したセンサーだけを返す
+        sensors = [{'sensor_id': sensor_id, 'last_error': None}
+                   for sensor_id in sensor_states if sensor_id != DEMO_SENSOR_ID]
+    for status in sensors:
+        status['data_count'] = len(sensor_states[status['sensor_id']].history)
+    return jsonify({
+        'sensor_initialized': bool(sensors),
+        'data_count': sum(len(state.history) for state in sensor_states.values()),
+        'last_error': next((status['last_error'] for status in sensors if status['last_error']), None),
+        'app_start_time': app.config.get('START_TIME'),
+        'source': 'daemon' if daemon_socket else 'sensor',
+        'scheduler': collector_scheduler.stats() if manager is not None else None,
+        'profile': None if manager is None else {
+            'name': manager.profile.name,
+            'settings': describe(manager.profile),
+            'max_sample_rate': round(max_sample_rate(manager.profile), 2)
+        },
+        'sensors': sensors
+    })
+
+def close_rollups():
+    """集計値ストアを閉じる (集計中の区間を保存)"""
+    for state in sensor_states.values():
+        with state.rollup_lock:
+            if state.rollups is not None:
+                state.rollups.close()
+
+def close_sensors():
+    if manager is not None:
+        manager.close()
 
 def create_app():
     """アプリ初期化"""
-    # センサー初期化
-    if sensor.initialize():
-        logger.info("✅ センサー初期化成功")
+    global manager
+    atexit.register(close_rollups)
+    default_table()  # WBGT・熱指数の表を先に作っておく (最初のサンプルの公開を待たせない)
+    if daemon_socket:
+        # センサーは測定デーモンが読むので、ここではバスを開かない
+        threading.Thread(target=daemon_subscriber, daemon=True).start()
+        app.config['START_TIME'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        return app
+
+    # センサー検出 (チップIDで応答したBME280をすべて使う)
+    manager = SensorManager(sensor_buses, SENSOR_ADDRESSES, profile=sensor_profile)
+    sensors = manager.discover()
+    atexit.register(close_sensors)
+    if sensors:
+        logger.info(f"✅ センサー初期化成功: {', '.join(s.sensor_id for s in sensors)}")
+        logger.info(f"計測プロファイル: {describe(manager.profile)}")
     else:
-        logger.warning("⚠️ センサー初期化失敗 - デモモードで動作します")
+        logger.warning("⚠️ センサーが見つかりません - デモモードで動作します")
+    
+    # センサーごとの状態と集計値ストア
+    for sensor in sensors:
+        add_sensor_state(sensor.sensor_id, open_rollups=True, separate=len(sensors) > 1)
     
-    # データ収集スレッド開始
-    collector_thread = threading.Thread(target=data_collector, daemon=True)
-    collector_thread.start()
+    if sensors:
+        # データ収集スレッド開始
+        collector_thread = threading.Thread(target=data_collector, daemon=True)
+        collector_thread.start()
+    else:
+        add_sensor_state(DEMO_SENSOR_ID)
     
     app.config['START_TIME'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
     return app
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='BME280の測定値をWebで表示します')
+    add_profile_arguments(parser)
+    parser.add_argument('--bus', type=int, action='append',
+                        help=f'センサーを探すI2Cバスの番号 (複数指定可, 既定: {list(SENSOR_BUSES)})')
+    add_subscriber_arguments(parser)
+    args = parser.parse_args()
+    sensor_profile = profile_from_args(args, COLLECT_INTERVAL)
+    sensor_buses = tuple(args.bus or SENSOR_BUSES)
+    daemon_socket = args.daemon
     try:
         app = create_app()
         logger.info("🚀 Flaskアプリ起動 (http://0.0.0.0:5000)")
@@ -0,0 +1,123 @@
+# coding: utf-8
+
+# ---------------------------------------------------------------------------
+# APIの応答時間の負荷テスト
+#
+# 多数の読み出しスレッドが Flask のテストクライアントで API を呼び続ける間、
+# 書き込みスレッドが app.publish_sample() で実際より速い間隔でサンプルを公開し、
+# エンドポイントごとの応答時間と、公開1回にかかる時間のパーセンタイルを表示します。
+# センサーは不要です (履歴はあらかじめ満杯にしてから開始します)。
+#
+# 実行例: python bench_api_latency.py --readers 32 --duration 10 --rate 200
+# ---------------------------------------------------------------------------
+
+import argparse
+import math
+import random
+import threading
+import time
+
+import app
+
+ENDPOINTS = [
+    '/api/latest',
+    '/api/history',
+    '/api/history?limit=500&from={start}',
+    '/api/history?points=200&method=lttb&from={start}',
+    '/data',
+    '/api/status',
+]
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return float('nan')
+    index = min(len(sorted_values) - 1, max(0, math.ceil(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def report(label, durations):
+    values = sorted(durations)
+    print(f"{label:<48} {len(values):>8} "
+          + ' '.join(f"{percentile(values, p) * 1000:>8.2f}" for p in (50, 90, 99))
+          + f" {values[-1] * 1000 if values else float('nan'):>8.2f}")
+
+
+def prefill(state, count, interval=5.0):
+    """履歴を count 件のそれらしいサンプルで埋める"""
+    rng = random.Random(0)
+    start = time.time() - count * interval
+    for i in range(count):
+        state.history.append(start + i * interval, 20 + rng.random() * 5,
+                                1000 + rng.random() * 20, 40 + rng.random() * 20)
+
+
+def writer(state, rate, stop, durations):
+    """rate 回/秒でサンプルを公開し、1回ごとの所要時間を記録する"""
+    rng = random.Random(1)
+    interval = 1.0 / rate
+    next_time = time.perf_counter()
+    while not stop.is_set():
+        begin = time.perf_counter()
+        app.publish_sample(state, time.time(), 20 + rng.random() * 5,
+                           1000 + rng.random() * 20, 40 + rng.random() * 20)
+        durations.append(time.perf_counter() - begin)
+        next_time += interval
+        delay = next_time - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+
+
+def reader(seed, stop, results):
+    """エンドポイントを順に呼び出し、応答時間を記録する"""
+    client = app.app.test_client()
+    rng = random.Random(seed)
+    while not stop.is_set():
+        template = rng.choice(ENDPOINTS)
+        url = template.format(start=time.time() - 3600)
+        begin = time.perf_counter()
+        response = client.get(url)
+        elapsed = time.perf_counter() - begin
+        if response.status_code != 200:
+            raise RuntimeError(f"{url}: {response.status_code}")
+        results[template].append(elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='APIの応答時間の負荷テスト')
+    parser.add_argument('--readers', type=int, default=32, help='読み出しスレッド数')
+    parser.add_argument('--duration', type=float, default=10.0, help='測定時間 (秒)')
+    parser.add_argument('--rate', type=float, default=200.0, help='サンプルの公開回数 (回/秒)')
+    args = parser.parse_args()
+
+    state = app.add_sensor_state('bench')
+    prefill(state, app.HISTORY_CAPACITY)
+    app.publish_sample(state, time.time(), 25.0, 1013.0, 50.0)
+
+    stop = threading.Event()
+    publish_durations = []
+    results = [{template: [] for template in ENDPOINTS} for _ in range(args.readers)]
+    threads = [threading.Thread(target=writer, args=(state, args.rate, stop, publish_durations))]
+    threads += [threading.Thread(target=reader, args=(i, stop, results[i]))
+                for i in range(args.readers)]
+    for t in threads:
+        t.start()
+    time.sleep(args.duration)
+    stop.set()
+    for t in threads:
+        t.join()
+
+    print(f"読み出しスレッド: {args.readers}, 測定時間: {args.duration} 秒, "
+          f"公開: {len(publish_durations)} 回 ({len(publish_durations) / args.duration:.0f} 回/秒)")
+    print(f"{'':<48} {'件数':>6} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    total = 0
+    for template in ENDPOINTS:
+        durations = [d for r in results for d in r[template]]
+        total += len(durations)
+        report(template, durations)
+    report('(公開 publish_sample)', publish_durations)
+    print(f"合計 {total} リクエスト ({total / args.duration:.0f} リクエスト/秒)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+# coding: utf-8
+
+# ---------------------------------------------------------------------------
+# 補正計算のマイクロベンチマーク
+#
+# 以前の app.py の BME280Sensor.compensate_* (従来版, LegacyCompensation に残してある) と
+# CompensationEngine の浮動小数点版・整数版の処理速度 (サンプル/秒) を比較します。
+# センサーは不要です (データシートの例の補正パラメータを使用)。
+#
+# 実行例: python bench_compensation.py -n 200000
+# ---------------------------------------------------------------------------
+
+import argparse
+import random
+import time
+
+from bme280_calib import Calibration
+from bme280_compensation import CompensationEngine
+
+# データシートの計算例の補正パラメータ
+SAMPLE_CALIBRATION = Calibration(
+    digT=[27504, 26435, -1000],
+    digP=[36477, -10685, 3024, 2855, 140, -7, 15500, -14600, 6000],
+    digH=[75, 362, 0, 313, 50, 30],
+    raw=b'',
+)
+
+
+class LegacyCompensation:
+    """以前の app.py の補正計算 (1項目ずつ計算し、t_fine をインスタンスに保持する)"""
+
+    def __init__(self, calib):
+        self.digT, self.digP, self.digH = calib.digT, calib.digP, calib.digH
+        self.t_fine = 0.0
+
+    def compensate_temp(self, raw_temp):
+        """温度補正 (t_fine計算を含む)"""
+        var1 = (raw_temp / 16384.0 - self.digT[0] / 1024.0) * self.digT[1]
+        var2 = ((raw_temp / 131072.0 - self.digT[0] / 8192.0) *
+                (raw_temp / 131072.0 - self.digT[0] / 8192.0)) * self.digT[2]
+        self.t_fine = var1 + var2
+        temperature = self.t_fine / 5120.0
+        return temperature
+
+    def compensate_pressure(self, raw_pres):
+        """気圧補正（データシート準拠版）"""
+        if not self.digP or raw_pres is None or self.t_fine == 0: return None
+        var1 = (self.t_fine / 2.0) - 64000.0
+        var2 = var1 * var1 * self.digP[5] / 32768.0
+        var2 = var2 + var1 * self.digP[4] * 2.0
+        var2 = (var2 / 4.0) + (self.digP[3] * 65536.0)
+        var1 = (self.digP[2] * var1 * var1 / 524288.0 + self.digP[1] * var1) / 524288.0
+        var1 = (1.0 + var1 / 32768.0) * self.digP[0]
+        if var1 == 0:
+            return 0
+        p = 1048576.0 - raw_pres
+        p = (p - (var2 / 4096.0)) * 6250.0 / var1
+        var1 = self.digP[8] * p * p / 2147483648.0
+        var2 = p * self.digP[7] / 32768.0
+        p = p + (var1 + var2 + self.digP[6]) / 16.0
+        return p / 100.0 # hPaに変換
+
+    def compensate_humidity(self, raw_hum):
+        """湿度補正（データシート準拠版）"""
+        if not self.digH or raw_hum is None or self.t_fine == 0: return None
+        v_x1_u32r = self.t_fine - 76800.0
+        v_x1_u32r = (raw_hum - (self.digH[3] * 64.0 + self.digH[4] / 16384.0 * v_x1_u32r)) * \
+                    (self.digH[1] / 65536.0 * (1.0 + self.digH[5] / 67108864.0 * v_x1_u32r * \
+                    (1.0 + self.digH[2] / 67108864.0 * v_x1_u32r)))
+        humidity = v_x1_u32r * (1.0 - self.digH[0] * v_x1_u32r / 524288.0)
+        return max(0.0, min(100.0, humidity))
+
+
+def make_samples(count, seed=0):
+    """それらしい範囲の生データを生成する"""
+    rng = random.Random(seed)
+    return [(rng.randint(480000, 560000), rng.randint(380000, 430000), rng.randint(25000, 35000))
+            for _ in range(count)]
+
+
+def bench(label, func, samples):
+    start = time.perf_counter()
+    for raw_t, raw_p, raw_h in samples:
+        func(raw_t, raw_p, raw_h)
+    elapsed = time.perf_counter() - start
+    rate = len(samples) / elapsed
+    print(f"{label:<24} {rate:>12,.0f} サンプル/秒 ({elapsed * 1e6 / len(samples):.2f} µs/サンプル)")
+    return rate
+
+
+def main():
+    parser = argparse.ArgumentParser(description='BME280補正計算のベンチマーク')
+    parser.add_argument('-n', '--samples', type=int, default=100000, help='サンプル数')
+    args = parser.parse_args()
+
+    samples = make_samples(args.samples)
+
+    sensor = LegacyCompensation(SAMPLE_CALIBRATION)
+
+    def legacy(raw_t, raw_p, raw_h):
+        return (sensor.compensate_temp(raw_t),
+                sensor.compensate_pressure(raw_p),
+                sensor.compensate_humidity(raw_h))
+
+    float_engine = CompensationEngine(SAMPLE_CALIBRATION)
+    int_engine = CompensationEngine(SAMPLE_CALIBRATION, integer=True)
+
+    print(f"サンプル数: {len(samples)}")
+    base = bench('従来版 (compensate_*)', legacy, samples)
+    for label, func in [('エンジン 浮動小数点版', float_engine.compensate_float),
+                        ('エンジン 整数版', int_engine.compensate_int)]:
+        rate = bench(label, func, samples)
+        print(f"{'':<24} 従来版比 x{rate / base:.2f}")
+
+
+if __name__ == '__main__':
+    main()
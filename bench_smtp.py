@@ -0,0 +1,144 @@
+# coding: utf-8
+
+# ---------------------------------------------------------------------------
+# アラートメールの送信時間のベンチマーク
+#
+# ローカルで起動したSMTPサーバー (aiosmtpd) に同じメールを送り、1通あたりの送信時間を
+# 送信方法ごとに比較します。Gmailのアカウントは不要です。
+#   connect : 1通ごとに接続・EHLO・送信・QUIT (従来の send_alert_email と同じ)
+#   pooled  : SMTPTransport.send() でセッションを使い回す
+#   batch   : SMTPTransport.send_batch() で全通を1つのセッションで送る (1通あたりの平均)
+# ローカルのサーバーにはTLSもログインもないので、実際のGmailでは connect の時間は
+# さらに長くなります (--host / --port などで実際のサーバーも測定できます)。
+#
+# 準備: pip install aiosmtpd
+# 実行例: python bench_smtp.py -n 200
+# ---------------------------------------------------------------------------
+
+import argparse
+import math
+import smtplib
+import time
+from email.header import Header
+from email.mime.text import MIMEText
+
+from smtp_transport import SMTPTransport
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return float('nan')
+    index = min(len(sorted_values) - 1, max(0, math.ceil(p / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def report(label, durations):
+    values = sorted(durations)
+    print(f"{label:<10} {len(values):>6} "
+          + ' '.join(f"{percentile(values, p) * 1000:>8.2f}" for p in (50, 90, 99))
+          + f" {values[-1] * 1000 if values else float('nan'):>8.2f}")
+
+
+def make_message(i, sender, receiver):
+    msg = MIMEText(f"ベンチマーク {i}\n現在の温度: 31.50 ℃\n現在の湿度: 62.00 %\n", 'plain', 'utf-8')
+    msg['Subject'] = Header("【熱中症アラート】ベンチマーク", 'utf-8')
+    msg['From'] = sender
+    msg['To'] = receiver
+    return msg
+
+
+def bench_connect(args, messages):
+    """1通ごとに接続する (従来の方法)"""
+    durations = []
+    for msg in messages:
+        begin = time.perf_counter()
+        with smtplib.SMTP(args.host, args.port, timeout=args.timeout) as server:
+            if args.starttls:
+                server.starttls()
+            if args.user:
+                server.login(args.user, args.password)
+            server.send_message(msg)
+        durations.append(time.perf_counter() - begin)
+    return durations
+
+
+def new_transport(args):
+    return SMTPTransport(args.host, args.port, args.user, args.password,
+                         starttls=args.starttls, timeout=args.timeout)
+
+
+def bench_pooled(args, messages):
+    """セッションを使い回す (最初の1通は接続時間を含む)"""
+    durations = []
+    with new_transport(args) as transport:
+        for msg in messages:
+            begin = time.perf_counter()
+            transport.send(msg)
+            durations.append(time.perf_counter() - begin)
+    return durations
+
+
+def bench_batch(args, messages):
+    """全通を1回の send_batch() で送り、1通あたりの平均を返す"""
+    with new_transport(args) as transport:
+        begin = time.perf_counter()
+        failures = transport.send_batch(messages)
+        elapsed = time.perf_counter() - begin
+    if failures:
+        raise RuntimeError(f"{len(failures)} 通の送信に失敗しました: {failures[0][1]}")
+    return [elapsed / len(messages)] * len(messages)
+
+
+class CountingHandler:
+    """受け取ったメールを数えるだけのハンドラー"""
+
+    def __init__(self):
+        self.received = 0
+
+    async def handle_DATA(self, server, session, envelope):
+        self.received += 1
+        return '250 OK'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='アラートメールの送信時間のベンチマーク')
+    parser.add_argument('-n', '--count', type=int, default=100, help='送信方法ごとの送信数')
+    parser.add_argument('--host', help='測定するSMTPサーバー (省略時はローカルで aiosmtpd を起動)')
+    parser.add_argument('--port', type=int, default=8025, help='SMTPサーバーのポート')
+    parser.add_argument('--starttls', action='store_true', help='STARTTLSを使う (--host 指定時)')
+    parser.add_argument('--user', help='ログインするユーザー (--host 指定時)')
+    parser.add_argument('--password', help='ログインのパスワード (--host 指定時)')
+    parser.add_argument('--timeout', type=float, default=20, help='送信の制限時間 (秒)')
+    parser.add_argument('--to', default='alert@example.com', help='宛先')
+    args = parser.parse_args()
+
+    controller = handler = None
+    if args.host is None:
+        from aiosmtpd.controller import Controller
+        handler = CountingHandler()
+        args.host = '127.0.0.1'
+        controller = Controller(handler, hostname=args.host, port=args.port)
+        controller.start()
+
+    sender = args.user or 'bme280@example.com'
+    messages = [make_message(i, sender, args.to) for i in range(args.count)]
+    try:
+        print(f"SMTPサーバー: {args.host}:{args.port}, 送信数: {args.count} 通/方法")
+        print(f"{'':<10} {'件数':>4} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+        results = {}
+        for label, bench in (('connect', bench_connect), ('pooled', bench_pooled), ('batch', bench_batch)):
+            results[label] = bench(args, messages)
+            report(label, results[label])
+        base = sum(results['connect']) / len(results['connect'])
+        for label in ('pooled', 'batch'):
+            mean = sum(results[label]) / len(results[label])
+            print(f"{label}: 1通あたり平均 {mean * 1000:.2f} ms (connect の {base / mean:.1f} 倍速)")
+        if handler is not None:
+            print(f"サーバーが受け取ったメール: {handler.received} 通")
+    finally:
+        if controller is not None:
+            controller.stop()
+
+
+if __name__ == '__main__':
+    main()
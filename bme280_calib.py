@@ -0,0 +1,138 @@
+# coding: utf-8
+
+# ---------------------------------------------------------------------------
+# BME280 補正パラメータ読み込みモジュール
+#
+# 補正パラメータ (0x88〜0xA1, 0xE1〜0xE7) を2回のブロック読み込みで取得し、
+# structで一括デコードします。
+# デコード結果の元になる生バイト列はバス番号・アドレス・チップIDをキーとして
+# JSONファイルにキャッシュし、再起動時はI2Cバスにアクセスせずに復元します。
+# ---------------------------------------------------------------------------
+
+import json
+import logging
+import os
+import struct
+import zlib
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+CHIP_ID_REG = 0xD0
+BME280_CHIP_ID = 0x60
+
+CALIB_BANK1_REG = 0x88   # 0x88〜0xA1 (26バイト)
+CALIB_BANK1_LEN = 26
+CALIB_BANK2_REG = 0xE1   # 0xE1〜0xE7 (7バイト)
+CALIB_BANK2_LEN = 7
+
+# T1, T2, T3, P1〜P9, (0xA0は未使用), H1
+_BANK1_FORMAT = struct.Struct('<HhhHhhhhhhhhxB')
+# H2, H3, 0xE4, 0xE5, 0xE6, H6
+_BANK2_FORMAT = struct.Struct('<hBbBbb')
+
+# キャッシュファイル (環境変数 BME280_CALIB_CACHE で変更可能)
+CALIB_CACHE_FILE = os.getenv('BME280_CALIB_CACHE',
+                             os.path.expanduser('~/.bme280_calib_cache.json'))
+
+# digT, digP, digH は既存スクリプトと同じ並び (digT[0] = dig_T1 ...)
+# raw は補正パラメータの生バイト列 (33バイト)
+Calibration = namedtuple('Calibration', ['digT', 'digP', 'digH', 'raw'])
+
+
+def calibration_id(calib):
+    """補正パラメータを識別する32bit ID (生バイト列のCRC32)"""
+    return zlib.crc32(calib.raw) & 0xFFFFFFFF
+
+
+def decode_calibration(raw):
+    """33バイトの生バイト列から補正パラメータをデコードする"""
+    if len(raw) != CALIB_BANK1_LEN + CALIB_BANK2_LEN:
+        raise ValueError(f"補正パラメータの長さが不正です: {len(raw)}バイト")
+    raw = bytes(raw)
+    bank1 = _BANK1_FORMAT.unpack_from(raw, 0)
+    h2, h3, e4, e5, e6, h6 = _BANK2_FORMAT.unpack_from(raw, CALIB_BANK1_LEN)
+
+    digT = list(bank1[0:3])
+    digP = list(bank1[3:12])
+    digH = [
+        bank1[12],                     # H1 (unsigned char)
+        h2,                            # H2 (signed short)
+        h3,                            # H3 (unsigned char)
+        (e4 << 4) | (e5 & 0x0F),       # H4 (signed 12bit)
+        (e6 << 4) | (e5 >> 4),         # H5 (signed 12bit)
+        h6,                            # H6 (signed char)
+    ]
+    return Calibration(digT, digP, digH, raw)
+
+
+def read_calibration_block(bus, address):
+    """2回のブロック読み込みで補正パラメータの生バイト列を取得する"""
+    bank1 = bus.read_i2c_block_data(address, CALIB_BANK1_REG, CALIB_BANK1_LEN)
+    bank2 = bus.read_i2c_block_data(address, CALIB_BANK2_REG, CALIB_BANK2_LEN)
+    return bytes(bank1) + bytes(bank2)
+
+
+def _cache_key(bus_number, address, chip_id):
+    return f"{bus_number}:{address:#04x}:{chip_id:#04x}"
+
+
+def _load_cache(cache_file):
+    try:
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        logger.warning(f"補正パラメータキャッシュを読み込めませんでした: {e}")
+        return {}
+
+
+def _save_cache(cache_file, cache):
+    # 他プロセスが途中まで書かれたファイルを読まないよう、一時ファイル経由で置き換える
+    tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(cache, f, indent=2, sort_keys=True)
+        os.replace(tmp_file, cache_file)
+    except OSError as e:
+        logger.warning(f"補正パラメータキャッシュを保存できませんでした: {e}")
+
+
+def load_calibration(bus, address, bus_number=1, cache_file=CALIB_CACHE_FILE, refresh=False):
+    """補正パラメータを読み込む
+
+    キャッシュにバス番号・アドレス・チップIDが一致するエントリがあれば
+    チップIDの1バイト読み込みだけで済ませます。
+    センサーを交換した場合は refresh=True で読み直してください。
+    cache_file に None を指定するとキャッシュを使いません。
+    失敗した場合は None を返します。
+    """
+    try:
+        chip_id = bus.read_byte_data(address, CHIP_ID_REG)
+    except OSError as e:
+        logger.error(f"チップID読み込み失敗 (アドレス {hex(address)}): {e}")
+        return None
+    if chip_id != BME280_CHIP_ID:
+        logger.warning(f"BME280ではないチップIDです (アドレス {hex(address)}): {hex(chip_id)}")
+
+    key = _cache_key(bus_number, address, chip_id)
+    cache = _load_cache(cache_file) if cache_file else {}
+
+    if not refresh and key in cache:
+        try:
+            return decode_calibration(bytes.fromhex(cache[key]))
+        except ValueError as e:
+            logger.warning(f"キャッシュの補正パラメータが不正なため読み直します: {e}")
+
+    try:
+        raw = read_calibration_block(bus, address)
+    except OSError as e:
+        logger.error(f"補正パラメータ読み込み失敗 (アドレス {hex(address)}): {e}")
+        return None
+    calib = decode_calibration(raw)
+
+    if cache_file:
+        cache[key] = raw.hex()
+        _save_cache(cache_file, cache)
+    return calib
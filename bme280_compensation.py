@@ -0,0 +1,200 @@
+# coding: utf-8
+
+# ---------------------------------------------------------------------------
+# BME280 補正計算エンジン
+#
+# 補正パラメータを読み込んだ後に一度だけ係数を前計算し、
+# 生データ (温度・気圧・湿度) から補正値3つを1回の呼び出しで返します。
+# t_fine をインスタンスに保持しないため、複数スレッドから同時に呼び出せます。
+#
+# - 浮動小数点版: 以前の app.py の BME280Sensor.compensate_* (bench_compensation.py の
+#   LegacyCompensation) と同じ計算順序で、
+#   2のべき乗による除算だけを係数に畳み込んでいるため結果はビット単位で一致します。
+# - 整数版: データシートの32bit (温度・湿度) / 64bit (気圧) 固定小数点演算です。
+# - 一括版: NumPy配列の生データをまとめて補正します (浮動小数点版と同じ結果)。
+#   記録済みの生データを補正し直す用途向けで、NumPyが必要です。
+# ---------------------------------------------------------------------------
+
+
+def _div_trunc(a, b):
+    """C言語と同じ0方向への切り捨て除算"""
+    q = abs(a) // abs(b)
+    return q if (a >= 0) == (b >= 0) else -q
+
+
+class CompensationEngine:
+    """補正パラメータから前計算した係数で補正計算を行う"""
+
+    def __init__(self, calib, integer=False):
+        self.integer = integer
+        T1, T2, T3 = calib.digT
+        P1, P2, P3, P4, P5, P6, P7, P8, P9 = calib.digP
+        H1, H2, H3, H4, H5, H6 = calib.digH
+
+        # 浮動小数点版の係数 (2のべき乗での除算のみ畳み込む)
+        self._t1_1024 = T1 / 1024.0
+        self._t1_8192 = T1 / 8192.0
+        self._t2 = float(T2)
+        self._t3 = float(T3)
+        self._p1 = float(P1)
+        self._p2 = float(P2)
+        self._p3 = P3 / 524288.0
+        self._p4 = P4 * 65536.0
+        self._p5 = P5 * 2.0
+        self._p6 = P6 / 32768.0
+        self._p7 = float(P7)
+        self._p8 = P8 / 32768.0
+        self._p9 = P9 / 2147483648.0
+        self._h1 = H1 / 524288.0
+        self._h2 = H2 / 65536.0
+        self._h3 = H3 / 67108864.0
+        self._h4 = H4 * 64.0
+        self._h5 = H5 / 16384.0
+        self._h6 = H6 / 67108864.0
+
+        # 整数版の係数
+        self._it1 = T1
+        self._it1_2 = T1 << 1
+        self._it2 = T2
+        self._it3 = T3
+        self._ip1 = P1
+        self._ip2 = P2
+        self._ip3 = P3
+        self._ip4 = P4 << 35
+        self._ip5 = P5
+        self._ip6 = P6
+        self._ip7 = P7 << 4
+        self._ip8 = P8
+        self._ip9 = P9
+        self._ih1 = H1
+        self._ih2 = H2
+        self._ih3 = H3
+        self._ih4 = H4 << 20
+        self._ih5 = H5
+        self._ih6 = H6
+
+    def compensate(self, raw_temp, raw_pres, raw_hum):
+        """生データから (温度[°C], 気圧[hPa], 湿度[%]) を返す"""
+        if self.integer:
+            return self.compensate_int(raw_temp, raw_pres, raw_hum)
+        return self.compensate_float(raw_temp, raw_pres, raw_hum)
+
+    def compensate_float(self, raw_temp, raw_pres, raw_hum):
+        """浮動小数点版の補正計算"""
+        # 温度
+        var1 = (raw_temp * (1.0 / 16384.0) - self._t1_1024) * self._t2
+        var2 = raw_temp * (1.0 / 131072.0) - self._t1_8192
+        var2 = (var2 * var2) * self._t3
+        t_fine = var1 + var2
+        temperature = t_fine / 5120.0
+
+        # 気圧
+        var1 = t_fine * 0.5 - 64000.0
+        var2 = var1 * var1 * self._p6
+        var2 = var2 + var1 * self._p5
+        var2 = var2 * 0.25 + self._p4
+        var1 = (self._p3 * var1 * var1 + self._p2 * var1) * (1.0 / 524288.0)
+        var1 = (1.0 + var1 * (1.0 / 32768.0)) * self._p1
+        if var1 == 0:
+            pressure = 0
+        else:
+            p = 1048576.0 - raw_pres
+            p = (p - var2 * (1.0 / 4096.0)) * 6250.0 / var1
+            var1 = self._p9 * p * p
+            var2 = p * self._p8
+            p = p + (var1 + var2 + self._p7) * 0.0625
+            pressure = p / 100.0
+
+        # 湿度
+        v = t_fine - 76800.0
+        v = (raw_hum - (self._h4 + self._h5 * v)) * \
+            (self._h2 * (1.0 + self._h6 * v * (1.0 + self._h3 * v)))
+        humidity = v * (1.0 - self._h1 * v)
+        humidity = max(0.0, min(100.0, humidity))
+
+        return temperature, pressure, humidity
+
+    def compensate_batch(self, raw_temp, raw_pres, raw_hum):
+        """生データの配列から (温度, 気圧, 湿度) の配列を返す
+
+        compensate_float と同じ順序で演算するため、各要素はビット単位で一致します。
+        """
+        import numpy as np
+
+        raw_temp = np.asarray(raw_temp, dtype=np.float64)
+        raw_pres = np.asarray(raw_pres, dtype=np.float64)
+        raw_hum = np.asarray(raw_hum, dtype=np.float64)
+
+        # 温度
+        var1 = (raw_temp * (1.0 / 16384.0) - self._t1_1024) * self._t2
+        var2 = raw_temp * (1.0 / 131072.0) - self._t1_8192
+        var2 = (var2 * var2) * self._t3
+        t_fine = var1 + var2
+        temperature = t_fine / 5120.0
+
+        # 気圧 (var1 == 0 の要素は 0)
+        var1 = t_fine * 0.5 - 64000.0
+        var2 = var1 * var1 * self._p6
+        var2 = var2 + var1 * self._p5
+        var2 = var2 * 0.25 + self._p4
+        var1 = (self._p3 * var1 * var1 + self._p2 * var1) * (1.0 / 524288.0)
+        var1 = (1.0 + var1 * (1.0 / 32768.0)) * self._p1
+        valid = var1 != 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            p = 1048576.0 - raw_pres
+            p = (p - var2 * (1.0 / 4096.0)) * 6250.0 / var1
+        var1 = self._p9 * p * p
+        var2 = p * self._p8
+        p = p + (var1 + var2 + self._p7) * 0.0625
+        pressure = np.where(valid, p / 100.0, 0.0)
+
+        # 湿度
+        v = t_fine - 76800.0
+        v = (raw_hum - (self._h4 + self._h5 * v)) * \
+            (self._h2 * (1.0 + self._h6 * v * (1.0 + self._h3 * v)))
+        humidity = v * (1.0 - self._h1 * v)
+        humidity = np.clip(humidity, 0.0, 100.0)
+
+        return temperature, pressure, humidity
+
+    def compensate_int(self, raw_temp, raw_pres, raw_hum):
+        """整数版の補正計算 (データシート 4.2.3 準拠)"""
+        # 温度 (32bit) : 0.01°C 単位
+        var1 = (((raw_temp >> 3) - self._it1_2) * self._it2) >> 11
+        var2 = (raw_temp >> 4) - self._it1
+        var2 = (((var2 * var2) >> 12) * self._it3) >> 14
+        t_fine = var1 + var2
+        temperature = ((t_fine * 5 + 128) >> 8) / 100.0
+
+        # 気圧 (64bit) : Q24.8 形式の Pa 単位
+        var1 = t_fine - 128000
+        var2 = var1 * var1 * self._ip6
+        var2 = var2 + ((var1 * self._ip5) << 17)
+        var2 = var2 + self._ip4
+        var1 = ((var1 * var1 * self._ip3) >> 8) + ((var1 * self._ip2) << 12)
+        var1 = (((1 << 47) + var1) * self._ip1) >> 33
+        if var1 == 0:
+            pressure = 0
+        else:
+            p = 1048576 - raw_pres
+            p = _div_trunc(((p << 31) - var2) * 3125, var1)
+            var1 = (self._ip9 * (p >> 13) * (p >> 13)) >> 25
+            var2 = (self._ip8 * p) >> 19
+            p = ((p + var1 + var2) >> 8) + self._ip7
+            pressure = p / 25600.0
+
+        # 湿度 (32bit) : Q22.10 形式の %RH
+        v = t_fine - 76800
+        v = ((((raw_hum << 14) - self._ih4 - (self._ih5 * v)) + 16384) >> 15) * \
+            (((((((v * self._ih6) >> 10) * (((v * self._ih3) >> 11) + 32768)) >> 10) +
+               2097152) * self._ih2 + 8192) >> 14)
+        v = v - (((((v >> 15) * (v >> 15)) >> 7) * self._ih1) >> 4)
+        v = max(0, min(419430400, v))
+        humidity = (v >> 12) / 1024.0
+
+        return temperature, pressure, humidity
+
+
+def compensate_batch(raw_temp, raw_pres, raw_hum, calib):
+    """補正パラメータと生データの配列から (温度, 気圧, 湿度) の配列を返す"""
+    return CompensationEngine(calib).compensate_batch(raw_temp, raw_pres, raw_hum)
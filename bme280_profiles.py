@@ -0,0 +1,224 @@
+# coding: utf-8
+
+# ---------------------------------------------------------------------------
+# BME280 の計測プロファイル
+#
+# オーバーサンプリング・IIRフィルタ・待機時間・動作モードの組み合わせに名前を付けて、
+# 全スクリプトで同じ設定を選べるようにします。
+# オーバーサンプリングやフィルタを強くするとノイズは減りますが、1回の計測時間が延び、
+# 取得できる最大のサンプル数 (回/秒) が下がります。
+#
+#   weather    : フォースドモード, 全項目 x1, フィルタOFF (データシートの天気観測の推奨設定)
+#   indoor     : ノーマルモード, 温度 x2 / 気圧 x16 / 湿度 x1, フィルタ16, 待機0.5ms
+#                (データシートの屋内ナビゲーションの推奨設定。気圧のノイズが最も小さい)
+#   high_rate  : ノーマルモード, 全項目 x1, フィルタOFF, 待機0.5ms (最大約100回/秒)
+#   continuous : ノーマルモード, 全項目 x1, フィルタOFF, 待機1000ms (以前の固定設定)
+#
+# プロファイルは --profile 引数、環境変数 BME280_PROFILE の順で選び、既定は weather です。
+#
+# 一覧表示: python bme280_profiles.py
+# 読み出し時間の実測: python bme280_profiles.py --measure (センサーが必要)
+# ---------------------------------------------------------------------------
+
+import argparse
+import os
+import sys
+import time
+from collections import namedtuple
+
+from bme280_timing import (ForcedModeReader, MODE_NORMAL, REG_CONFIG, REG_CTRL_HUM,
+                           REG_CTRL_MEAS, REG_DATA, DATA_LENGTH, measurement_time_ms,
+                           oversampling_factor, register_values)
+
+# config の t_sb (0〜7) に対応するノーマルモードの待機時間 (ms)
+STANDBY_MS = (0.5, 62.5, 125, 250, 500, 1000, 10, 20)
+# config の filter (0〜4) に対応するIIRフィルタの係数 (0 はフィルタOFF)
+FILTER_COEFFICIENTS = (0, 2, 4, 8, 16)
+
+# osrs_* はオーバーサンプリングの設定値 (1=x1, 2=x2, 3=x4, 4=x8, 5=x16)
+# filter は config の設定値 (0〜4), t_sb はノーマルモードの待機時間の設定値 (0〜7)
+Profile = namedtuple('Profile', ['name', 'mode', 'osrs_t', 'osrs_p', 'osrs_h',
+                                 'filter', 't_sb', 'description'])
+
+PROFILES = {p.name: p for p in [
+    Profile('weather', 'forced', 1, 1, 1, 0, 0, '天気観測 (低消費電力, 数秒〜数分に1回)'),
+    Profile('indoor', 'normal', 2, 5, 1, 4, 0, '屋内 (気圧のノイズ最小, フィルタで平滑化)'),
+    Profile('high_rate', 'normal', 1, 1, 1, 0, 0, '高速取得 (最大約100回/秒)'),
+    Profile('continuous', 'normal', 1, 1, 1, 0, 5, '連続計測 (待機1秒, 以前の固定設定)'),
+]}
+DEFAULT_PROFILE = 'weather'
+PROFILE_ENV = 'BME280_PROFILE'
+
+
+def validate(profile):
+    """設定値がデータシートの範囲内か確認する (範囲外なら ValueError)"""
+    if profile.mode not in ('forced', 'normal'):
+        raise ValueError(f"{profile.name}: mode は 'forced' または 'normal' です")
+    for field in ('osrs_t', 'osrs_p', 'osrs_h'):
+        value = getattr(profile, field)
+        # 温度は他の項目の補正にも使うので省略できない。気圧・湿度も記録するので省略しない
+        if not 1 <= value <= 5:
+            raise ValueError(f"{profile.name}: {field} は1〜5にしてください ({value})")
+    if not 0 <= profile.filter < len(FILTER_COEFFICIENTS):
+        raise ValueError(f"{profile.name}: filter は0〜{len(FILTER_COEFFICIENTS) - 1}にしてください")
+    if not 0 <= profile.t_sb < len(STANDBY_MS):
+        raise ValueError(f"{profile.name}: t_sb は0〜{len(STANDBY_MS) - 1}にしてください")
+    return profile
+
+
+def measurement_time(profile):
+    """1回の計測時間の最大値 (秒)"""
+    return measurement_time_ms(profile.osrs_t, profile.osrs_p, profile.osrs_h) / 1000
+
+
+def min_interval(profile):
+    """新しい計測値が得られる最短の間隔 (秒)
+
+    フォースドモードは計測時間そのもの、ノーマルモードは計測時間 + 待機時間です。
+    """
+    interval = measurement_time(profile)
+    if profile.mode == 'normal':
+        interval += STANDBY_MS[profile.t_sb] / 1000
+    return interval
+
+
+def max_sample_rate(profile):
+    """理論上の最大サンプル数 (回/秒)"""
+    return 1.0 / min_interval(profile)
+
+
+def check_interval(profile, interval):
+    """測定間隔がプロファイルの最短間隔より短ければ ValueError"""
+    shortest = min_interval(profile)
+    if interval < shortest:
+        raise ValueError(f"プロファイル {profile.name} では測定間隔を {shortest * 1000:.1f} ms 以上にしてください "
+                         f"(指定 {interval * 1000:.1f} ms)")
+
+
+def get_profile(name):
+    try:
+        return validate(PROFILES[name])
+    except KeyError:
+        raise ValueError(f"プロファイル '{name}' はありません ({', '.join(PROFILES)})")
+
+
+def select_profile(name=None):
+    """name (None なら環境変数 BME280_PROFILE, それもなければ既定) のプロファイルを返す"""
+    return get_profile(name or os.getenv(PROFILE_ENV) or DEFAULT_PROFILE)
+
+
+def apply_profile(bus, address, profile):
+    """センサーをプロファイルの設定にする
+
+    フォースドモードなら ForcedModeReader を、ノーマルモードなら None を返します
+    (ノーマルモードでは 0xF7 から最新の計測値をそのまま読み出します)。
+    I2Cの通信エラーは IOError のまま呼び出し元に伝えます。
+    """
+    if profile.mode == 'forced':
+        reader = ForcedModeReader(bus, address, profile.osrs_t, profile.osrs_p, profile.osrs_h,
+                                  filter_coeff=profile.filter)
+        reader.configure()
+        return reader
+    ctrl_hum, ctrl_meas, config = register_values(profile.osrs_t, profile.osrs_p, profile.osrs_h,
+                                                  MODE_NORMAL, profile.t_sb, profile.filter)
+    # config はスリープモード中に書き、ctrl_hum は ctrl_meas を書いたときに反映される
+    bus.write_byte_data(address, REG_CTRL_MEAS, ctrl_meas & ~0x03)
+    bus.write_byte_data(address, REG_CONFIG, config)
+    bus.write_byte_data(address, REG_CTRL_HUM, ctrl_hum)
+    bus.write_byte_data(address, REG_CTRL_MEAS, ctrl_meas)
+    return None
+
+
+def measure_latency(read_block, count=10):
+    """read_block() を count 回呼んで、1回の読み出し時間 (ms) の平均・最小・最大を返す"""
+    durations = []
+    for _ in range(count):
+        start = time.perf_counter()
+        read_block()
+        durations.append((time.perf_counter() - start) * 1000)
+    return {'mean_ms': sum(durations) / count, 'min_ms': min(durations), 'max_ms': max(durations)}
+
+
+def block_reader(bus, address, reader):
+    """apply_profile() の戻り値に合わせて、8バイトの生データを読む関数を返す"""
+    if reader is not None:
+        return reader.read_block
+    return lambda: bus.read_i2c_block_data(address, REG_DATA, DATA_LENGTH)
+
+
+def latency_report(profile, read_block, count=5):
+    """プロファイルの説明と読み出し時間の実測値 (表示用の文字列)"""
+    try:
+        latency = measure_latency(read_block, count)
+    except IOError as e:
+        return f"{describe(profile)}\n    読み出し時間を測定できませんでした: {e}"
+    return (f"{describe(profile)}\n    読み出し時間 (実測 {count} 回): 平均 {latency['mean_ms']:.2f} ms, "
+            f"最小 {latency['min_ms']:.2f} ms, 最大 {latency['max_ms']:.2f} ms")
+
+
+def describe(profile):
+    """プロファイルの設定と理論値の1行説明"""
+    factors = '/'.join(f"x{oversampling_factor(v)}" for v in
+                       (profile.osrs_t, profile.osrs_p, profile.osrs_h))
+    text = (f"{profile.name}: {profile.mode}, 温度/気圧/湿度 {factors}, "
+            f"フィルタ {FILTER_COEFFICIENTS[profile.filter] or 'OFF'}")
+    if profile.mode == 'normal':
+        text += f", 待機 {STANDBY_MS[profile.t_sb]} ms"
+    return (text + f", 計測 {measurement_time(profile) * 1000:.2f} ms, "
+            f"最大 {max_sample_rate(profile):.1f} 回/秒")
+
+
+def add_profile_arguments(parser):
+    parser.add_argument('--profile', choices=list(PROFILES), default=None,
+                        help=f'計測プロファイル (既定: 環境変数 {PROFILE_ENV} または {DEFAULT_PROFILE})')
+    parser.add_argument('--list-profiles', action='store_true', help='プロファイルの一覧を表示して終了')
+
+
+def profile_from_args(args, interval=None):
+    """add_profile_arguments() で追加した引数からプロファイルを選ぶ
+
+    interval (測定間隔, 秒) を指定すると、プロファイルの最短間隔より短い場合はエラーで終了します。
+    """
+    if args.list_profiles:
+        for profile in PROFILES.values():
+            print(f"{describe(profile)}  - {profile.description}")
+        sys.exit(0)
+    profile = select_profile(args.profile)
+    if interval is not None:
+        try:
+            check_interval(profile, interval)
+        except ValueError as e:
+            sys.exit(f"エラー: {e}")
+    return profile
+
+
+def profile_from_command_line(description, argv=None, interval=None):
+    """--profile / --list-profiles だけを受け付けるスクリプト用"""
+    parser = argparse.ArgumentParser(description=description)
+    add_profile_arguments(parser)
+    return profile_from_args(parser.parse_args(argv), interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='BME280の計測プロファイルの一覧と読み出し時間の実測')
+    parser.add_argument('--measure', action='store_true', help='センサーで各プロファイルの読み出し時間を実測する')
+    parser.add_argument('--bus', type=int, default=1, help='I2Cバス番号')
+    parser.add_argument('--address', type=lambda v: int(v, 0), default=0x76, help='I2Cアドレス')
+    parser.add_argument('-n', '--count', type=int, default=20, help='実測する回数')
+    args = parser.parse_args()
+
+    if not args.measure:
+        for profile in PROFILES.values():
+            print(f"{describe(profile)}  - {profile.description}")
+        return
+
+    from smbus2 import SMBus
+    with SMBus(args.bus) as bus:
+        for profile in PROFILES.values():
+            reader = apply_profile(bus, args.address, profile)
+            time.sleep(min_interval(profile) * 2)  # 設定変更後の最初の計測を待つ
+            print(latency_report(profile, block_reader(bus, args.address, reader), args.count))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+# coding: utf-8
+
+# ---------------------------------------------------------------------------
+# BME280 の計測時間とフォースドモードでの読み出し
+#
+# ノーマルモードではセンサーが待機時間ごとに計測を続けますが、
+# フォースドモードでは ctrl_meas (0xF4) に mode=01 を書いたときに1回だけ計測し、
+# 終わるとスリープに戻ります。数秒〜数分に1回読むだけなら、こちらの方が
+# センサーの消費電力もI2Cの通信量も少なくて済みます。
+#
+# 計測時間はオーバーサンプリングの設定から計算できます (データシート 9.1 節, 単位 ms):
+#   標準: 1 + 2 × osrs_t + (2 × osrs_p + 0.5) + (2 × osrs_h + 0.5)
+#   最大: 1.25 + 2.3 × osrs_t + (2.3 × osrs_p + 0.575) + (2.3 × osrs_h + 0.575)
+# (osrs_* はオーバーサンプリングの倍率。計測しない項目 (倍率0) の項は足さない)
+#
+# ForcedModeReader は計測を開始したあと標準の計測時間だけ待ち、
+# そこから status (0xF3) の measuring ビット (bit 3) が0になるのを確認してから
+# 0xF7〜0xFE の8バイトを一括で読み出します。
+# 計測開始直後は measuring ビットがまだ立っていないことがあるため、
+# 標準の計測時間が経つまではステータスを見ません。
+# ---------------------------------------------------------------------------
+
+import time
+
+REG_CTRL_HUM = 0xF2
+REG_STATUS = 0xF3
+REG_CTRL_MEAS = 0xF4
+REG_CONFIG = 0xF5
+REG_DATA = 0xF7
+DATA_LENGTH = 8
+
+STATUS_MEASURING = 0x08  # bit 3: 計測中 (結果をデータレジスタに転送し終わると0になる)
+
+MODE_SLEEP = 0
+MODE_FORCED = 1
+MODE_NORMAL = 3
+
+# osrs_* の設定値 (0〜5) に対応するオーバーサンプリングの倍率 (0 は計測しない)
+OVERSAMPLING_FACTORS = (0, 1, 2, 4, 8, 16)
+
+
+def oversampling_factor(osrs):
+    """osrs_* の設定値をオーバーサンプリングの倍率に変換する (6以上は x16)"""
+    if osrs < 0:
+        raise ValueError("オーバーサンプリングの設定値は0以上にしてください")
+    return OVERSAMPLING_FACTORS[min(osrs, 5)]
+
+
+def measurement_time_ms(osrs_t, osrs_p, osrs_h, maximum=True):
+    """1回の計測にかかる時間 (ms)。maximum=False なら標準値"""
+    t = oversampling_factor(osrs_t)
+    p = oversampling_factor(osrs_p)
+    h = oversampling_factor(osrs_h)
+    if maximum:
+        base, per_sample, overhead = 1.25, 2.3, 0.575
+    else:
+        base, per_sample, overhead = 1.0, 2.0, 0.5
+    total = base + per_sample * t
+    if p:
+        total += per_sample * p + overhead
+    if h:
+        total += per_sample * h + overhead
+    return total
+
+
+def register_values(osrs_t, osrs_p, osrs_h, mode, t_sb=5, filter_coeff=0):
+    """(ctrl_hum, ctrl_meas, config) の設定値を作る"""
+    ctrl_hum = osrs_h & 0x07
+    ctrl_meas = ((osrs_t & 0x07) << 5) | ((osrs_p & 0x07) << 2) | (mode & 0x03)
+    config = ((t_sb & 0x07) << 5) | ((filter_coeff & 0x07) << 2)
+    return ctrl_hum, ctrl_meas, config
+
+
+class ForcedModeReader:
+    """フォースドモードで1回ずつ計測して生データを読み出す
+
+    I2Cの通信エラーは IOError のまま呼び出し元に伝えます。
+    """
+
+    def __init__(self, bus, address, osrs_t=1, osrs_p=1, osrs_h=1, filter_coeff=0,
+                 poll_interval=0.0005, sleep=time.sleep, clock=time.monotonic):
+        self.bus = bus
+        self.address = address
+        self.osrs_t = osrs_t
+        self.osrs_p = osrs_p
+        self.osrs_h = osrs_h
+        self.filter_coeff = filter_coeff
+        self.poll_interval = poll_interval
+        self.sleep = sleep
+        self.clock = clock
+        self.ctrl_hum, self.ctrl_meas, self.config = register_values(
+            osrs_t, osrs_p, osrs_h, MODE_FORCED, filter_coeff=filter_coeff)
+        self.typical_time = measurement_time_ms(osrs_t, osrs_p, osrs_h, maximum=False) / 1000
+        self.max_time = measurement_time_ms(osrs_t, osrs_p, osrs_h) / 1000
+        self.last_wait = 0.0  # 直前の計測で結果を待った時間 (秒)
+        self.last_polls = 0   # 直前の計測でステータスを読んだ回数
+
+    def configure(self):
+        """スリープモードにしてからオーバーサンプリングとフィルタを設定する"""
+        # ctrl_hum の変更は ctrl_meas を書いたときに反映される
+        self.bus.write_byte_data(self.address, REG_CTRL_MEAS, self.ctrl_meas & ~0x03)
+        self.bus.write_byte_data(self.address, REG_CONFIG, self.config)
+        self.bus.write_byte_data(self.address, REG_CTRL_HUM, self.ctrl_hum)
+        self.bus.write_byte_data(self.address, REG_CTRL_MEAS, self.ctrl_meas & ~0x03)
+
+    def trigger(self):
+        """1回の計測を開始する"""
+        self.bus.write_byte_data(self.address, REG_CTRL_MEAS, self.ctrl_meas)
+
+    def wait_ready(self, started):
+        """計測が終わるまで待つ (最大計測時間を大きく過ぎても終わらなければ IOError)"""
+        remaining = started + self.typical_time - self.clock()
+        if remaining > 0:
+            self.sleep(remaining)
+        deadline = started + self.max_time * 2 + 0.01
+        polls = 0
+        while True:
+            polls += 1
+            status = self.bus.read_byte_data(self.address, REG_STATUS)
+            if not status & STATUS_MEASURING:
+                break
+            if self.clock() > deadline:
+                raise IOError(f"計測が終わりません (status={status:#04x})")
+            self.sleep(self.poll_interval)
+        self.last_wait = self.clock() - started
+        self.last_polls = polls
+
+    def read_block(self):
+        """計測を1回行い、0xF7 からの8バイトを返す"""
+        started = self.clock()
+        self.trigger()
+        self.wait_ready(started)
+        return self.bus.read_i2c_block_data(self.address, REG_DATA, DATA_LENGTH)
@@ -0,0 +1,69 @@
+# coding: utf-8
+
+# ---------------------------------------------------------------------------
+# Server-Sent Events の配信
+#
+# 収集スレッドが publish() したサンプルを1回だけJSONにしてSSEの形式に整え、
+# 直近の一定件数を保持します。接続中のクライアントは全員同じバイト列を受け取るので、
+# クライアント数が増えてもシリアライズは1回で済みます。
+# 再接続時は Last-Event-ID 以降の保持しているイベントをまとめて送ります。
+# ---------------------------------------------------------------------------
+
+import collections
+import json
+import threading
+
+
+class Broadcaster:
+    """1つの送信者から多数の購読者へイベントを配信する"""
+
+    def __init__(self, backlog=720, event='sample'):
+        self.event = event
+        self._cond = threading.Condition()
+        self._events = collections.deque(maxlen=backlog)  # (ID, SSEフレーム)
+        self.last_id = 0
+
+    def publish(self, data):
+        """データを1回だけシリアライズして全購読者に通知する"""
+        payload = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+        with self._cond:
+            self.last_id += 1
+            frame = f"id: {self.last_id}\nevent: {self.event}\ndata: {payload}\n\n".encode('utf-8')
+            self._events.append((self.last_id, frame))
+            self._cond.notify_all()
+        return self.last_id
+
+    def _frames_after(self, last_id):
+        # 保持しているイベントのうち last_id より新しいもの (古い順)
+        frames = []
+        for event_id, frame in reversed(self._events):
+            if event_id <= last_id:
+                break
+            frames.append(frame)
+        frames.reverse()
+        return frames
+
+    def wait(self, last_id, timeout):
+        """last_id より新しいイベントのフレームを返す (無ければ timeout 秒まで待つ)"""
+        with self._cond:
+            if self.last_id <= last_id:
+                self._cond.wait(timeout)
+            return self._frames_after(last_id), self.last_id
+
+    def stream(self, last_event_id=None, keepalive=15.0, is_running=lambda: True):
+        """SSEのフレームを順に返すジェネレーター
+
+        last_event_id を指定すると、それ以降のイベントを先に送ります。
+        指定しない場合は最新のイベントを1件送ってから新しいイベントを待ちます。
+        一定時間イベントがなければコメント行を送り、切断を検出できるようにします。
+        """
+        yield b"retry: 5000\n\n"
+        with self._cond:
+            if last_event_id is None or last_event_id > self.last_id:
+                last_event_id = max(self.last_id - 1, 0)
+        while is_running():
+            frames, last_event_id = self.wait(last_event_id, keepalive)
+            if frames:
+                yield b''.join(frames)
+            else:
+                yield b": keepalive\n\n"
@@ -0,0 +1,149 @@
+# coding: utf-8
+
+# ---------------------------------------------------------------------------
+# 列ごとのバイナリファイルによるログ保存 (追記専用)
+#
+# 時刻をUNIXミリ秒のint64、測定値をfloat32として、列ごとに別ファイルへ追記します。
+# 読み込みは numpy.memmap で行い、時刻列を二分探索して必要な範囲だけを参照するため、
+# 長期間のログでもファイル全体を読み込みません。
+#
+# ディレクトリ構成:
+#   bme280_columns/timestamp_ms.i8
+#   bme280_columns/temperature_c.f4
+#   bme280_columns/pressure_hpa.f4
+#   bme280_columns/humidity_percent.f4
+#
+# 書き込み側は標準ライブラリだけで動作します (読み込みにはNumPyが必要です)。
+# ---------------------------------------------------------------------------
+
+import os
+import sys
+import time
+from array import array
+
+TIMESTAMP_COLUMN = ('timestamp_ms', 'q', '<i8')
+VALUE_COLUMNS = [('temperature_c', 'f', '<f4'),
+                 ('pressure_hpa', 'f', '<f4'),
+                 ('humidity_percent', 'f', '<f4')]
+COLUMNS = [TIMESTAMP_COLUMN] + VALUE_COLUMNS
+
+
+def column_path(base_dir, name, dtype):
+    return os.path.join(base_dir, f"{name}.{dtype[1:]}")
+
+
+def _row_count(base_dir):
+    """全列がそろっている行数 (書き込み途中で止まった場合は短い列に合わせる)"""
+    counts = []
+    for name, _, dtype in COLUMNS:
+        path = column_path(base_dir, name, dtype)
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        counts.append(size // int(dtype[-1]))
+    return min(counts)
+
+
+class ColumnStoreWriter:
+    """列ファイルに追記するライター
+
+    flush_rows / flush_interval / fsync_interval は BufferedCSVWriter と同じ意味です。
+    """
+
+    def __init__(self, base_dir, flush_rows=30, flush_interval=60.0, fsync_interval=600.0):
+        self.base_dir = base_dir
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+        os.makedirs(base_dir, exist_ok=True)
+
+        # 前回の書き込みが途中で止まっていたら、全列を同じ行数に切り詰める
+        rows = _row_count(base_dir)
+        self.files = []
+        for name, _, dtype in COLUMNS:
+            f = open(column_path(base_dir, name, dtype), 'ab')
+            f.truncate(rows * int(dtype[-1]))
+            f.seek(0, os.SEEK_END)
+            self.files.append(f)
+        self.rows = rows
+
+        self._buffers = [array(typecode) for _, typecode, _ in COLUMNS]
+        self._last_flush = time.monotonic()
+        self._last_fsync = self._last_flush
+
+    def write(self, timestamp, values):
+        """1行追加する (timestamp はUNIX秒, values は温度・気圧・湿度)"""
+        self._buffers[0].append(int(round(timestamp * 1000)))
+        for buf, value in zip(self._buffers[1:], values):
+            buf.append(value)
+        if len(self._buffers[0]) >= self.flush_rows or \
+                time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self, sync=False):
+        now = time.monotonic()
+        pending = len(self._buffers[0])
+        if pending:
+            # 値の列を先に書き、時刻の列を最後に書く
+            for f, buf in list(zip(self.files, self._buffers))[1:] + [(self.files[0], self._buffers[0])]:
+                if sys.byteorder != 'little':
+                    buf.byteswap()
+                f.write(buf.tobytes())
+                f.flush()
+                del buf[:]
+            self.rows += pending
+        self._last_flush = now
+        if sync or now - self._last_fsync >= self.fsync_interval:
+            for f in self.files:
+                os.fsync(f.fileno())
+            self._last_fsync = now
+
+    def close(self):
+        if not self.files:
+            return
+        try:
+            self.flush(sync=True)
+        finally:
+            for f in self.files:
+                f.close()
+            self.files = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def load_columns(base_dir, start=None, end=None):
+    """期間 [start, end) の列を numpy.memmap のスライスで返す
+
+    start / end はUNIX秒 (None なら制限なし)。
+    戻り値は {'timestamp_ms': ..., 'temperature_c': ..., ...} で、
+    実際に参照したページだけがメモリに読み込まれます。
+    """
+    import numpy as np
+
+    rows = _row_count(base_dir)
+    columns = {}
+    for name, _, dtype in COLUMNS:
+        if rows == 0:
+            columns[name] = np.empty(0, dtype=dtype)
+        else:
+            columns[name] = np.memmap(column_path(base_dir, name, dtype), dtype=dtype,
+                                      mode='r', shape=(rows,))
+
+    ts = columns['timestamp_ms']
+    lo = 0 if start is None else int(np.searchsorted(ts, int(start * 1000), side='left'))
+    hi = rows if end is None else int(np.searchsorted(ts, int(end * 1000), side='left'))
+    return {name: col[lo:hi] for name, col in columns.items()}
+
+
+def load_dataframe(base_dir, start=None, end=None):
+    """期間 [start, end) を pandas.DataFrame (ローカル時刻のインデックス) で返す"""
+    import pandas as pd  # type: ignore
+    from datetime import datetime
+
+    cols = load_columns(base_dir, start, end)
+    index = pd.to_datetime(cols['timestamp_ms'], unit='ms', utc=True)
+    index = index.tz_convert(datetime.now().astimezone().tzinfo).tz_localize(None)
+    return pd.DataFrame({name: cols[name] for name, _, _ in VALUE_COLUMNS},
+                        index=pd.Index(index, name='timestamp'))
@@ -1,273 +1,383 @@
 
 from smbus2 import SMBus
+import argparse
+import csv
+import os
 import time
+from array import array
 from datetime import datetime
-import csv  
+
+from acquisition_daemon import Subscriber, add_subscriber_arguments
+from bme280_calib import load_calibration
+from bme280_compensation import CompensationEngine
+from bme280_profiles import (add_profile_arguments, apply_profile, block_reader, latency_report,
+                             max_sample_rate, measure_latency, min_interval,
+                             profile_from_args, select_profile)
+from bme280_timing import DATA_LENGTH
+from column_store import ColumnStoreWriter
+from log_writer import BufferedCSVWriter
+from partitioned_log import PartitionedLogWriter
+from raw_log import RawLogWriter, decode_raw_block
+from rollup import RollupStore
+from scheduler import PeriodicScheduler
+from sensor_manager import SENSOR_ADDRESSES, SensorManager, sensor_path
 
 I2C_BUS_NUMBER = 1
-I2C_ADDRESS = 0x76
+I2C_ADDRESS = 0x76  # 'raw' / 'burst' モードで使うセンサー
+# 'csv' / 'partitioned' / 'columnar' モードでは、これらのバスで見つかったBME280をすべて記録する
+# (センサーが複数ならセンサーごとに保存先を分ける: bme280_log_1-76.csv, bme280_logs/1-76 など)
+SENSOR_BUSES = (I2C_BUS_NUMBER,)
 
 OUTPUT_CSV_FILE = 'bme280_log.csv'
+OUTPUT_RAW_FILE = 'bme280_log.bin'
+OUTPUT_PARTITION_DIR = 'bme280_logs'
+OUTPUT_COLUMN_DIR = 'bme280_columns'
+ROLLUP_DIR = 'bme280_rollups'  # 1分・1時間・1日の集計値 (ログと一緒に更新)
+
+# 記録モード
+#   'csv' : 補正済みの値をCSVに記録
+#   'raw' : 補正前の生データを固定長バイナリで記録 (補正は読み出し時に raw_log.py で行う)
+#   'partitioned' : 補正済みの値を期間ごとのCSVに分けて記録し、期間が終わったら圧縮する
+#   'columnar' : 補正済みの値を列ごとのバイナリファイルに追記する (plot_bme_data.py --columns で読み込み)
+#   'burst' : プロファイルの最大レートで BURST_DURATION 秒間計測し、終わってからまとめてCSVに書き出す
+#             (--burst 秒数 でも指定可能。ドアの開閉や空調の動作など速い変化の記録用)
+LOG_MODE = 'csv'
+BURST_DURATION = 10         # 'burst' モードの計測時間 (秒)
+OUTPUT_BURST_FILE = 'bme280_burst_{:%Y%m%d_%H%M%S}.csv'  # 'burst' モードの出力先 (計測開始時刻)
+PARTITION_PERIOD = 'hour'   # 'partitioned' モードの分割単位 ('hour' または 'day')
+
+# CSV書き込みの設定 (行をバッファしてまとめて書き込む)
+CSV_HEADER = ['timestamp', 'temperature_c', 'pressure_hpa', 'humidity_percent']
+CSV_FLUSH_ROWS = 30         # この行数が溜まったら書き込む
+CSV_FLUSH_INTERVAL = 60     # 最後の書き込みからこの秒数が経ったら書き込む
+CSV_FSYNC_INTERVAL = 600    # この秒数ごとにfsyncしてSDカードに確定させる
+
+# 計測プロファイル (オーバーサンプリング・IIRフィルタ・待機時間, bme280_profiles.py 参照)
+# --profile 引数または環境変数 BME280_PROFILE で選ぶ (既定 'weather': フォースドモード, 全項目 x1)
+
+# 測定の予定時刻に間に合わなかったときの動作 ('skip' または 'catchup', scheduler.py 参照)
+SCHEDULE_POLICY = 'skip'
 
-# ... (write_reg, read_byte_data_signed, ... compensate_H までの関数はそのまま) ...
 bus = None
-digT = []
-digP = []
-digH = []
-t_fine = 0.0
-
-def write_reg(reg_address, data):
-    if bus is None:
-        print("エラー: I2Cバスが初期化されていません。")
-        return False
-    try:
-        bus.write_byte_data(I2C_ADDRESS, reg_address, data)
-        return True
-    except IOError as e:
-        print(f"エラー: I2C書き込み失敗 (アドレス {hex(I2C_ADDRESS)}, レジスタ {hex(reg_address)}): {e}")
-        return False
+calibration = None  # 補正パラメータ (get_calib_param で読み込み)
+engine = None  # 補正計算エンジン (get_calib_param で生成)
+profile = None  # 計測プロファイル (main で選択)
+reader = None  # フォースドモードの読み出し (setup_sensor で生成)
 
-def read_byte_data_signed(reg_address, signed=False):
-    if bus is None:
-        print("エラー: I2Cバスが初期化されていません。")
-        return None
+def get_calib_param():
+    global engine, calibration
+    calib = load_calibration(bus, I2C_ADDRESS, I2C_BUS_NUMBER)
+    if calib is None: return False
+    engine = CompensationEngine(calib)
+    calibration = calib
+    return True
+
+def read_raw_block():
     try:
-        value = bus.read_byte_data(I2C_ADDRESS, reg_address)
-        if signed:
-            if value > 127:
-                value -= 256
-        return value
+        if reader is not None:
+            return reader.read_block()
+        return bus.read_i2c_block_data(I2C_ADDRESS, 0xF7, 8)
     except IOError as e:
-        print(f"エラー: I2C読み込み失敗 (アドレス {hex(I2C_ADDRESS)}, レジスタ {hex(reg_address)}): {e}")
+        print(f"エラー: I2Cブロックデータ読み込み失敗: {e}")
         return None
 
-def read_word_data_signed(reg_address, lsb_first=True, signed=False):
-    lsb_addr = reg_address
-    msb_addr = reg_address + 1
-    
-    lsb = read_byte_data_signed(lsb_addr)
-    msb = read_byte_data_signed(msb_addr)
+def read_raw_data():
+    block = read_raw_block()
+    if block is None:
+        return None, None, None
+    return decode_raw_block(block)
 
-    if lsb is None or msb is None:
-        return None
+def setup_sensor():
+    """センサーを計測プロファイル (オーバーサンプリング・フィルタ・待機時間) の設定にする"""
+    global profile, reader
+    profile = profile or select_profile()
+    try:
+        reader = apply_profile(bus, I2C_ADDRESS, profile)
+        return True
+    except IOError as e:
+        print(f"エラー: I2C書き込み失敗 (アドレス {hex(I2C_ADDRESS)}): {e}")
+        reader = None
+        return False
 
-    if lsb_first:
-        value = (msb << 8) | lsb
-    else:
-        value = (lsb << 8) | msb
-    
-    if signed:
-        if value & 0x8000:
-            value = value - 65536
-    return value
+def run_raw_logging(measurement_duration=3600, interval=10):
+    """生データモード: 補正計算をせずに8バイトの生データをそのまま記録する"""
+    try:
+        raw_log = RawLogWriter(OUTPUT_RAW_FILE, calibration)
+        print(f"生データは {OUTPUT_RAW_FILE} に保存されます。(CSV変換: python raw_log.py {OUTPUT_RAW_FILE})")
+    except IOError as e:
+        print(f"エラー: 生データファイル '{OUTPUT_RAW_FILE}' の準備ができませんでした: {e}")
+        if bus: bus.close()
+        return
 
-def get_calib_param():
-    global digT, digP, digH
-    digT, digP, digH = [], [], []
-
-    digT.append(read_word_data_signed(0x88))
-    digT.append(read_word_data_signed(0x8A, signed=True))
-    digT.append(read_word_data_signed(0x8C, signed=True))
-    if None in digT: return False
-
-    digP.append(read_word_data_signed(0x8E))
-    for i in range(1, 9):
-        param = read_word_data_signed(0x90 + (i-1) * 2, signed=True)
-        if param is None: return False
-        digP.append(param)
-    if None in digP: return False
-
-    val_A1 = read_byte_data_signed(0xA1)
-    if val_A1 is None: return False
-    digH.append(val_A1)
-
-    val_E1 = read_word_data_signed(0xE1, signed=True)
-    if val_E1 is None: return False
-    digH.append(val_E1)
-    
-    val_E3 = read_byte_data_signed(0xE3)
-    if val_E3 is None: return False
-    digH.append(val_E3)
-
-    e4 = read_byte_data_signed(0xE4)
-    e5_lsb = read_byte_data_signed(0xE5)
-    e6 = read_byte_data_signed(0xE6)
-    if e4 is None or e5_lsb is None or e6 is None: return False
-    digH.append((e4 << 4) | (e5_lsb & 0x0F))
-    digH.append(((e5_lsb >> 4) & 0x0F) | (e6 << 4))
-
-    val_E7 = read_byte_data_signed(0xE7, signed=True)
-    if val_E7 is None: return False
-    digH.append(val_E7)
-    
-    return True
+    print(f"\n生データの測定を開始します。測定時間: {measurement_duration}秒, 測定間隔: {interval}秒")
+    print("Ctrl+Cで中断できます。")
 
-def compensate_T(adc_T):
-    global t_fine
-    if not digT or len(digT) < 3 or digT[0] is None or digT[1] is None or digT[2] is None: return None
-    v1 = (adc_T / 16384.0 - digT[0] / 1024.0) * digT[1]
-    v2 = ((adc_T / 131072.0 - digT[0] / 8192.0)**2) * digT[2]
-    t_fine = v1 + v2
-    temperature = t_fine / 5120.0
-    return temperature
-
-def compensate_P(adc_P):
-    global t_fine
-    if not digP or len(digP) < 9 or None in digP or t_fine == 0.0: return None
-    
-    v1 = (t_fine / 2.0) - 64000.0
-    v2 = (((v1 / 4.0) * (v1 / 4.0)) / 2048.0) * digP[5]
-    v2 = v2 + ((v1 * digP[4]) * 2.0)
-    v2 = (v2 / 4.0) + (digP[3] * 65536.0)
-    
-    var1_calc = (digP[2] * (((v1 / 4.0) * (v1 / 4.0)) / 8192.0)) / 8.0
-    var2_calc = (digP[1] * v1) / 2.0
-    v1_combined = (var1_calc + var2_calc) / 262144.0
-    
-    v1_main = ((32768.0 + v1_combined) * digP[0]) / 32768.0
-    
-    if v1_main == 0: return None
-    
-    pressure = ((1048576.0 - adc_P) - (v2 / 4096.0)) * 3125.0
-    if pressure < 0x80000000:
-        pressure = (pressure * 2.0) / v1_main
-    else:
-        pressure = (pressure / v1_main) * 2.0
-    
-    v1 = (digP[8] * (((pressure / 8.0) * (pressure / 8.0)) / 8192.0)) / 4096.0
-    v2 = ((pressure / 4.0) * digP[7]) / 8192.0
-    pressure = pressure + ((v1 + v2 + digP[6]) / 16.0)
-    return pressure / 100.0
+    scheduler = PeriodicScheduler(interval, SCHEDULE_POLICY)
+    try:
+        for tick in scheduler.ticks(duration=measurement_duration):
+            block = read_raw_block()
+            if block is not None:
+                raw_log.write(time.time(), block)
+                raw_log.flush()
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] 生データを記録しました: {bytes(block).hex()}")
+            else:
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] データ取得に失敗しました。")
 
-def compensate_H(adc_H):
-    global t_fine
-    if not digH or len(digH) < 6 or None in digH or t_fine == 0.0: return None
+        print("\n予定の測定時間が完了しました。")
 
-    var_h_calc = t_fine - 76800.0
-    
-    humidity = adc_H - (digH[3] * 64.0 + digH[4] / 16384.0 * var_h_calc)
-    humidity = humidity * (digH[1] / 65536.0 * (1.0 + digH[5] / 67108864.0 * var_h_calc * \
-                        (1.0 + digH[2] / 67108864.0 * var_h_calc)))
-    humidity = humidity * (1.0 - digH[0] * humidity / 524288.0)
+    except KeyboardInterrupt:
+        print("\n測定がユーザーによって中断されました。")
+    finally:
+        print(scheduler.format_stats())
+        raw_log.close()
+        if bus:
+            bus.close()
+            print("I2Cバスをクローズしました。")
 
-    if humidity > 100.0: humidity = 100.0
-    elif humidity < 0.0: humidity = 0.0
-    return humidity
+def run_burst_logging(duration=BURST_DURATION):
+    """バーストモード: プロファイルの最大レートで duration 秒間計測し、終わってからまとめて書き出す
 
-def read_raw_data():
+    計測中は生データ (8バイト) と時刻をあらかじめ確保した配列に入れるだけで、
+    補正計算・表示・ファイルへの書き込みは計測が終わってから1回で行います。
+    ノーマルモードのプロファイルでは、計測周期に合わせて最新の計測値を読み出します。
+    """
+    read_block = block_reader(bus, I2C_ADDRESS, reader)
+    # フォースドモードでは1回の読み出しに計測待ちとI2C通信が含まれるので、
+    # 実測した読み出し時間より短い間隔にはしない
     try:
-        block = bus.read_i2c_block_data(I2C_ADDRESS, 0xF7, 8)
-        pres_raw = (block[0] << 12) | (block[1] << 4) | (block[2] >> 4)
-        temp_raw = (block[3] << 12) | (block[4] << 4) | (block[5] >> 4)
-        hum_raw  = (block[6] << 8)  |  block[7]
-        return temp_raw, pres_raw, hum_raw
+        latency = measure_latency(read_block, 5)
     except IOError as e:
-        print(f"エラー: I2Cブロックデータ読み込み失敗: {e}")
-        return None, None, None
+        print(f"エラー: I2C読み込み失敗: {e}")
+        if bus: bus.close()
+        return
+    interval = max(min_interval(profile), latency['max_ms'] / 1000)
+    capacity = int(duration / interval) + 1
+    timestamps = array('d', bytes(8 * capacity))
+    blocks = bytearray(DATA_LENGTH * capacity)
+    count = failures = 0
+
+    print(f"\nバースト測定を開始します。測定時間: {duration}秒, 測定間隔: {interval * 1000:.2f} ms "
+          f"(最大 {capacity} サンプル)")
+    started_at = datetime.now()
+    # 少し遅れた予定はすぐに続けて実行し、max_catchup 回分を超えて遅れた予定だけを飛ばす
+    scheduler = PeriodicScheduler(interval, 'catchup')
+    started = time.perf_counter()
+    try:
+        for tick in scheduler.ticks(duration=duration):
+            try:
+                block = read_block()
+            except IOError:
+                failures += 1
+                continue
+            timestamps[count] = time.time()
+            blocks[count * DATA_LENGTH:(count + 1) * DATA_LENGTH] = bytes(block)
+            count += 1
+    except KeyboardInterrupt:
+        print("\n測定がユーザーによって中断されました。")
+    finally:
+        elapsed = time.perf_counter() - started
+        if bus:
+            bus.close()
+            print("I2Cバスをクローズしました。")
 
-def read_compensated_data():
-    temp_raw, pres_raw, hum_raw = read_raw_data()
-    if temp_raw is None:
-        return None, None, None
-    
-    temperature = compensate_T(temp_raw)
-    if temperature is None:
-        return None, None, None
-        
-    pressure = compensate_P(pres_raw)
-    humidity = compensate_H(hum_raw)
-    return temperature, pressure, humidity
+    rate = count / elapsed if elapsed > 0 else 0.0
+    print(f"取得: {count} サンプル / {elapsed:.2f} 秒 = {rate:.1f} 回/秒 "
+          f"(理論上の最大 {max_sample_rate(profile):.1f} 回/秒)")
+    print(f"飛ばした予定: {scheduler.skipped}, 遅れた予定: {scheduler.overruns}, 読み出し失敗: {failures}")
+    print(scheduler.format_stats())
+    if not count:
+        return
 
-def setup_sensor():
-    osrs_t = 1; osrs_p = 1; osrs_h = 1
-    mode = 3; t_sb = 5; filter_coeff = 0; spi3w_en = 0
-    
-    ctrl_hum_reg = osrs_h & 0x07
-    ctrl_meas_reg = (osrs_t << 5) | (osrs_p << 2) | mode
-    config_reg = (t_sb << 5) | (filter_coeff << 2) | spi3w_en
-    
-    if not write_reg(0xF2, ctrl_hum_reg): return False
-    if not write_reg(0xF4, ctrl_meas_reg): return False
-    if not write_reg(0xF5, config_reg): return False
-    
-    return True
+    # 補正計算をまとめて行い、1回で書き出す
+    rows = []
+    for i in range(count):
+        raw = decode_raw_block(blocks[i * DATA_LENGTH:(i + 1) * DATA_LENGTH])
+        temp, pres, hum = engine.compensate(*raw)
+        rows.append([datetime.fromtimestamp(timestamps[i]).isoformat(), temp, pres, hum])
+    path = OUTPUT_BURST_FILE.format(started_at)
+    try:
+        with open(path, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(CSV_HEADER)
+            writer.writerows(rows)
+            f.flush()
+            os.fsync(f.fileno())
+        print(f"データは {path} に保存されました。")
+    except IOError as e:
+        print(f"エラー: CSVファイル '{path}' に書き込めませんでした: {e}")
 
-def main():
+def setup_single_sensor():
+    """'raw' / 'burst' モード用に I2C_ADDRESS のセンサー1台を初期化する"""
     global bus
     try:
         bus = SMBus(I2C_BUS_NUMBER)
     except Exception as e:
         print(f"エラー: I2Cバスのオープンに失敗しました (バス番号 {I2C_BUS_NUMBER}): {e}")
-        return
+        return False
 
     print("BME280センサーの初期化を開始します...")
     if not setup_sensor():
         print("センサーの動作モード設定に失敗しました。")
         if bus: bus.close()
-        return
+        return False
     print("センサーの動作モード設定完了。")
 
     if not get_calib_param():
         print("補正パラメータの読み出しに失敗しました。センサー接続を確認してください。")
         if bus: bus.close()
-        return
+        return False
     print("補正パラメータ読み出し完了。")
+    print(f"計測プロファイル: {latency_report(profile, block_reader(bus, I2C_ADDRESS, reader))}")
+    return True
 
+def open_outputs(sensor_id, separate, writer_options):
+    """センサー1台分の書き込み先と集計値ストアを開く (separate なら保存先をセンサーごとに分ける)"""
+    path = (lambda p: sensor_path(p, sensor_id)) if separate else (lambda p: p)
+    if LOG_MODE == 'partitioned':
+        writer = PartitionedLogWriter(path(OUTPUT_PARTITION_DIR), PARTITION_PERIOD, **writer_options)
+        print(f"[{sensor_id}] データは {path(OUTPUT_PARTITION_DIR)}/ に期間ごとに分けて保存されます。")
+    elif LOG_MODE == 'columnar':
+        writer = ColumnStoreWriter(path(OUTPUT_COLUMN_DIR), **writer_options)
+        print(f"[{sensor_id}] データは {path(OUTPUT_COLUMN_DIR)}/ に列ごとに保存されます。")
+    else:
+        # 既存のファイルには追記し、途中で途切れた最終行は切り詰める
+        writer = BufferedCSVWriter(path(OUTPUT_CSV_FILE), CSV_HEADER, **writer_options)
+        if writer.recovered_bytes:
+            print(f"警告: 途中で途切れた最終行 ({writer.recovered_bytes}バイト) を切り詰めました。")
+        print(f"[{sensor_id}] データは {path(OUTPUT_CSV_FILE)} に保存されます。")
+    return writer, RollupStore(path(ROLLUP_DIR), **writer_options)
+
+def record_reading(outputs, reading):
+    """測定値1件をセンサーの書き込み先と集計値ストアに追加する"""
+    now, temp, pres, hum = reading.timestamp, reading.temperature, reading.pressure, reading.humidity
+    timestamp_str = datetime.fromtimestamp(now).isoformat()
+    writer, rollups = outputs[reading.sensor_id]
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] {reading.sensor_id} "
+          f"T:{temp:.2f}C, P:{pres:.2f}hPa, H:{hum:.2f}% ... CSVに記録しました。")
 
     try:
-        with open(OUTPUT_CSV_FILE, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            # ヘッダー行を定義
-            writer.writerow(['timestamp', 'temperature_c', 'pressure_hpa', 'humidity_percent'])
-        print(f"データは {OUTPUT_CSV_FILE} に保存されます。")
+        if LOG_MODE == 'partitioned':
+            writer.write(now, [timestamp_str, temp, pres, hum])
+        elif LOG_MODE == 'columnar':
+            writer.write(now, (temp, pres, hum))
+        else:
+            writer.writerow([timestamp_str, temp, pres, hum])
+        rollups.add(now, (temp, pres, hum))
     except IOError as e:
-        print(f"エラー: CSVファイル '{OUTPUT_CSV_FILE}' の準備ができませんでした: {e}")
-        if bus: bus.close()
-        return
+        print(f"警告: CSVファイルへの書き込みに失敗しました ({reading.sensor_id}): {e}")
+
+def close_outputs(outputs):
+    # 書き込み先を閉じられなくても、集計中の区間は保存する
+    for writer, rollups in outputs.values():
+        try:
+            writer.close()
+        except IOError as e:
+            print(f"警告: CSVファイルのクローズに失敗しました: {e}")
+        try:
+            rollups.close()
+        except IOError as e:
+            print(f"警告: 集計値の保存に失敗しました: {e}")
+
+def run_daemon_logging(socket_path, measurement_duration, writer_options):
+    """測定デーモンから受け取った測定値を記録する (センサーは開かない)"""
+    subscriber = Subscriber(socket_path)
+    outputs = {}  # センサーID → (書き込み先, 集計値ストア) (最初の測定値を受け取ったときに開く)
+    end = time.monotonic() + measurement_duration
+    print(f"\n測定デーモン ({socket_path}) から受け取った測定値を記録します。測定時間: {measurement_duration}秒")
+    print("Ctrl+Cで中断できます。")
+    try:
+        for reading in subscriber.readings(is_running=lambda: time.monotonic() < end):
+            if reading.sensor_id not in outputs:
+                separate = len(subscriber.hello.get('sensors', [])) > 1 if subscriber.hello else True
+                outputs[reading.sensor_id] = open_outputs(reading.sensor_id, separate, writer_options)
+            record_reading(outputs, reading)
+        print("\n予定の測定時間が完了しました。")
+    except IOError as e:
+        print(f"エラー: 保存先の準備ができませんでした: {e}")
+    except KeyboardInterrupt:
+        print("\n測定がユーザーによって中断されました。")
+    finally:
+        close_outputs(outputs)
+        subscriber.close()
 
+def main():
+    global profile
+    parser = argparse.ArgumentParser(description='BME280の測定値をファイルに記録します')
+    add_profile_arguments(parser)
+    add_subscriber_arguments(parser)
+    parser.add_argument('--burst', type=float, metavar='SECONDS',
+                        help='プロファイルの最大レートで SECONDS 秒間計測し、まとめて書き出す')
+    args = parser.parse_args()
 
     measurement_duration = 3600  
     interval = 10  
-    
+    # バースト測定はプロファイルの最大レートで読むので、測定間隔の確認はしない
+    burst = args.burst or LOG_MODE == 'burst'
+    profile = profile_from_args(args, None if burst else interval)
+    writer_options = dict(flush_rows=CSV_FLUSH_ROWS,
+                          flush_interval=CSV_FLUSH_INTERVAL,
+                          fsync_interval=CSV_FSYNC_INTERVAL)
+
+    if args.daemon and (LOG_MODE in ('raw', 'burst') or args.burst):
+        # I2Cバスを使うのはデーモンだけなので、センサーを直接読む記録方法とは併用できない
+        parser.error("--daemon は raw / burst の記録 (LOG_MODE, --burst) と同時に使えません")
+    if LOG_MODE == 'raw' or args.burst or LOG_MODE == 'burst':
+        if not setup_single_sensor():
+            return
+        if LOG_MODE == 'raw':
+            run_raw_logging()
+        else:
+            run_burst_logging(args.burst or BURST_DURATION)
+        return
+    if args.daemon:
+        # 測定間隔はデーモンの設定に従い、受け取った測定値をすべて記録する
+        run_daemon_logging(args.daemon, measurement_duration, writer_options)
+        return
+
+    print("BME280センサーを検出しています...")
+    manager = SensorManager(SENSOR_BUSES, SENSOR_ADDRESSES, profile=profile, open_bus=SMBus)
+    sensors = manager.discover()
+    if not sensors:
+        print("BME280が見つかりませんでした。センサー接続を確認してください。")
+        manager.close()
+        return
+    for sensor in sensors:
+        read_block = block_reader(sensor.bus, sensor.address, sensor.reader)
+        print(f"センサー {sensor.sensor_id}: {latency_report(profile, read_block)}")
+
+    outputs = {}  # センサーID → (書き込み先, 集計値ストア)
+    try:
+        for sensor in sensors:
+            outputs[sensor.sensor_id] = open_outputs(sensor.sensor_id, len(sensors) > 1, writer_options)
+    except IOError as e:
+        print(f"エラー: 保存先の準備ができませんでした: {e}")
+        close_outputs(outputs)
+        manager.close()
+        return
+
     print(f"\nセンサーデータの測定を開始します。測定時間: {measurement_duration}秒, 測定間隔: {interval}秒")
     print("Ctrl+Cで中断できます。")
     
-    start_time_script = time.time()
+    scheduler = PeriodicScheduler(interval, SCHEDULE_POLICY)
     try:
-        while (time.time() - start_time_script) < measurement_duration:
-            loop_iter_start_time = time.time()
-            
-            temp, pres, hum = read_compensated_data()
-            
-        
-            timestamp_str = datetime.now().isoformat()
-            
-            if temp is not None and pres is not None and hum is not None:
-     
-                print(f"[{datetime.now().strftime('%H:%M:%S')}] "
-                      f"T:{temp:.2f}C, P:{pres:.2f}hPa, H:{hum:.2f}% ... CSVに記録しました。")
-
-                try:
-                    with open(OUTPUT_CSV_FILE, 'a', newline='', encoding='utf-8') as f:
-                        writer = csv.writer(f)
-                        writer.writerow([timestamp_str, temp, pres, hum])
-                except IOError as e:
-                    print(f"警告: CSVファイルへの書き込みに失敗しました: {e}")
-            else:
-                print(f"[{datetime.now().strftime('%H:%M:%S')}] データ取得に失敗しました。")
- 
-            time_to_wait = interval - (time.time() - loop_iter_start_time)
-            if time_to_wait > 0:
-                time.sleep(time_to_wait)
+        for tick in scheduler.ticks(duration=measurement_duration):
+            # 1回の予定時刻で全センサーを読む (同じバスの通信は重ならない)
+            readings = manager.read_all()
+            if len(readings) < len(sensors):
+                failed = set(outputs) - {reading.sensor_id for reading in readings}
+                print(f"[{datetime.now().strftime('%H:%M:%S')}] データ取得に失敗しました: {', '.join(sorted(failed))}")
+            for reading in readings:
+                record_reading(outputs, reading)
                 
         print("\n予定の測定時間が完了しました。")
 
     except KeyboardInterrupt:
         print("\n測定がユーザーによって中断されました。")
     finally:
-        if bus:
-            bus.close()
-            print("I2Cバスをクローズしました。")
+        print(scheduler.format_stats())
+        close_outputs(outputs)
+        manager.close()
+        print("I2Cバスをクローズしました。")
 
 if __name__ == '__main__':
     main()
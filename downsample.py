@@ -0,0 +1,76 @@
+# coding: utf-8
+
+# ---------------------------------------------------------------------------
+# 時系列の間引き
+#
+# サンプルは (時刻, 温度, 気圧, 湿度) のタプルで、どちらの方法も
+# 1つのチャンネル (既定は温度) を基準に残すサンプルを選び、タプルごと返します。
+#
+# - lttb   : Largest-Triangle-Three-Buckets。見た目の形を保ったまま間引く
+# - minmax : 区間ごとに最小値と最大値のサンプルを残す (ピークを落とさない)
+# ---------------------------------------------------------------------------
+
+CHANNEL_INDEX = {'temperature': 1, 'pressure': 2, 'humidity': 3}
+
+
+def lttb(samples, points, channel='temperature'):
+    """LTTBで points 件に間引く"""
+    n = len(samples)
+    points = max(points, 3)  # 最初と最後のサンプルは必ず残す
+    if points >= n:
+        return list(samples)
+    y = CHANNEL_INDEX[channel]
+
+    result = [samples[0]]
+    every = (n - 2) / (points - 2)
+    a = 0  # 直前に選んだサンプルの位置
+    for i in range(points - 2):
+        # 次の区間の平均 (三角形の3点目)
+        next_start = int((i + 1) * every) + 1
+        next_end = min(int((i + 2) * every) + 1, n)
+        count = next_end - next_start
+        avg_x = sum(samples[j][0] for j in range(next_start, next_end)) / count
+        avg_y = sum(samples[j][y] for j in range(next_start, next_end)) / count
+
+        # 現在の区間から三角形の面積が最大になるサンプルを選ぶ
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        ax, ay = samples[a][0], samples[a][y]
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs((ax - avg_x) * (samples[j][y] - ay) - (ax - samples[j][0]) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        result.append(samples[best])
+        a = best
+    result.append(samples[-1])
+    return result
+
+
+def minmax(samples, points, channel='temperature'):
+    """区間ごとの最小値・最大値のサンプルを残して約 points 件に間引く"""
+    n = len(samples)
+    if points >= n:
+        return list(samples)
+    y = CHANNEL_INDEX[channel]
+    buckets = max(points // 2, 1)
+    result = []
+    for b in range(buckets):
+        start = b * n // buckets
+        end = (b + 1) * n // buckets
+        if start >= end:
+            continue
+        lo = hi = start
+        for j in range(start + 1, end):
+            v = samples[j][y]
+            if v < samples[lo][y]:
+                lo = j
+            if v > samples[hi][y]:
+                hi = j
+        # 時刻順に並べる
+        for j in sorted({lo, hi}):
+            result.append(samples[j])
+    return result
+
+
+METHODS = {'lttb': lttb, 'minmax': minmax}
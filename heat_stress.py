@@ -0,0 +1,227 @@
+# coding: utf-8
+
+# ---------------------------------------------------------------------------
+# 暑さ指数 (WBGT) と熱指数 (Heat Index) の計算
+#
+# - WBGT (屋内の推定値): 日射のない屋内では黒球温度 ≒ 気温として
+#     WBGT = 0.7 × 湿球温度 + 0.3 × 気温
+#   湿球温度は乾湿計の式 e = es(Tw) - γ·P·(Ta - Tw) をニュートン法で解いて求めます
+#   (es: Tetens の飽和水蒸気圧, γ: 通風乾湿計の乾湿計定数, P: 気圧)。
+# - 熱指数: 米国気象局 (NWS) の Rothfusz の回帰式 (26.7℃未満は Steadman の簡易式)
+# - 危険度: 日本生気象学会「日常生活における熱中症予防指針」の WBGT の区分
+#     31以上 危険 / 28以上 厳重警戒 / 25以上 警戒 / 25未満 注意
+#
+# 測定のたびに呼ぶ処理 (アラート・API) 向けに、気温 × 湿度の格子で前計算した表
+# (HeatStressTable) を用意し、双線形補間で引きます (assess)。表は気圧を固定して作るので、
+# 気圧による違い (50hPa で WBGT 約0.1℃) が必要なら wbgt_indoor() で正確に計算してください。
+# 補間の誤差は WBGT で 0.002℃ 未満です。熱指数は NWS の式が簡易式で 80°F (約26.7℃) になる所で
+# 回帰式に切り替わり不連続なので、その境目を挟む格子 (25〜27℃付近) では最大0.8℃ほどなめらかに
+# なります (他は 0.1℃ 未満)。
+# 欠測などで気温・湿度・WBGT が NaN のときは危険度を付けません (assess・risk_level は None, risk_level_batch は -1)。
+# 記録済みの系列はNumPy版 (assess_batch) でまとめて計算できます (NumPyが必要)。
+# ---------------------------------------------------------------------------
+
+import math
+from bisect import bisect_right
+from collections import namedtuple
+
+STANDARD_PRESSURE = 1013.25  # 気圧を指定しないときの気圧 (hPa)
+PSYCHROMETER_CONSTANT = 0.000662  # 通風乾湿計の乾湿計定数 (1/℃)
+
+# 前計算する表の範囲と間隔 (範囲外は毎回計算する)
+TABLE_TEMP_RANGE = (-10.0, 50.0)
+TABLE_TEMP_STEP = 0.5
+TABLE_HUMI_STEP = 1.0
+
+# level: 0 (注意) 〜 3 (危険), name: 区分, min_wbgt: この区分になる WBGT の下限 (℃), advice: 生活活動の目安
+RiskLevel = namedtuple('RiskLevel', ['level', 'name', 'min_wbgt', 'advice'])
+
+RISK_LEVELS = (
+    RiskLevel(0, '注意', None, '一般に危険性は少ないが、激しい運動や重労働時には発生する危険性がある'),
+    RiskLevel(1, '警戒', 25.0, '運動や激しい作業をする際は、定期的に充分に休息を取り入れる'),
+    RiskLevel(2, '厳重警戒', 28.0, '外出時は炎天下を避け、室内では室温の上昇に注意する'),
+    RiskLevel(3, '危険', 31.0, '高齢者においては安静状態でも発生する危険性が大きい。外出はなるべく避け、涼しい室内に移動する'),
+)
+_RISK_BOUNDS = [level.min_wbgt for level in RISK_LEVELS[1:]]
+
+# wbgt / heat_index: ℃, risk: RiskLevel
+Assessment = namedtuple('Assessment', ['wbgt', 'heat_index', 'risk'])
+
+
+def saturation_vapor_pressure(temp):
+    """飽和水蒸気圧 (hPa, Tetens の式)"""
+    return 6.1078 * 10.0 ** (7.5 * temp / (temp + 237.3))
+
+
+def wet_bulb_temperature(temp, humidity, pressure=STANDARD_PRESSURE):
+    """気温 (℃)・相対湿度 (%)・気圧 (hPa) から湿球温度 (℃) を求める"""
+    humidity = min(max(humidity, 0.0), 100.0)
+    vapor = humidity / 100.0 * saturation_vapor_pressure(temp)
+    gamma = PSYCHROMETER_CONSTANT * pressure
+    wet = temp  # 湿度100%の解から始めると、下に凸の関数なので単調に収束する
+    for _ in range(20):
+        es = saturation_vapor_pressure(wet)
+        f = es - gamma * (temp - wet) - vapor
+        df = es * math.log(10.0) * 7.5 * 237.3 / (wet + 237.3) ** 2 + gamma
+        step = f / df
+        wet -= step
+        if abs(step) < 1e-6:
+            break
+    return wet
+
+
+def wbgt_indoor(temp, humidity, pressure=STANDARD_PRESSURE):
+    """屋内 (日射なし) の WBGT の推定値 (℃)"""
+    return 0.7 * wet_bulb_temperature(temp, humidity, pressure) + 0.3 * temp
+
+
+def heat_index(temp, humidity):
+    """熱指数 (℃, NWS の式)"""
+    t = temp * 1.8 + 32.0
+    rh = min(max(humidity, 0.0), 100.0)
+    # Steadman の簡易式。80°F 以上になる場合だけ Rothfusz の回帰式に切り替える
+    hi = 0.5 * (t + 61.0 + (t - 68.0) * 1.2 + rh * 0.094)
+    if hi >= 80.0:
+        hi = (-42.379 + 2.04901523 * t + 10.14333127 * rh - 0.22475541 * t * rh
+              - 0.00683783 * t * t - 0.05481717 * rh * rh + 0.00122874 * t * t * rh
+              + 0.00085282 * t * rh * rh - 0.00000199 * t * t * rh * rh)
+        if rh < 13.0 and 80.0 <= t <= 112.0:
+            hi -= (13.0 - rh) / 4.0 * math.sqrt((17.0 - abs(t - 95.0)) / 17.0)
+        elif rh > 85.0 and 80.0 <= t <= 87.0:
+            hi += (rh - 85.0) / 10.0 * (87.0 - t) / 5.0
+    return (hi - 32.0) / 1.8
+
+
+def risk_level(wbgt):
+    """WBGT (℃) の危険度の区分 (NaN など有限の値でなければ None)"""
+    if not math.isfinite(wbgt):
+        return None
+    return RISK_LEVELS[bisect_right(_RISK_BOUNDS, wbgt)]
+
+
+class HeatStressTable:
+    """気温 × 湿度の格子で前計算した WBGT・熱指数の表 (双線形補間で引く)"""
+
+    def __init__(self, pressure=STANDARD_PRESSURE, temp_range=TABLE_TEMP_RANGE,
+                 temp_step=TABLE_TEMP_STEP, humi_step=TABLE_HUMI_STEP):
+        self.pressure = pressure
+        self.t_min, self.t_max = temp_range
+        self.temp_step = temp_step
+        self.humi_step = humi_step
+        self.nt = int(round((self.t_max - self.t_min) / temp_step)) + 1
+        self.nh = int(round(100.0 / humi_step)) + 1
+        self._t_scale = 1.0 / temp_step
+        self._h_scale = 1.0 / humi_step
+
+        # 気温ごとに湿度の行を並べた1次元のリスト (添字 = 気温の番号 × nh + 湿度の番号)
+        self.wbgt = []
+        self.heat_index = []
+        for i in range(self.nt):
+            temp = self.t_min + i * temp_step
+            for j in range(self.nh):
+                humi = min(j * humi_step, 100.0)
+                self.wbgt.append(wbgt_indoor(temp, humi, pressure))
+                self.heat_index.append(heat_index(temp, humi))
+
+    def lookup(self, temp, humidity):
+        """(WBGT, 熱指数) を返す (表の範囲外の気温は正確に計算する。欠測 (NaN) なら両方 NaN)"""
+        if not (math.isfinite(temp) and math.isfinite(humidity)):
+            return math.nan, math.nan
+        x = (temp - self.t_min) * self._t_scale
+        if not 0.0 <= x <= self.nt - 1:
+            return wbgt_indoor(temp, humidity, self.pressure), heat_index(temp, humidity)
+        y = min(max(humidity, 0.0), 100.0) * self._h_scale
+        i = min(int(x), self.nt - 2)
+        j = min(int(y), self.nh - 2)
+        fx = x - i
+        fy = y - j
+        k = i * self.nh + j
+        k2 = k + self.nh
+        w = self.wbgt
+        a = w[k] + (w[k + 1] - w[k]) * fy
+        b = w[k2] + (w[k2 + 1] - w[k2]) * fy
+        h = self.heat_index
+        c = h[k] + (h[k + 1] - h[k]) * fy
+        d = h[k2] + (h[k2 + 1] - h[k2]) * fy
+        return a + (b - a) * fx, c + (d - c) * fx
+
+    def assess(self, temp, humidity):
+        wbgt, hi = self.lookup(temp, humidity)
+        return Assessment(wbgt, hi, risk_level(wbgt))
+
+
+_default_table = None
+
+
+def default_table():
+    """標準気圧の表 (最初に使うときに作る)"""
+    global _default_table
+    if _default_table is None:
+        _default_table = HeatStressTable()
+    return _default_table
+
+
+def assess(temp, humidity):
+    """測定値1件の WBGT・熱指数・危険度 (標準気圧の表を補間する)"""
+    return default_table().assess(temp, humidity)
+
+
+# --- NumPy版 (記録済みの系列向け) ---
+
+def wet_bulb_batch(temp, humidity, pressure=STANDARD_PRESSURE, iterations=8):
+    """wet_bulb_temperature の配列版 (pressure は配列でもよい)"""
+    import numpy as np
+
+    temp = np.asarray(temp, dtype=np.float64)
+    humidity = np.clip(np.asarray(humidity, dtype=np.float64), 0.0, 100.0)
+    pressure = np.asarray(pressure, dtype=np.float64)
+    vapor = humidity / 100.0 * saturation_vapor_pressure(temp)
+    gamma = PSYCHROMETER_CONSTANT * pressure
+    wet = temp.copy()
+    for _ in range(iterations):
+        es = saturation_vapor_pressure(wet)
+        f = es - gamma * (temp - wet) - vapor
+        df = es * (math.log(10.0) * 7.5 * 237.3) / (wet + 237.3) ** 2 + gamma
+        wet = wet - f / df
+    return wet
+
+
+def wbgt_batch(temp, humidity, pressure=STANDARD_PRESSURE):
+    """wbgt_indoor の配列版"""
+    import numpy as np
+
+    return 0.7 * wet_bulb_batch(temp, humidity, pressure) + 0.3 * np.asarray(temp, dtype=np.float64)
+
+
+def heat_index_batch(temp, humidity):
+    """heat_index の配列版"""
+    import numpy as np
+
+    t = np.asarray(temp, dtype=np.float64) * 1.8 + 32.0
+    rh = np.clip(np.asarray(humidity, dtype=np.float64), 0.0, 100.0)
+    simple = 0.5 * (t + 61.0 + (t - 68.0) * 1.2 + rh * 0.094)
+    hi = (-42.379 + 2.04901523 * t + 10.14333127 * rh - 0.22475541 * t * rh
+          - 0.00683783 * t * t - 0.05481717 * rh * rh + 0.00122874 * t * t * rh
+          + 0.00085282 * t * rh * rh - 0.00000199 * t * t * rh * rh)
+    dry = (rh < 13.0) & (t >= 80.0) & (t <= 112.0)
+    with np.errstate(invalid='ignore'):
+        hi = np.where(dry, hi - (13.0 - rh) / 4.0 * np.sqrt((17.0 - np.abs(t - 95.0)) / 17.0), hi)
+    humid = (rh > 85.0) & (t >= 80.0) & (t <= 87.0)
+    hi = np.where(humid, hi + (rh - 85.0) / 10.0 * (87.0 - t) / 5.0, hi)
+    hi = np.where(simple >= 80.0, hi, simple)
+    return (hi - 32.0) / 1.8
+
+
+def risk_level_batch(wbgt):
+    """WBGT の配列から危険度の番号 (RISK_LEVELS の添字, 有限の値でなければ -1) の配列を返す"""
+    import numpy as np
+
+    wbgt = np.asarray(wbgt, dtype=np.float64)
+    levels = np.searchsorted(np.array(_RISK_BOUNDS), wbgt, side='right')
+    return np.where(np.isfinite(wbgt), levels, -1)
+
+
+def assess_batch(temp, humidity, pressure=STANDARD_PRESSURE):
+    """(WBGT, 熱指数, 危険度の番号 (不明は -1)) の配列を返す"""
+    wbgt = wbgt_batch(temp, humidity, pressure)
+    return wbgt, heat_index_batch(temp, humidity), risk_level_batch(wbgt)
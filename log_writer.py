@@ -0,0 +1,120 @@
+# coding: utf-8
+
+# ---------------------------------------------------------------------------
+# バッファ付きCSVログライター
+#
+# ファイルを開いたままにして行をメモリに溜め、行数または経過時間で
+# まとめて書き込みます。fsyncは別の間隔で行い、SDカードへの書き込み回数を抑えます。
+#
+# 起動時の復旧:
+# - 既存のファイルには追記します (ヘッダーは新規ファイルのときだけ書き込みます)。
+# - 停電などで最終行が途中までしか書かれていない場合は、その行を切り詰めてから追記します。
+# ---------------------------------------------------------------------------
+
+import csv
+import io
+import os
+import time
+
+
+def truncate_torn_line(path):
+    """最終行が改行で終わっていなければ、直前の改行まで切り詰める
+
+    切り詰めたバイト数を返します。
+    """
+    try:
+        f = open(path, 'r+b')
+    except FileNotFoundError:
+        return 0
+    with f:
+        size = f.seek(0, os.SEEK_END)
+        if size == 0:
+            return 0
+        f.seek(size - 1)
+        if f.read(1) == b'\n':
+            return 0
+
+        # 後ろから改行を探す
+        pos = size
+        block = 4096
+        keep = 0
+        while pos > 0:
+            start = max(0, pos - block)
+            f.seek(start)
+            chunk = f.read(pos - start)
+            idx = chunk.rfind(b'\n')
+            if idx >= 0:
+                keep = start + idx + 1
+                break
+            pos = start
+        f.truncate(keep)
+        return size - keep
+
+
+class BufferedCSVWriter:
+    """開いたままのファイルに行をバッファしてまとめて書き込むCSVライター
+
+    flush_rows     : この行数が溜まったら書き込む
+    flush_interval : 前回の書き込みからこの秒数が経ったら書き込む
+    fsync_interval : 前回のfsyncからこの秒数が経ったら書き込み後にfsyncする (0で毎回)
+    """
+
+    def __init__(self, path, header, flush_rows=30, flush_interval=60.0, fsync_interval=600.0):
+        self.path = path
+        self.header = list(header)
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.fsync_interval = fsync_interval
+        self.recovered_bytes = truncate_torn_line(path)
+
+        self.file = open(path, 'a', newline='', encoding='utf-8')
+        if self.file.tell() == 0:
+            csv.writer(self.file).writerow(self.header)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+
+        self._rows = []
+        self._last_flush = time.monotonic()
+        self._last_fsync = self._last_flush
+
+    def writerow(self, row):
+        """1行をバッファに追加し、必要に応じて書き込む"""
+        self._rows.append(row)
+        self.maybe_flush()
+
+    def maybe_flush(self):
+        """書き込み条件を満たしていれば書き込む"""
+        if not self._rows:
+            return
+        if len(self._rows) >= self.flush_rows or \
+                time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self, sync=False):
+        """バッファの行を書き込む (sync=True または fsync間隔経過でfsyncも行う)"""
+        now = time.monotonic()
+        if self._rows:
+            # 1回のwriteで書き込めるよう、先に文字列にまとめる
+            buf = io.StringIO(newline='')
+            csv.writer(buf).writerows(self._rows)
+            self.file.write(buf.getvalue())
+            self._rows.clear()
+            self.file.flush()
+        self._last_flush = now
+        if sync or now - self._last_fsync >= self.fsync_interval:
+            os.fsync(self.file.fileno())
+            self._last_fsync = now
+
+    def close(self):
+        if self.file.closed:
+            return
+        try:
+            self.flush(sync=True)
+        finally:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
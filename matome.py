@@ -5,17 +5,19 @@
 #
 # 機能:
 # 1. 10分おきに温度と湿度を測定します。
-# 2. 設定したしきい値を超えた場合、熱中症の危険を検知します。
+# 2. 設定したルール (温度の平均・湿度・暑さ指数 WBGT など) の条件を満たした場合、熱中症の危険を検知します。
 # 3. 危険を検知した際に、Gmailで指定したアドレスにアラートメールを送信します。
 # 4. 危険を検知した際に、LINEで指定したユーザーにアラートメッセージを送信します。
-# 5. メールの送りすぎを防ぐため、通知は危険状態になった最初の1回のみ送信します。
-#    （一度、平常な状態に戻ると、再度通知するようになります）
+# 5. メールの送りすぎを防ぐため、通知はセンサーごとに危険状態になった最初の1回のみ送信します。
+#    （しきい値より少し下がった状態がしばらく続くと平常に戻り、再度通知するようになります）
+# 6. 複数のセンサーで続けて検知した場合は、一定時間ごとに1通にまとめて送信します。
 #
 # ---------------------------------------------------------------------------
 
 
 # 必要なライブラリをインポート
-import smtplib
+import argparse
+import logging
 import time
 import os # 環境変数を読み込むために追加
 from datetime import datetime
@@ -23,6 +25,19 @@ from email.mime.text import MIMEText
 from email.header import Header
 from smbus2 import SMBus
 
+from acquisition_daemon import Subscriber, add_subscriber_arguments
+from alert_engine import (TRIGGERED, AlertDigest, AlertEngine, alert_sensors, format_alert_details,
+                          format_time, make_alert, measure_values, numeric_fields, rules_cleared,
+                          rules_matched)
+from bme280_calib import load_calibration
+from bme280_compensation import CompensationEngine
+from bme280_profiles import (add_profile_arguments, apply_profile, block_reader, latency_report,
+                             profile_from_args, select_profile)
+from notifier import Channel, NotificationDispatcher, outbox_path
+from rule_engine import Rule, RuleEngine, load_rules
+from sensor_manager import make_sensor_id
+from smtp_transport import SMTPTransport
+
 # LINE通知のために追加するライブラリ (line-bot-sdk v3.0.0以降に対応)
 from linebot.v3.messaging import MessagingApi, PushMessageRequest, TextMessage
 # LineBotApi および linebot.models.TextSendMessage はv3で非推奨または別の場所に移りました
@@ -56,102 +71,71 @@ LINE_USER_ID_TO_SEND = os.getenv('LINE_USER_ID_TO_SEND', '') # 環境変数が
 # LINE Bot APIの初期化
 line_bot_api = None # 後ほどmain関数内で初期化します
 
-# -- 熱中症アラートの条件設定 --
-# 条件1: または、条件2: のいずれかを満たした場合に「危険」と判断
-# 条件1: 温度がこの値を超えたら危険
-TEMP_THRESHOLD_DANGER = 31.0
-# 条件2: 温度がこの値を超え、かつ湿度がこの値を超えたら危険
-TEMP_THRESHOLD_WARNING = 28.0
-HUMI_THRESHOLD_WARNING = 75.0
+# -- 通知の送信に関する設定 (notifier.py 参照) --
+# 送信は別スレッドで行い、失敗したら間隔を延ばしながら再送します。
+# 送り終わるまでは notification_outbox_matome.json に残るので、再起動しても送り直します。
+EMAIL_TIMEOUT = 20  # Gmail送信1回の制限時間 (秒)
+LINE_TIMEOUT = 10   # LINE送信1回の制限時間 (秒)
+
+# -- 熱中症アラートの条件設定 (rule_engine.py 参照) --
+# いずれかのルールの条件を満たしたら「危険」、すべてのルールの解除の条件 (clear) を満たしたら「平常」と判断します。
+# 解除の条件はしきい値より少し下げてあり、しきい値付近で値が上下しても通知を繰り返しません。
+# --rules 引数で、同じ形式のルールを書いたJSONファイルを読み込むこともできます。
+ALERT_RULES = [
+    # 温度が31℃以上
+    Rule('高温', 'temperature >= 31', clear='temperature < 30'),
+    # 直近15分の平均温度が28℃以上で、湿度が75%以上
+    Rule('高温多湿', 'mean(temperature, 15m) >= 28 and humidity >= 75',
+         clear='mean(temperature, 15m) < 27 or humidity < 70'),
+    # 暑さ指数 (WBGT, 屋内の推定値, heat_stress.py 参照) が28以上 (日本生気象学会の指針の「厳重警戒」)
+    Rule('暑さ指数', 'wbgt >= 28', clear='wbgt < 27'),
+    # 気圧の急な低下も通知する場合 (3時間で3hPa以上):
+    # Rule('気圧の急低下', 'delta(pressure, 3h) <= -3', clear='delta(pressure, 3h) > -2'),
+]
+
+# -- アラートの解除とまとめ送信の設定 (alert_engine.py 参照) --
+ALERT_HOLD_SECONDS = 0        # 危険な状態がこの秒数続いたら通知する (0 なら最初の測定で通知)
+CLEAR_HOLD_SECONDS = 1800     # 解除の条件がこの秒数続いたら平常に戻す
+DIGEST_WINDOW_SECONDS = 1800  # 通知はこの秒数に1通まで (その間に検知したセンサーは次の1通にまとめる)
 
 # -- 監視間隔の設定 --
 INTERVAL_SECONDS = 600  # 測定間隔を秒で指定 (600秒 = 10分)
+# 計測プロファイル (オーバーサンプリング・IIRフィルタ・待機時間, bme280_profiles.py 参照)
+# --profile 引数または環境変数 BME280_PROFILE で選ぶ
+# (既定 'weather': 測定のたびに1回だけ計測するので、10分おきの測定ではセンサーを休ませておける)
+
+# -- 測定デーモン (acquisition_daemon.py) から受け取る場合の設定 (--daemon 引数) --
+ALERT_SENSOR_ID = None  # 監視するセンサーのID (例: '1-77'。None ならすべてのセンサー)
+DAEMON_MAX_AGE = 60     # これより古い測定値 (秒) は使わない (デーモンが止まっている場合)
 
 # グローバル変数
 bus = None
-digT, digP, digH = [], [], []
-t_fine = 0.0
+engine = None  # 補正計算エンジン (get_calib_param で生成)
+profile = None  # 計測プロファイル (main で選択)
+reader = None  # フォースドモードの読み出し (setup_sensor で生成)
+subscriber = None  # 測定デーモンの購読 (--daemon 指定時。センサーは開かない)
+dispatcher = None  # 通知の送信スレッド (main で開始)
+email_transport = SMTPTransport(SMTP_SERVER, SMTP_PORT, SENDER_EMAIL, SENDER_PASSWORD,
+                               timeout=EMAIL_TIMEOUT)  # 最初の送信時に接続
 
 # --- BME280センサー制御関数群 ---
 # 低レベルのI2C通信や補正計算を行うための関数です。
 
-def write_reg(reg_address, data):
-    """I2Cバスに1バイト書き込む"""
-    if bus is None: return False
-    try:
-        bus.write_byte_data(I2C_ADDRESS, reg_address, data)
-        return True
-    except IOError as e:
-        print(f"エラー: I2C書き込み失敗: {e}")
-        return False
-
-def read_byte_data(reg_address):
-    """I2Cバスから符号なし1バイト読み込む"""
-    if bus is None: return None
-    try:
-        return bus.read_byte_data(I2C_ADDRESS, reg_address)
-    except IOError as e:
-        print(f"エラー: I2C読み込み失敗: {e}")
-        return None
-
-def read_word_data(reg_address, signed=False):
-    """I2Cバスから2バイト読み込む"""
-    lsb = read_byte_data(reg_address)
-    msb = read_byte_data(reg_address + 1)
-    if lsb is None or msb is None: return None
-    
-    value = (msb << 8) | lsb
-    if signed and value & 0x8000:
-        value -= 65536
-    return value
-
 def get_calib_param():
-    """センサーから補正パラメータを読み出す"""
-    global digT, digP, digH
-    digT.append(read_word_data(0x88))
-    digT.append(read_word_data(0x8A, signed=True))
-    digT.append(read_word_data(0x8C, signed=True))
-
-    digP.append(read_word_data(0x8E))
-    for i in range(8):
-        digP.append(read_word_data(0x90 + i * 2, signed=True))
-    
-    digH.append(read_byte_data(0xA1))
-    digH.append(read_word_data(0xE1, signed=True))
-    digH.append(read_byte_data(0xE3))
-    e4 = read_byte_data(0xE4)
-    e5 = read_byte_data(0xE5)
-    e6 = read_byte_data(0xE6)
-    digH.append((e4 << 4) | (e5 & 0x0F))
-    digH.append((e6 << 4) | (e5 >> 4))
-    e7 = read_byte_data(0xE7)
-    if e7 > 127: e7 -= 256
-    digH.append(e7)
-    
-    if None in digT or None in digP or None in digH:
-        return False
+    """センサーから補正パラメータを読み出す (ブロック読み込み + キャッシュ)"""
+    global engine
+    calib = load_calibration(bus, I2C_ADDRESS, I2C_BUS_NUMBER)
+    if calib is None: return False
+    engine = CompensationEngine(calib)
     return True
 
-def compensate_T(adc_T):
-    """温度を生データから計算"""
-    global t_fine
-    v1 = (adc_T / 16384.0 - digT[0] / 1024.0) * digT[1]
-    v2 = ((adc_T / 131072.0 - digT[0] / 8192.0)**2) * digT[2]
-    t_fine = v1 + v2
-    return t_fine / 5120.0
-
-def compensate_H(adc_H):
-    """湿度を生データから計算"""
-    h = t_fine - 76800.0
-    h = (adc_H - (digH[3] * 64.0 + digH[4] / 16384.0 * h)) * \
-        (digH[1] / 65536.0 * (1.0 + digH[5] / 67108864.0 * h * (1.0 + digH[2] / 67108864.0 * h)))
-    h = h * (1.0 - digH[0] * h / 524288.0)
-    return max(0.0, min(100.0, h))
-
 def read_raw_data():
     """センサーから8バイトの生データを一括で読み込む"""
     try:
-        data = bus.read_i2c_block_data(I2C_ADDRESS, 0xF7, 8)
+        if reader is not None:
+            data = reader.read_block()  # 計測を開始し、終わったのを確認してから読み出す
+        else:
+            data = bus.read_i2c_block_data(I2C_ADDRESS, 0xF7, 8)
         pres_raw = (data[0] << 12) | (data[1] << 4) | (data[2] >> 4)
         temp_raw = (data[3] << 12) | (data[4] << 4) | (data[5] >> 4)
         hum_raw = (data[6] << 8) | data[7]
@@ -162,129 +146,162 @@ def read_raw_data():
 
 def read_compensated_data():
     """補正計算済みの温湿度データを取得する"""
-    temp_raw, _, hum_raw = read_raw_data()
+    temp_raw, pres_raw, hum_raw = read_raw_data()
     if temp_raw is None or hum_raw is None:
-        return None, None
+        return None, None, None
     
-    temp = compensate_T(temp_raw)
-    humi = compensate_H(hum_raw)
-    return temp, humi
+    return engine.compensate(temp_raw, pres_raw, hum_raw)
+
+def read_sensors():
+    """監視するセンサーごとの (センサーID, 温度, 気圧, 湿度) のリスト (取得できなければ空)"""
+    if subscriber is not None:
+        return [(r.sensor_id, r.temperature, r.pressure, r.humidity)
+                for r in subscriber.latest_readings(ALERT_SENSOR_ID, max_age=DAEMON_MAX_AGE)]
+    temp, pres, humi = read_compensated_data()
+    if temp is None or humi is None:
+        return []
+    return [(make_sensor_id(I2C_BUS_NUMBER, I2C_ADDRESS), temp, pres, humi)]
 
 def setup_sensor():
-    """センサーの動作モードを設定する"""
-    if not write_reg(0xF2, 1): return False  # Humidity oversampling x1
-    if not write_reg(0xF4, 0x27): return False # Temp/Press oversampling x1, Normal mode
-    return True
+    """センサーを計測プロファイル (オーバーサンプリング・フィルタ・待機時間) の設定にする"""
+    global profile, reader
+    profile = profile or select_profile()
+    try:
+        reader = apply_profile(bus, I2C_ADDRESS, profile)
+        return True
+    except IOError as e:
+        print(f"エラー: I2C書き込み失敗 (アドレス {hex(I2C_ADDRESS)}): {e}")
+        reader = None
+        return False
 
 # --- Gmail送信関数 ---
-def send_alert_email(temp, humi):
-    """熱中症警戒アラートのメールを送信する"""
-    # SENDER_EMAILやSENDER_PASSWORDが設定されているかチェック
-    if not SENDER_EMAIL or not SENDER_PASSWORD or not RECEIVER_EMAIL:
-        print("Gmailの認証情報が設定されていません。Gmailアラートはスキップします。")
-        return
-
-    subject = "【熱中症アラート】危険な温湿度を検知しました！"
+def send_alert_email(alert, timeout):
+    """熱中症警戒アラートのメールを送信する (失敗したら例外。再送は notifier が行う)"""
+    count = len(alert_sensors(alert))
+    place = f"{count}か所で" if count > 1 else ""
+    subject = f"【熱中症アラート】{place}危険な温湿度を検知しました！"
     body = f"""熱中症の危険性が高い環境を検知しました。
 直ちにエアコンの使用や水分補給などの対策を行ってください。
 
 ---
-検知時刻: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
-現在の温度: {temp:.2f} ℃
-現在の湿度: {humi:.2f} %
+{format_alert_details(alert)}
 ---
 """
-    try:
-        msg = MIMEText(body, 'plain', 'utf-8')
-        msg['Subject'] = Header(subject, 'utf-8')
-        msg['From'] = SENDER_EMAIL
-        msg['To'] = RECEIVER_EMAIL
+    msg = MIMEText(body, 'plain', 'utf-8')
+    msg['Subject'] = Header(subject, 'utf-8')
+    msg['From'] = SENDER_EMAIL
+    msg['To'] = RECEIVER_EMAIL
 
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-            server.starttls()
-            server.login(SENDER_EMAIL, SENDER_PASSWORD)
-            server.send_message(msg)
-        print(f"[{datetime.now().strftime('%H:%M:%S')}] >> Gmailアラートの送信に成功しました。")
-
-    except Exception as e:
-        print(f"[{datetime.now().strftime('%H:%M:%S')}] >> エラー: Gmail送信に失敗しました: {e}")
+    # ログイン済みのセッションを使い回す (切れていれば接続し直す)
+    email_transport.send(msg, timeout)
 
 # --- LINE送信関数 ---
-def send_alert_line(temp, humi):
-    """熱中症警戒アラートをLINEで送信する"""
-    global line_bot_api # グローバル変数にアクセス
-    
-    # LINEの認証情報と送信先IDが設定されているかチェック
-    # LINE_CHANNEL_SECRETはMessagingApiの初期化には不要ですが、Bot全体のセットアップには必要です。
-    if not LINE_CHANNEL_ACCESS_TOKEN or not LINE_USER_ID_TO_SEND:
-        print("LINEの認証情報（アクセストークン）または送信先ユーザーIDが設定されていません。LINEアラートはスキップします。")
-        return
-
+def send_alert_line(alert, timeout):
+    """熱中症警戒アラートをLINEで送信する (失敗したら例外。再送は notifier が行う)"""
     alert_message = (
         f"【熱中症アラート】\n"
         f"危険な状態を検知しました！\n"
         f"直ちにエアコンの使用や水分補給などの対策を行ってください。\n\n"
-        f"--- 検知時刻: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} ---\n"
-        f"現在の温度: {temp:.2f}°C\n"
-        f"現在の湿度: {humi:.2f}%"
+        f"{format_alert_details(alert, temp_unit='°C', humi_unit='%')}"
     )
-    
+    # line-bot-sdk v3の推奨されるpush_messageの呼び出し方
+    messages_to_send = [TextMessage(text=alert_message)]
+    push_request = PushMessageRequest(to=LINE_USER_ID_TO_SEND, messages=messages_to_send)
     try:
-        # line_bot_apiが初期化されていることを確認
-        if line_bot_api:
-            # line-bot-sdk v3の推奨されるpush_messageの呼び出し方
-            messages_to_send = [TextMessage(text=alert_message)]
-            push_request = PushMessageRequest(to=LINE_USER_ID_TO_SEND, messages=messages_to_send)
-            line_bot_api.push_message(push_request)
-            print(f"[{datetime.now().strftime('%H:%M:%S')}] >> LINEアラートの送信に成功しました。")
-        else:
-            print("LINE Bot APIが初期化されていません。")
+        line_bot_api.push_message(push_request, _request_timeout=timeout)
     except Exception as e:
-        print(f"[{datetime.now().strftime('%H:%M:%S')}] >> エラー: LINEメッセージ送信に失敗しました: {e}")
         # LINE Bot APIのエラーレスポンスをより詳細に表示
         if hasattr(e, 'error_response'):
             print(f"    LINE APIエラー詳細: {e.error_response}")
+        raise
 
-
-# --- メイン処理 ---
-def main():
-    """プログラムのメイン処理"""
-    global bus
-    global line_bot_api # LINE Bot APIのグローバル変数を参照可能にする
-
-    # LINE Bot APIの初期化
-    # MessagingApiの初期化にはCHANNEL_ACCESS_TOKENのみが必要です。
-    # CHANNEL_SECRETはWebhookの署名検証などに使用されますが、このスクリプトのPush API利用には直接不要です。
-    if LINE_CHANNEL_ACCESS_TOKEN:
-        line_bot_api = MessagingApi(LINE_CHANNEL_ACCESS_TOKEN)
-        print("LINE Bot APIを初期化しました。")
-    else:
-        print("LINE Bot APIの認証情報（アクセストークン）が不足しているため、LINE通知は無効です。")
-        print("環境変数 LINE_CHANNEL_ACCESS_TOKEN を設定してください。")
+def make_dispatcher():
+    """設定済みのチャネル (Gmail / LINE) に送る通知の送信スレッドを用意する"""
+    channels = []
+    if SENDER_EMAIL and SENDER_PASSWORD and RECEIVER_EMAIL:
+        channels.append(Channel('gmail', send_alert_email, EMAIL_TIMEOUT))
+    if line_bot_api and LINE_USER_ID_TO_SEND:
+        channels.append(Channel('line', send_alert_line, LINE_TIMEOUT))
+    return NotificationDispatcher(channels, outbox_path('matome')).start()
 
 
+def init_sensor():
+    """I2Cバスを開いてセンサーを初期化する"""
+    global bus
     try:
         bus = SMBus(I2C_BUS_NUMBER)
     except Exception as e:
         print(f"エラー: I2Cバス {I2C_BUS_NUMBER} を開けませんでした: {e}")
         print("I2Cバスの有効化と接続を確認してください。")
-        return
+        return False
 
     print("センサー初期化中...")
     # センサーのセットアップと補正パラメータの読み込みを試みる
     if not setup_sensor():
         print("エラー: センサーの動作モード設定に失敗しました。接続を確認してください。")
         if bus: bus.close()
-        return
+        return False
     if not get_calib_param():
         print("エラー: センサーの補正パラメータ読み込みに失敗しました。接続を確認してください。")
         if bus: bus.close()
-        return
+        return False
 
     print("センサー初期化完了。")
+    print(f"計測プロファイル: {latency_report(profile, block_reader(bus, I2C_ADDRESS, reader))}")
+    return True
+
+def init_subscriber(socket_path):
+    """センサーを開かずに測定デーモンの購読を始める"""
+    global subscriber
+    subscriber = Subscriber(socket_path).start()
+    print(f"測定デーモン ({socket_path}) から測定値を受け取ります。")
+    if not subscriber.wait(10):
+        print("測定デーモンから測定値がまだ届いていません。届くまで再試行します。")
+
+
+# --- メイン処理 ---
+def main():
+    """プログラムのメイン処理"""
+    global profile, dispatcher
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] >> %(message)s', datefmt='%H:%M:%S')
+    parser = argparse.ArgumentParser(description='BME280で熱中症の危険を監視して通知します')
+    add_profile_arguments(parser)
+    add_subscriber_arguments(parser)
+    parser.add_argument('--rules', metavar='FILE',
+                        help='アラートのルールを書いたJSONファイル (省略時は ALERT_RULES)')
+    args = parser.parse_args()
+    profile = profile_from_args(args, INTERVAL_SECONDS)
+    try:
+        rules = load_rules(args.rules) if args.rules else ALERT_RULES
+        # 書き間違い (存在しない項目・数値でない項目を含む) は監視を始める前に知らせる
+        rule_engine = RuleEngine(rules, fields=numeric_fields())
+    except (OSError, ValueError) as e:
+        print(f"エラー: ルールを読み込めませんでした: {e}")
+        return
+    global line_bot_api # LINE Bot APIのグローバル変数を参照可能にする
+
+    # LINE Bot APIの初期化
+    # MessagingApiの初期化にはCHANNEL_ACCESS_TOKENのみが必要です。
+    # CHANNEL_SECRETはWebhookの署名検証などに使用されますが、このスクリプトのPush API利用には直接不要です。
+    if LINE_CHANNEL_ACCESS_TOKEN:
+        line_bot_api = MessagingApi(LINE_CHANNEL_ACCESS_TOKEN)
+        print("LINE Bot APIを初期化しました。")
+    else:
+        print("LINE Bot APIの認証情報（アクセストークン）が不足しているため、LINE通知は無効です。")
+        print("環境変数 LINE_CHANNEL_ACCESS_TOKEN を設定してください。")
+
+
+    if args.daemon:
+        init_subscriber(args.daemon)
+    elif not init_sensor():
+        return
     print("-" * 40)
     print(f"監視を開始します。(測定間隔: {INTERVAL_SECONDS}秒)")
-    print(f"危険判断のしきい値: {TEMP_THRESHOLD_DANGER}℃ または ({TEMP_THRESHOLD_WARNING}℃ かつ {HUMI_THRESHOLD_WARNING}%)")
+    print("危険判断のルール:")
+    for rule in rules:
+        print(f"  {rule.name}: {rule.when}" + (f" (解除: {rule.clear})" if rule.clear else ""))
+    print(f"すべてのルールの解除の条件を {CLEAR_HOLD_SECONDS}秒満たし続けたら平常に戻します。"
+          f" (通知は {DIGEST_WINDOW_SECONDS}秒に1通まで)")
     # LINE設定の確認メッセージを追加
     if LINE_CHANNEL_ACCESS_TOKEN and LINE_USER_ID_TO_SEND:
         print(f"LINE通知は有効です。送信先ユーザーID: {LINE_USER_ID_TO_SEND}")
@@ -295,37 +312,50 @@ def main():
     else:
         print("Gmail通知は無効です（認証情報が未設定）。")
 
+    dispatcher = make_dispatcher()
+    email_transport.start_keepalive()  # 送信後しばらくはセッションを保ち、続く通知をすぐに送る
+    if dispatcher.pending():
+        print(f"前回送信できなかった通知が {dispatcher.pending()} 件あります。送り直します。")
+
     print("Ctrl+Cで中断できます。")
     print("-" * 40)
 
-    is_alert_sent = False  # メール/LINEを送信済みかどうかのフラグ
+    # センサーごとにアラートの状態を持ち、検知した通知は DIGEST_WINDOW_SECONDS に1通にまとめる
+    alerts = AlertEngine(rules_matched, rules_cleared, hold_on=ALERT_HOLD_SECONDS, hold_off=CLEAR_HOLD_SECONDS)
+    digest = AlertDigest(DIGEST_WINDOW_SECONDS)
 
     try:
         while True:
-            temp, humi = read_compensated_data()
-            
-            if temp is not None and humi is not None:
-                timestamp = datetime.now().strftime('%H:%M:%S')
-                print(f"[{timestamp}] 現在値: 温度={temp:.2f}C, 湿度={humi:.2f}%")
-                
-                # 熱中症の危険性を判定
-                is_dangerous = (temp >= TEMP_THRESHOLD_DANGER) or \
-                               (temp >= TEMP_THRESHOLD_WARNING and humi >= HUMI_THRESHOLD_WARNING)
-
-                # 条件1: 危険な状態で、まだアラートを送っていなければ送信する
-                if is_dangerous and not is_alert_sent:
-                    print(f"[{timestamp}] !! 危険な状態を検知しました。アラートを送信します。")
-                    
-                    # --- ここでLINEとGmailの両方にアラートを送信 ---
-                    send_alert_email(temp, humi) # Gmail
-                    send_alert_line(temp, humi)  # LINE
-                    
-                    is_alert_sent = True  # 送信済みフラグを立て、連続送信を防ぐ
-                
-                # 条件2: 危険でない状態で、以前にアラートを送ったことがある場合
-                elif not is_dangerous and is_alert_sent:
-                    print(f"[{timestamp}] -- 平常な状態に戻りました。監視を継続します。")
-                    is_alert_sent = False # フラグをリセットし、再度通知できるようにする
+            readings = read_sensors()
+
+            if readings:
+                now = time.time()
+                timestamp = format_time(now, '%H:%M:%S')
+                for sensor_id, temp, pres, humi in readings:
+                    label = f" ({sensor_id})" if len(readings) > 1 else ""
+                    values = measure_values(temp, pres, humi)
+                    print(f"[{timestamp}] 現在値{label}: 温度={temp:.2f}C, 湿度={humi:.2f}%, "
+                          f"WBGT={values['wbgt']:.1f} ({values['risk']})")
+
+                    # ルールを評価し (直近の平均などは逐次更新)、熱中症の危険性を判定する
+                    # (危険になった・平常に戻ったときだけイベントが返る)
+                    values['rules'], values['cleared'] = rule_engine.evaluate(sensor_id, now, values)
+                    event = alerts.update(sensor_id, now, values)
+                    if event is None:
+                        continue
+                    if event.kind == TRIGGERED:
+                        print(f"[{timestamp}] !! 危険な状態を検知しました{label}: {', '.join(values['rules'])}")
+                        digest.add(event)
+                    else:
+                        print(f"[{timestamp}] -- 平常な状態に戻りました{label}。監視を継続します。")
+
+                # 前回の通知から DIGEST_WINDOW_SECONDS 経っていれば、溜まった検知を1通で送る
+                events = digest.flush(now)
+                if events:
+                    print(f"[{timestamp}] アラートを送信します。({len(events)} 件の検知)")
+                    dispatcher.notify(make_alert(events))  # 送信待ちに入れるだけで、測定は待たない
+                elif digest.pending:
+                    print(f"[{timestamp}] 直前にアラートを送信済みのため、{len(digest.pending)} 件の検知はまとめて後で送ります。")
 
             else:
                 print(f"[{datetime.now().strftime('%H:%M:%S')}] データ取得に失敗しました。5秒後に再試行します。")
@@ -338,6 +368,15 @@ def main():
     except KeyboardInterrupt:
         print("\nプログラムがユーザーによって中断されました。")
     finally:
+        if dispatcher is not None:
+            # まとめて送るために溜めていた検知は送信待ちに入れておく (送れなければ次回の起動時に送る)
+            events = digest.flush(time.time(), force=True)
+            if events:
+                dispatcher.notify(make_alert(events))
+            dispatcher.close()
+        email_transport.close()
+        if subscriber is not None:
+            subscriber.close()
         if bus:
             bus.close()
             print("I2Cバスをクローズしました。")
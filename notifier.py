@@ -0,0 +1,264 @@
+# coding: utf-8
+
+# ---------------------------------------------------------------------------
+# 通知の非同期送信 (メール・LINEなど)
+#
+# 測定ループから notify() を呼ぶと、通知を送信待ちファイル (outbox) に保存して
+# 各チャネルのキューに入れるだけで、すぐに戻ります。送信はチャネルごとのスレッドが
+# 並行して行うので、あるチャネルが遅くても測定や他のチャネルは待たされません。
+#
+#   ・チャネルごとのタイムアウト (送信関数に渡す)
+#   ・失敗したら間隔を倍にしながら再送 (最大 MAX_ATTEMPTS 回)
+#   ・全チャネルに送り終わるまで outbox に残すので、再起動しても未送信の通知を送り直す
+#     (OUTBOX_MAX_AGE 秒より古い通知は送らずに捨てる)
+#   ・キューは QUEUE_SIZE 件まで。溢れた通知はそのチャネルには送らない
+#
+# outbox はプログラムごとに分けます (outbox_path('matome') → notification_outbox_matome.json)。
+# 同じファイルを複数のプロセスで使うこともでき、その場合はファイルをロックして読み直し、
+# 自分のチャネルの送信状況だけを書き換えます (知らないチャネルの通知は残したまま送りません)。
+#
+# 使い方:
+#   dispatcher = NotificationDispatcher([Channel('gmail', send_email, 20)], outbox_path('matome'))
+#   dispatcher.start()
+#   dispatcher.notify({'temperature': 31.5, 'humidity': 60.0})  # send_email(payload, timeout) が呼ばれる
+#   dispatcher.close()
+# ---------------------------------------------------------------------------
+
+import contextlib
+import fcntl
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import namedtuple
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_DIR = os.path.dirname(os.path.abspath(__file__))  # 送信待ちの通知の保存先のディレクトリ
+OUTBOX_MAX_AGE = 24 * 60 * 60  # これより古い未送信の通知 (秒) は送らない
+QUEUE_SIZE = 100               # チャネルごとの送信待ちの上限
+MAX_ATTEMPTS = 5               # 1件あたりの送信回数の上限
+RETRY_INTERVAL = 5.0           # 最初の再送までの間隔 (秒, 失敗するたびに倍)
+MAX_RETRY_INTERVAL = 300.0     # 再送間隔の上限 (秒)
+
+# name: チャネル名, send: send(payload, timeout) 失敗したら例外を投げる関数, timeout: 1回の送信の制限時間 (秒)
+Channel = namedtuple('Channel', ['name', 'send', 'timeout'])
+
+
+def outbox_path(name):
+    """プログラム name の送信待ちファイルのパス (環境変数 BME280_OUTBOX があればそのファイル)"""
+    return os.getenv('BME280_OUTBOX') or os.path.join(OUTBOX_DIR, f"notification_outbox_{name}.json")
+
+
+class NotificationDispatcher:
+    """通知を outbox に保存し、チャネルごとのスレッドで並行して送信する"""
+
+    def __init__(self, channels, outbox_file=None, queue_size=QUEUE_SIZE,
+                 max_attempts=MAX_ATTEMPTS, retry_interval=RETRY_INTERVAL,
+                 max_retry_interval=MAX_RETRY_INTERVAL, max_age=OUTBOX_MAX_AGE):
+        self.channels = {channel.name: channel for channel in channels}
+        self.outbox_file = outbox_file
+        self.max_attempts = max_attempts
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+        self.max_age = max_age
+        self.queues = {name: queue.Queue(queue_size) for name in self.channels}
+        self.lock = threading.Lock()  # outbox の更新と保存を直列化する
+        self.outbox = {}  # 通知ID → {'payload', 'created', 'pending': [このプロセスのチャネルのうち未送信のもの]}
+        self.finished = set()  # このプロセスのチャネルには送り終えたが、ファイルには残っているかもしれない通知ID
+        self.stopping = threading.Event()
+        self.threads = []
+        self.sent = 0
+        self.failed = 0
+
+    def start(self):
+        """前回の未送信の通知を読み込み、送信スレッドを開始する
+
+        このプロセスにないチャネル宛ての通知はファイルに残したままにします (そのチャネルを持つ
+        プログラムが送ります)。
+        """
+        resent = 0
+        with self.lock:
+            try:
+                with self._locked_outbox() as stored:
+                    for alert_id, entry in stored.items():
+                        pending = [name for name in entry['pending'] if name in self.channels]
+                        if not pending:
+                            continue
+                        for name in list(pending):
+                            try:
+                                self.queues[name].put_nowait(alert_id)
+                            except queue.Full:
+                                logger.error(f"[{name}] 送信待ちが上限に達したため、古い通知を送りません")
+                                pending.remove(name)
+                        if pending:
+                            self.outbox[alert_id] = dict(entry, pending=pending)
+                            resent += 1
+                        else:
+                            self.finished.add(alert_id)
+            except OSError as e:
+                logger.warning(f"送信待ちファイルを読み込めませんでした: {e}")
+        if resent:
+            logger.info(f"前回送信できなかった通知 {resent} 件を送り直します")
+
+        for channel in self.channels.values():
+            thread = threading.Thread(target=self._worker, args=(channel,),
+                                      name=f"notifier-{channel.name}", daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        return self
+
+    def notify(self, payload):
+        """通知を送信待ちにする (ネットワークは待たない)。通知IDを返す"""
+        alert_id = uuid.uuid4().hex
+        with self.lock:
+            entry = {'payload': payload, 'created': time.time(), 'pending': list(self.channels)}
+            self.outbox[alert_id] = entry
+            for name in list(entry['pending']):
+                try:
+                    self.queues[name].put_nowait(alert_id)
+                except queue.Full:
+                    logger.error(f"[{name}] 送信待ちが上限 ({self.queues[name].maxsize} 件) に達したため、この通知は送りません")
+                    entry['pending'].remove(name)
+                    self.failed += 1
+            if not entry['pending']:
+                del self.outbox[alert_id]
+                self.finished.add(alert_id)
+            self._save_outbox()
+        return alert_id
+
+    def pending(self):
+        """送信待ちの通知の数"""
+        return len(self.outbox)
+
+    def _worker(self, channel):
+        q = self.queues[channel.name]
+        while not self.stopping.is_set():
+            try:
+                alert_id = q.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            self._deliver(channel, alert_id)
+
+    def _deliver(self, channel, alert_id):
+        with self.lock:
+            entry = self.outbox.get(alert_id)
+        if entry is None:
+            return
+        delay = self.retry_interval
+        for attempt in range(1, self.max_attempts + 1):
+            try:
+                channel.send(entry['payload'], channel.timeout)
+            except Exception as e:
+                logger.warning(f"[{channel.name}] 送信に失敗しました ({attempt}/{self.max_attempts} 回目): {e}")
+                if attempt == self.max_attempts:
+                    break
+                # 終了を指示されたら未送信のまま outbox に残す (次回の起動時に送り直す)
+                if self.stopping.wait(delay):
+                    return
+                delay = min(delay * 2, self.max_retry_interval)
+                continue
+            logger.info(f"[{channel.name}] 通知を送信しました")
+            self._finish(alert_id, channel.name, sent=True)
+            return
+        logger.error(f"[{channel.name}] {self.max_attempts} 回失敗したため、この通知の送信をあきらめます")
+        self._finish(alert_id, channel.name, sent=False)
+
+    def _finish(self, alert_id, name, sent):
+        with self.lock:
+            if sent:
+                self.sent += 1
+            else:
+                self.failed += 1
+            entry = self.outbox.get(alert_id)
+            if entry is None:
+                return
+            if name in entry['pending']:
+                entry['pending'].remove(name)
+            if not entry['pending']:
+                del self.outbox[alert_id]
+                self.finished.add(alert_id)
+            self._save_outbox()
+
+    def _read_outbox(self):
+        try:
+            with open(self.outbox_file, encoding='utf-8') as f:
+                outbox = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"送信待ちファイルを読み込めませんでした: {e}")
+            return {}
+        if not isinstance(outbox, dict):
+            return {}
+        now = time.time()
+        return {alert_id: entry for alert_id, entry in outbox.items()
+                if isinstance(entry, dict) and entry.get('pending')
+                and now - entry.get('created', 0) <= self.max_age}
+
+    @contextlib.contextmanager
+    def _locked_outbox(self):
+        """送信待ちファイルをロックし、その内容を渡す (抜けるときに自分の分を反映して保存する)"""
+        if not self.outbox_file:
+            yield {}
+            return
+        with open(f"{self.outbox_file}.lock", 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                stored = self._read_outbox()
+                yield stored
+                self._write_outbox(self._merge(stored))
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _merge(self, stored):
+        """ファイルの内容に、このプロセスのチャネルの送信状況を反映する
+
+        他のプロセスのチャネルの送信状況はファイルのものを残します。
+        """
+        merged = {}
+        for alert_id in stored.keys() | self.outbox.keys():
+            entry = stored.get(alert_id)
+            if entry is None:
+                if alert_id in self.finished:
+                    continue  # 他のチャネルも含めて送り終えた
+                entry = self.outbox[alert_id]
+            others = [name for name in entry['pending'] if name not in self.channels]
+            if alert_id in self.outbox:
+                pending = others + self.outbox[alert_id]['pending']
+            elif alert_id in self.finished:
+                pending = others
+            else:
+                pending = entry['pending']  # このプロセスが知らない通知はそのまま
+            if pending:
+                merged[alert_id] = dict(entry, pending=pending)
+        # ファイルから消えた通知は、もう覚えておく必要がない
+        self.finished &= merged.keys()
+        return merged
+
+    def _save_outbox(self):
+        if not self.outbox_file:
+            return
+        try:
+            with self._locked_outbox():
+                pass
+        except OSError as e:
+            logger.warning(f"送信待ちファイルを保存できませんでした: {e}")
+
+    def _write_outbox(self, outbox):
+        # 書き込み途中で止まっても壊れないよう、一時ファイル経由で置き換える
+        tmp_file = f"{self.outbox_file}.{os.getpid()}.tmp"
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump(outbox, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_file, self.outbox_file)
+
+    def close(self, timeout=10.0):
+        """送信スレッドを止める (送信中のものは timeout 秒まで待つ。未送信の通知は outbox に残る)"""
+        self.stopping.set()
+        deadline = time.monotonic() + timeout
+        for thread in self.threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        self.threads = []
@@ -0,0 +1,314 @@
+# coding: utf-8
+
+# ---------------------------------------------------------------------------
+# 時間単位で分割したログ (パーティション) の書き込み・圧縮・範囲検索
+#
+# ログを1時間または1日ごとのCSVファイルに分けて書き込み、manifest.json に
+# 各パーティションの期間と形式を記録します。
+# 期間が終わったパーティションはバックグラウンドで列指向の圧縮形式 (.bcol) に変換します。
+# 範囲検索では manifest を見て、期間が重なるパーティションだけを読み込みます。
+#
+# ディレクトリ構成 (例: 1時間ごと):
+#   bme280_logs/manifest.json
+#   bme280_logs/bme280_20250801_09.bcol   圧縮済み
+#   bme280_logs/bme280_20250801_10.csv    書き込み中
+# ---------------------------------------------------------------------------
+
+import csv
+import json
+import logging
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+from array import array
+from datetime import datetime, timedelta
+
+from log_writer import BufferedCSVWriter
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = 'manifest.json'
+FILE_PREFIX = 'bme280_'
+CSV_HEADER = ['timestamp', 'temperature_c', 'pressure_hpa', 'humidity_percent']
+
+# 列指向形式: マジック, ヘッダー長 (uint32), JSONヘッダー, zlib圧縮した各列
+COLUMNAR_MAGIC = b'BMECOL01'
+COLUMNAR_EXT = '.bcol'
+# 列名と array の型 (時刻はUNIX秒のfloat64、測定値はfloat32)
+COLUMNAR_COLUMNS = [('timestamp', 'd'), ('temperature_c', 'f'),
+                    ('pressure_hpa', 'f'), ('humidity_percent', 'f')]
+
+PERIODS = {
+    'hour': ('%Y%m%d_%H', timedelta(hours=1)),
+    'day': ('%Y%m%d', timedelta(days=1)),
+}
+
+
+def partition_bounds(timestamp, period):
+    """UNIX秒を含むパーティションの (名前, 開始, 終了) を返す (ローカル時刻で区切る)"""
+    name_format, length = PERIODS[period]
+    dt = datetime.fromtimestamp(timestamp)
+    if period == 'hour':
+        start = dt.replace(minute=0, second=0, microsecond=0)
+    else:
+        start = dt.replace(hour=0, minute=0, second=0, microsecond=0)
+    end = start + length
+    return FILE_PREFIX + start.strftime(name_format), start.timestamp(), end.timestamp()
+
+
+# --- 列指向形式 ---
+
+def write_columnar(path, columns):
+    """列のリスト (COLUMNAR_COLUMNS と同じ順の array) を圧縮して書き込む"""
+    blobs = [zlib.compress(col.tobytes(), 6) for col in columns]
+    header = {'rows': len(columns[0]), 'columns': []}
+    offset = 0
+    for (name, typecode), blob in zip(COLUMNAR_COLUMNS, blobs):
+        header['columns'].append({'name': name, 'type': typecode,
+                                  'offset': offset, 'length': len(blob)})
+        offset += len(blob)
+    header_bytes = json.dumps(header).encode('utf-8')
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(COLUMNAR_MAGIC)
+        f.write(struct.pack('<I', len(header_bytes)))
+        f.write(header_bytes)
+        for blob in blobs:
+            f.write(blob)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def read_columnar(path, names=None):
+    """列指向ファイルから指定した列だけを展開して {列名: array} で返す"""
+    with open(path, 'rb') as f:
+        if f.read(len(COLUMNAR_MAGIC)) != COLUMNAR_MAGIC:
+            raise ValueError(f"列指向ファイルの形式ではありません: {path}")
+        header_len, = struct.unpack('<I', f.read(4))
+        header = json.loads(f.read(header_len))
+        data_start = f.tell()
+        result = {}
+        for col in header['columns']:
+            if names is not None and col['name'] not in names:
+                continue
+            f.seek(data_start + col['offset'])
+            values = array(col['type'])
+            values.frombytes(zlib.decompress(f.read(col['length'])))
+            result[col['name']] = values
+    return result
+
+
+def compact_csv(csv_path, columnar_path):
+    """CSVパーティションを列指向形式に変換し、行数を返す"""
+    columns = [array(typecode) for _, typecode in COLUMNAR_COLUMNS]
+    with open(csv_path, 'r', newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        next(reader, None)  # ヘッダー
+        for row in reader:
+            try:
+                values = (datetime.fromisoformat(row[0]).timestamp(),
+                          float(row[1]), float(row[2]), float(row[3]))
+            except (ValueError, IndexError):
+                continue
+            for col, value in zip(columns, values):
+                col.append(value)
+    write_columnar(columnar_path, columns)
+    return len(columns[0])
+
+
+# --- manifest ---
+
+def load_manifest(base_dir):
+    try:
+        with open(os.path.join(base_dir, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {'partitions': []}
+
+
+def save_manifest(base_dir, manifest):
+    path = os.path.join(base_dir, MANIFEST_FILE)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+class PartitionedLogWriter:
+    """時刻に応じてパーティションを切り替えながらCSVを書き込む
+
+    期間が終わったパーティションは compact=True ならバックグラウンドで圧縮します。
+    writer_options は BufferedCSVWriter に渡されます。
+    """
+
+    def __init__(self, base_dir, period='hour', compact=True, **writer_options):
+        if period not in PERIODS:
+            raise ValueError(f"period は {list(PERIODS)} のいずれかです: {period}")
+        self.base_dir = base_dir
+        self.period = period
+        self.compact = compact
+        self.writer_options = writer_options
+        os.makedirs(base_dir, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self.manifest = load_manifest(base_dir)
+        self.manifest['period'] = period
+        self._current = None  # 書き込み中のパーティションの manifest エントリ
+        self._writer = None
+
+        self._compact_queue = queue.Queue()
+        self._compactor = None
+        if compact:
+            self._compactor = threading.Thread(target=self._compact_worker, daemon=True)
+            self._compactor.start()
+
+        # 前回の実行で期間が終わっていたパーティションは閉じて圧縮対象にする
+        # (現在の期間のものは write() で再び開いて追記する)
+        now = time.time()
+        for entry in self.manifest['partitions']:
+            if entry['format'] != 'csv':
+                continue
+            if entry['end'] <= now:
+                entry['closed'] = True
+            if entry['closed']:
+                self._enqueue_compaction(entry)
+        self._save_manifest()
+
+    def _save_manifest(self):
+        with self._lock:
+            save_manifest(self.base_dir, self.manifest)
+
+    def _find_entry(self, name):
+        for entry in self.manifest['partitions']:
+            if entry['name'] == name:
+                return entry
+        return None
+
+    def _rotate(self, timestamp):
+        name, start, end = partition_bounds(timestamp, self.period)
+        self._close_current()
+
+        with self._lock:
+            entry = self._find_entry(name)
+            if entry is not None and entry['closed']:
+                # 閉じた期間に再び書き込む場合 (時計の巻き戻りなど) は別ファイルにする
+                name = f"{name}_{int(timestamp)}"
+                entry = None
+            if entry is None:
+                entry = {'name': name, 'start': start, 'end': end,
+                         'format': 'csv', 'file': name + '.csv', 'closed': False}
+                self.manifest['partitions'].append(entry)
+                self.manifest['partitions'].sort(key=lambda e: e['start'])
+        self._save_manifest()
+
+        self._current = entry
+        self._writer = BufferedCSVWriter(os.path.join(self.base_dir, entry['file']),
+                                         CSV_HEADER, **self.writer_options)
+
+    def _close_current(self):
+        if self._writer is None:
+            return
+        self._writer.close()
+        with self._lock:
+            self._current['closed'] = True
+        self._save_manifest()
+        self._enqueue_compaction(self._current)
+        self._writer = None
+        self._current = None
+
+    def write(self, timestamp, row):
+        """1行書き込む (timestamp はパーティションの決定に使うUNIX秒)"""
+        if self._current is None or not (self._current['start'] <= timestamp < self._current['end']):
+            self._rotate(timestamp)
+        self._writer.writerow(row)
+
+    def _enqueue_compaction(self, entry):
+        if self.compact:
+            self._compact_queue.put(entry)
+
+    def _compact_worker(self):
+        while True:
+            entry = self._compact_queue.get()
+            if entry is None:
+                break
+            try:
+                self._compact_entry(entry)
+            except Exception as e:
+                logger.error(f"パーティション {entry['name']} の圧縮に失敗しました: {e}")
+
+    def _compact_entry(self, entry):
+        csv_path = os.path.join(self.base_dir, entry['file'])
+        columnar_file = entry['name'] + COLUMNAR_EXT
+        if not os.path.exists(csv_path):
+            return
+        rows = compact_csv(csv_path, os.path.join(self.base_dir, columnar_file))
+        with self._lock:
+            entry['format'] = 'columnar'
+            entry['file'] = columnar_file
+            entry['rows'] = rows
+            save_manifest(self.base_dir, self.manifest)
+        os.remove(csv_path)
+        logger.info(f"パーティション {entry['name']} を圧縮しました ({rows}行)")
+
+    def flush(self):
+        if self._writer is not None:
+            self._writer.flush()
+
+    def close(self):
+        """書き込み中のパーティションを閉じる (圧縮は次の起動時または compact_all で行う)"""
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+            self._current = None
+        if self._compactor is not None:
+            self._compact_queue.put(None)
+            self._compactor.join()
+            self._compactor = None
+        self._save_manifest()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def query(base_dir, start=None, end=None):
+    """期間 [start, end) と重なるパーティションだけを読み、(時刻, 温度, 気圧, 湿度) を返す
+
+    start / end はUNIX秒 (None なら制限なし)。
+    """
+    manifest = load_manifest(base_dir)
+    for entry in sorted(manifest['partitions'], key=lambda e: e['start']):
+        if start is not None and entry['end'] <= start:
+            continue
+        if end is not None and entry['start'] >= end:
+            continue
+        path = os.path.join(base_dir, entry['file'])
+        if not os.path.exists(path):
+            continue
+        for sample in _read_partition(path, entry['format']):
+            ts = sample[0]
+            if (start is None or ts >= start) and (end is None or ts < end):
+                yield sample
+
+
+def _read_partition(path, fmt):
+    if fmt == 'columnar':
+        cols = read_columnar(path)
+        yield from zip(*(cols[name] for name, _ in COLUMNAR_COLUMNS))
+        return
+    with open(path, 'r', newline='', encoding='utf-8') as f:
+        reader = csv.reader(f)
+        next(reader, None)
+        for row in reader:
+            try:
+                yield (datetime.fromisoformat(row[0]).timestamp(),
+                       float(row[1]), float(row[2]), float(row[3]))
+            except (ValueError, IndexError):
+                continue
@@ -1,84 +1,146 @@
-# 必要なライブラリをインポート
-import pandas as pd # type: ignore
-import matplotlib.pyplot as plt # type: ignore
-import matplotlib.dates as mdates # type: ignore
-import sys
-
-# --- 設定 ---
-# 読み込むCSVファイル名
-INPUT_CSV_FILE = 'bme280_log.csv'
-# 保存するグラフの画像ファイル名
-OUTPUT_IMAGE_FILE = 'bme280_graph.png'
-
-def plot_sensor_data(csv_file):
-    # CSVファイルの読み込み
-    try:
-        print(f"'{csv_file}' を読み込んでいます...")
-        # timestamp列を日付時刻型としてパースし、インデックスに設定
-        df = pd.read_csv(
-            csv_file,
-            parse_dates=['timestamp'],
-            index_col='timestamp'
-        )
-        print("ファイルの読み込みが完了しました。")
-    except FileNotFoundError:
-        print(f"エラー: ファイル '{csv_file}' が見つかりません。", file=sys.stderr)
-        print("BME280のデータ収集スクリプトを先に実行してください。", file=sys.stderr)
-        sys.exit(1)
-    except Exception as e:
-        print(f"エラー: ファイルの読み込み中に問題が発生しました: {e}", file=sys.stderr)
-        sys.exit(1)
-
-    # データが空でないか確認
-    if df.empty:
-        print("警告: CSVファイルにデータが含まれていません。グラフは生成されません。")
-        return
-
-    print("グラフを生成しています...")
-
-    # グラフの準備 (3つのグラフを縦に並べる)
-    # figsizeで全体のサイズを、sharex=TrueでX軸(時間軸)を共有
-    fig, axes = plt.subplots(nrows=3, ncols=1, figsize=(12, 10), sharex=True)
-
-    # --- 1. 温度のグラフ ---
-    axes[0].plot(df.index, df['temperature_c'], color='red', marker='.', linestyle='-')
-    axes[0].set_title('Temperature Over Time')
-    axes[0].set_ylabel('Temperature (°C)')
-    axes[0].grid(True)
-
-    # --- 2. 気圧のグラフ ---
-    axes[1].plot(df.index, df['pressure_hpa'], color='blue', marker='.', linestyle='-')
-    axes[1].set_title('Pressure Over Time')
-    axes[1].set_ylabel('Pressure (hPa)')
-    axes[1].grid(True)
-
-    # --- 3. 湿度のグラフ ---
-    axes[2].plot(df.index, df['humidity_percent'], color='green', marker='.', linestyle='-')
-    axes[2].set_title('Humidity Over Time')
-    axes[2].set_ylabel('Humidity (%)')
-    axes[2].grid(True)
-
-    # X軸のフォーマットを設定
-    axes[2].set_xlabel('Time')
-    # 日付と時刻が見やすいようにフォーマットを指定
-    xfmt = mdates.DateFormatter('%Y-%m-%d\n%H:%M:%S')
-    axes[2].xaxis.set_major_formatter(xfmt)
-    fig.autofmt_xdate(rotation=45, ha='right') # ラベルが重ならないように自動調整
-
-    # 全体のレイアウトを調整
-    plt.tight_layout()
-
-    # グラフを画像ファイルとして保存
-    try:
-        plt.savefig(OUTPUT_IMAGE_FILE, dpi=150)
-        print(f"グラフを '{OUTPUT_IMAGE_FILE}' として保存しました。")
-    except Exception as e:
-        print(f"エラー: グラフの保存に失敗しました: {e}", file=sys.stderr)
-
-
-    # グラフを表示
-    plt.show()
-
-
-if __name__ == '__main__':
-    plot_sensor_data(INPUT_CSV_FILE)
\ No newline at end of file
+# 必要なライブラリをインポート
+import pandas as pd # type: ignore
+import matplotlib.pyplot as plt # type: ignore
+import matplotlib.dates as mdates # type: ignore
+import sys
+import argparse
+from datetime import datetime
+
+from heat_stress import RISK_LEVELS, assess_batch
+
+# --- 設定 ---
+# 読み込むCSVファイル名
+INPUT_CSV_FILE = 'bme280_log.csv'
+# 保存するグラフの画像ファイル名
+OUTPUT_IMAGE_FILE = 'bme280_graph.png'
+
+def load_partitioned_data(base_dir, start=None, end=None):
+    """期間ごとに分割されたログから、指定期間と重なるパーティションだけを読み込む"""
+    from partitioned_log import query
+
+    start_ts = start.timestamp() if start else None
+    end_ts = end.timestamp() if end else None
+    rows = list(query(base_dir, start_ts, end_ts))
+    df = pd.DataFrame(rows, columns=['timestamp', 'temperature_c', 'pressure_hpa', 'humidity_percent'])
+    # UNIX秒をローカル時刻に変換する
+    df['timestamp'] = pd.to_datetime([datetime.fromtimestamp(ts) for ts, *_ in rows])
+    return df.set_index('timestamp')
+
+
+def plot_sensor_data(csv_file, partition_dir=None, start=None, end=None, column_dir=None):
+    # CSVファイルの読み込み
+    try:
+        if column_dir:
+            # 列ごとのバイナリファイルをmemmapで開き、指定期間だけを参照する
+            from column_store import load_dataframe
+            print(f"'{column_dir}' から読み込んでいます...")
+            df = load_dataframe(column_dir,
+                                start.timestamp() if start else None,
+                                end.timestamp() if end else None)
+        elif partition_dir:
+            print(f"'{partition_dir}' から読み込んでいます...")
+            df = load_partitioned_data(partition_dir, start, end)
+        else:
+            print(f"'{csv_file}' を読み込んでいます...")
+            # timestamp列を日付時刻型としてパースし、インデックスに設定
+            df = pd.read_csv(
+                csv_file,
+                parse_dates=['timestamp'],
+                index_col='timestamp'
+            )
+            if start or end:
+                df = df.loc[start:end]
+        print("ファイルの読み込みが完了しました。")
+    except FileNotFoundError:
+        print(f"エラー: ファイル '{csv_file}' が見つかりません。", file=sys.stderr)
+        print("BME280のデータ収集スクリプトを先に実行してください。", file=sys.stderr)
+        sys.exit(1)
+    except Exception as e:
+        print(f"エラー: ファイルの読み込み中に問題が発生しました: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    # データが空でないか確認
+    if df.empty:
+        print("警告: CSVファイルにデータが含まれていません。グラフは生成されません。")
+        return
+
+    # 暑さ指数 (WBGT) と熱指数を全サンプルまとめて計算する (NumPy版, 気圧も考慮)
+    wbgt, heat_index, risk = assess_batch(df['temperature_c'].to_numpy(), df['humidity_percent'].to_numpy(),
+                                          df['pressure_hpa'].to_numpy())
+    df['wbgt'] = wbgt
+    df['heat_index'] = heat_index
+    counts = pd.Series(risk).value_counts()
+    print("暑さ指数 (WBGT) の区分ごとのサンプル数: " +
+          ", ".join(f"{level.name} {counts.get(level.level, 0)}" for level in RISK_LEVELS) +
+          (f", 不明 (欠測) {counts[-1]}" if -1 in counts else ""))
+
+    print("グラフを生成しています...")
+
+    # グラフの準備 (4つのグラフを縦に並べる)
+    # figsizeで全体のサイズを、sharex=TrueでX軸(時間軸)を共有
+    fig, axes = plt.subplots(nrows=4, ncols=1, figsize=(12, 13), sharex=True)
+
+    # --- 1. 温度のグラフ ---
+    axes[0].plot(df.index, df['temperature_c'], color='red', marker='.', linestyle='-')
+    axes[0].set_title('Temperature Over Time')
+    axes[0].set_ylabel('Temperature (°C)')
+    axes[0].grid(True)
+
+    # --- 2. 気圧のグラフ ---
+    axes[1].plot(df.index, df['pressure_hpa'], color='blue', marker='.', linestyle='-')
+    axes[1].set_title('Pressure Over Time')
+    axes[1].set_ylabel('Pressure (hPa)')
+    axes[1].grid(True)
+
+    # --- 3. 湿度のグラフ ---
+    axes[2].plot(df.index, df['humidity_percent'], color='green', marker='.', linestyle='-')
+    axes[2].set_title('Humidity Over Time')
+    axes[2].set_ylabel('Humidity (%)')
+    axes[2].grid(True)
+
+    # --- 4. 暑さ指数 (WBGT) と熱指数のグラフ (背景は危険度の区分) ---
+    band_colors = ['#fff5cc', '#ffd9a0', '#ffb080', '#ff8080']  # 注意 / 警戒 / 厳重警戒 / 危険
+    bottom = min(df['wbgt'].min(), df['heat_index'].min()) - 2
+    top = max(df['wbgt'].max(), df['heat_index'].max(), RISK_LEVELS[-1].min_wbgt) + 2
+    bounds = [bottom] + [level.min_wbgt for level in RISK_LEVELS[1:]] + [top]
+    for level, color in zip(RISK_LEVELS, band_colors):
+        axes[3].axhspan(bounds[level.level], bounds[level.level + 1], color=color, alpha=0.5, linewidth=0)
+    axes[3].set_ylim(bottom, top)
+    axes[3].plot(df.index, df['wbgt'], color='purple', marker='.', linestyle='-', label='WBGT (indoor estimate)')
+    axes[3].plot(df.index, df['heat_index'], color='gray', linestyle='--', label='Heat Index')
+    axes[3].set_title('WBGT / Heat Index Over Time')
+    axes[3].set_ylabel('WBGT / Heat Index (°C)')
+    axes[3].legend(loc='upper left')
+    axes[3].grid(True)
+
+    # X軸のフォーマットを設定
+    axes[3].set_xlabel('Time')
+    # 日付と時刻が見やすいようにフォーマットを指定
+    xfmt = mdates.DateFormatter('%Y-%m-%d\n%H:%M:%S')
+    axes[3].xaxis.set_major_formatter(xfmt)
+    fig.autofmt_xdate(rotation=45, ha='right') # ラベルが重ならないように自動調整
+
+    # 全体のレイアウトを調整
+    plt.tight_layout()
+
+    # グラフを画像ファイルとして保存
+    try:
+        plt.savefig(OUTPUT_IMAGE_FILE, dpi=150)
+        print(f"グラフを '{OUTPUT_IMAGE_FILE}' として保存しました。")
+    except Exception as e:
+        print(f"エラー: グラフの保存に失敗しました: {e}", file=sys.stderr)
+
+
+    # グラフを表示
+    plt.show()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='BME280のログをグラフ化します')
+    parser.add_argument('csv_file', nargs='?', default=INPUT_CSV_FILE, help='読み込むCSVファイル')
+    parser.add_argument('--partitions', metavar='DIR', help='期間ごとに分割されたログのディレクトリ (data_logger.pyの partitioned モード)')
+    parser.add_argument('--columns', metavar='DIR', help='列ごとのバイナリログのディレクトリ (data_logger.pyの columnar モード)')
+    parser.add_argument('--start', type=datetime.fromisoformat, help='表示開始時刻 (例: 2025-08-01T09:00)')
+    parser.add_argument('--end', type=datetime.fromisoformat, help='表示終了時刻 (例: 2025-08-01T18:00)')
+    args = parser.parse_args()
+    plot_sensor_data(args.csv_file, args.partitions, args.start, args.end, args.columns)
@@ -0,0 +1,173 @@
+# coding: utf-8
+
+# ---------------------------------------------------------------------------
+# BME280 生データログ (固定長バイナリ形式)
+#
+# 補正計算前の8バイトのバーストデータ (0xF7〜0xFE) を、時刻と
+# 補正パラメータIDと一緒に1レコード20バイトで記録します。
+# 補正計算は読み出し時に行うため、補正式を修正した場合も過去のデータに適用できます。
+#
+# ファイル構成:
+#   bme280_log.bin            ヘッダー (8バイト) + レコードの連続
+#   bme280_log.bin.calib.json 補正パラメータID → 補正パラメータの生バイト列
+#
+# CSVへの変換: python raw_log.py bme280_log.bin -o bme280_log.csv
+# ---------------------------------------------------------------------------
+
+import argparse
+import csv
+import json
+import os
+import struct
+import sys
+from datetime import datetime
+
+from bme280_calib import calibration_id, decode_calibration
+from bme280_compensation import CompensationEngine
+
+FILE_MAGIC = b'BMERAW01'
+# 時刻 (UNIX秒, float64), 補正パラメータID (uint32), 生データ (8バイト)
+RECORD_FORMAT = struct.Struct('<dI8s')
+RECORD_SIZE = RECORD_FORMAT.size
+
+
+def calib_table_path(path):
+    return path + '.calib.json'
+
+
+def decode_raw_block(block):
+    """8バイトの生データから (温度, 気圧, 湿度) の生値を取り出す"""
+    pres_raw = (block[0] << 12) | (block[1] << 4) | (block[2] >> 4)
+    temp_raw = (block[3] << 12) | (block[4] << 4) | (block[5] >> 4)
+    hum_raw = (block[6] << 8) | block[7]
+    return temp_raw, pres_raw, hum_raw
+
+
+def load_calib_table(path):
+    """補正パラメータ表を読み込む (ID → Calibration)"""
+    try:
+        with open(calib_table_path(path), 'r', encoding='utf-8') as f:
+            table = json.load(f)
+    except FileNotFoundError:
+        return {}
+    return {int(key, 16): decode_calibration(bytes.fromhex(value)) for key, value in table.items()}
+
+
+class RawLogWriter:
+    """生データをバイナリファイルに追記する"""
+
+    def __init__(self, path, calib):
+        self.path = path
+        self.calib_id = calibration_id(calib)
+        self._register_calibration(calib)
+
+        is_new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.file = open(path, 'ab')
+        if is_new:
+            self.file.write(FILE_MAGIC)
+        else:
+            # 途中で書き込みが途切れたレコードがあれば切り詰める
+            size = self.file.tell()
+            excess = (size - len(FILE_MAGIC)) % RECORD_SIZE
+            if excess:
+                self.file.truncate(size - excess)
+                self.file.seek(0, os.SEEK_END)
+
+    def _register_calibration(self, calib):
+        table_path = calib_table_path(self.path)
+        try:
+            with open(table_path, 'r', encoding='utf-8') as f:
+                table = json.load(f)
+        except FileNotFoundError:
+            table = {}
+        key = f"{self.calib_id:08x}"
+        if key not in table:
+            table[key] = calib.raw.hex()
+            with open(table_path, 'w', encoding='utf-8') as f:
+                json.dump(table, f, indent=2, sort_keys=True)
+
+    def write(self, timestamp, block):
+        """1レコード書き込む (timestamp はUNIX秒, block は8バイトの生データ)"""
+        self.file.write(RECORD_FORMAT.pack(timestamp, self.calib_id, bytes(block)))
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def iter_raw_records(path):
+    """(時刻, 補正パラメータID, 8バイトの生データ) を順に返す"""
+    with open(path, 'rb') as f:
+        if f.read(len(FILE_MAGIC)) != FILE_MAGIC:
+            raise ValueError(f"生データログの形式ではありません: {path}")
+        while True:
+            chunk = f.read(RECORD_SIZE * 1024)
+            usable = len(chunk) - len(chunk) % RECORD_SIZE
+            yield from RECORD_FORMAT.iter_unpack(chunk[:usable])
+            if len(chunk) < RECORD_SIZE * 1024:
+                break
+
+
+def read_raw_log(path, integer=False):
+    """生データログを読み込み、補正計算しながら (時刻, 温度, 気圧, 湿度) を返す"""
+    calibs = load_calib_table(path)
+    engines = {}
+    for timestamp, calib_id, block in iter_raw_records(path):
+        engine = engines.get(calib_id)
+        if engine is None:
+            if calib_id not in calibs:
+                raise ValueError(f"補正パラメータID {calib_id:08x} が見つかりません")
+            engine = engines[calib_id] = CompensationEngine(calibs[calib_id], integer=integer)
+        yield (timestamp,) + engine.compensate(*decode_raw_block(block))
+
+
+def load_raw_log_arrays(path):
+    """生データログ全体をNumPy配列 (時刻, 温度, 気圧, 湿度) として一括で補正する"""
+    import numpy as np
+
+    dtype = np.dtype([('timestamp', '<f8'), ('calib_id', '<u4'), ('raw', 'u1', 8)])
+    records = np.fromfile(path, dtype=dtype, offset=len(FILE_MAGIC))
+    raw = records['raw'].astype(np.int64)
+    pres_raw = (raw[:, 0] << 12) | (raw[:, 1] << 4) | (raw[:, 2] >> 4)
+    temp_raw = (raw[:, 3] << 12) | (raw[:, 4] << 4) | (raw[:, 5] >> 4)
+    hum_raw = (raw[:, 6] << 8) | raw[:, 7]
+
+    temperature = np.empty(len(records))
+    pressure = np.empty(len(records))
+    humidity = np.empty(len(records))
+    calibs = load_calib_table(path)
+    for calib_id in np.unique(records['calib_id']):
+        mask = records['calib_id'] == calib_id
+        engine = CompensationEngine(calibs[int(calib_id)])
+        temperature[mask], pressure[mask], humidity[mask] = \
+            engine.compensate_batch(temp_raw[mask], pres_raw[mask], hum_raw[mask])
+    return records['timestamp'], temperature, pressure, humidity
+
+
+def main():
+    parser = argparse.ArgumentParser(description='BME280生データログをCSVに変換します')
+    parser.add_argument('input', help='生データログファイル (.bin)')
+    parser.add_argument('-o', '--output', help='出力CSVファイル (省略時は標準出力)')
+    args = parser.parse_args()
+
+    out = open(args.output, 'w', newline='', encoding='utf-8') if args.output else sys.stdout
+    try:
+        writer = csv.writer(out)
+        writer.writerow(['timestamp', 'temperature_c', 'pressure_hpa', 'humidity_percent'])
+        for timestamp, temp, pres, hum in read_raw_log(args.input):
+            writer.writerow([datetime.fromtimestamp(timestamp).isoformat(), temp, pres, hum])
+    finally:
+        if args.output:
+            out.close()
+
+
+if __name__ == '__main__':
+    main()
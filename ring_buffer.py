@@ -0,0 +1,161 @@
+# coding: utf-8
+
+# ---------------------------------------------------------------------------
+# 測定値のリングバッファ
+#
+# 時刻 (UNIX秒) と温度・気圧・湿度を、あらかじめ確保した array に連続して格納します。
+# 1サンプルあたり32バイトなので、5秒間隔で3日分 (51840件) でも約1.6MBです。
+# 時刻は追加順に単調増加する前提で、期間の検索は二分探索 (O(log n)) で行い、
+# 取り出すときは指定した範囲だけをコピーします。
+#
+# 書き込みは1つのスレッドだけが行い、読み出しはロックなしで行います (seqlock 方式)。
+# 書き込み側は started を進めてから値を書き、書き終えたら total を進めます。
+# 読み出し側は total を固定した窓 (RingBufferView) で読み、読み終えた時点の started から
+# 読んだ範囲が上書きされていないかを確認して、上書きされていれば読み直します。
+# 容量より margin 件多く確保しておくので、読んでいる間に margin 件までの書き込みがあっても
+# 読み直しは起きません。
+# ---------------------------------------------------------------------------
+
+from array import array
+
+
+class RingBufferView:
+    """件数を固定したリングバッファの読み出し用の窓"""
+
+    def __init__(self, buffer, total):
+        self.buffer = buffer
+        self.total = total
+        self.length = min(total, buffer.capacity)
+
+    def __len__(self):
+        return self.length
+
+    def _physical(self, index):
+        """古い順の位置 (0〜len-1) を配列上の位置に変換する"""
+        return (self.total - self.length + index) % self.buffer.slots
+
+    def timestamp_at(self, index):
+        return self.buffer.timestamps[self._physical(index)]
+
+    def bisect_left(self, timestamp):
+        """timestamp 以上になる最初の位置 (古い順) を二分探索で求める"""
+        lo, hi = 0, self.length
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.timestamp_at(mid) < timestamp:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def bisect_right(self, timestamp):
+        """timestamp より大きくなる最初の位置 (古い順) を二分探索で求める"""
+        lo, hi = 0, self.length
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if timestamp < self.timestamp_at(mid):
+                hi = mid
+            else:
+                lo = mid + 1
+        return lo
+
+    def range_indices(self, start=None, end=None):
+        """期間 [start, end) に含まれる位置の範囲 (lo, hi) を返す"""
+        lo = 0 if start is None else self.bisect_left(start)
+        hi = self.length if end is None else self.bisect_left(end)
+        return lo, max(lo, hi)
+
+    def slice(self, lo, hi):
+        """位置 lo〜hi-1 のサンプルを (時刻, 温度, 気圧, 湿度) のリストで返す"""
+        result = []
+        if hi <= lo:
+            return result
+        buf = self.buffer
+        slots = buf.slots
+        first = self._physical(lo)
+        # 配列の末尾で折り返す場合は2つの連続した範囲に分けてコピーする
+        count = hi - lo
+        spans = [(first, min(first + count, slots))]
+        if first + count > slots:
+            spans.append((0, first + count - slots))
+        for a, b in spans:
+            result.extend(zip(buf.timestamps[a:b], buf.temperature[a:b],
+                              buf.pressure[a:b], buf.humidity[a:b]))
+        return result
+
+    def window(self, start=None, end=None):
+        """期間 [start, end) のサンプルを返す"""
+        return self.slice(*self.range_indices(start, end))
+
+    def last(self, count):
+        """新しい方から count 件を古い順で返す"""
+        n = self.length
+        return self.slice(max(0, n - count), n)
+
+    def intact(self):
+        """この窓の範囲が読み出し中に上書きされていなければ True"""
+        # 書き込み中を含め、通し番号 started - 1 までの書き込みが
+        # 通し番号 started - 1 - slots 以前のサンプルを上書きしている
+        return self.buffer.started - 1 - self.buffer.slots < self.total - self.length
+
+
+class SampleRingBuffer:
+    """容量固定のリングバッファ (古いサンプルから上書き)
+
+    capacity 件を保持し、読み出し中の上書きに備えて margin 件分を余分に確保します。
+    """
+
+    def __init__(self, capacity, margin=64):
+        if capacity <= 0:
+            raise ValueError("capacity は1以上にしてください")
+        self.capacity = capacity
+        self.slots = capacity + margin
+        zeros = bytes(8 * self.slots)
+        self.timestamps = array('d', zeros)
+        self.temperature = array('d', zeros)
+        self.pressure = array('d', zeros)
+        self.humidity = array('d', zeros)
+        self.started = 0  # 書き込みを始めたサンプル数
+        self.total = 0    # 書き込みを終えたサンプル数
+
+    def __len__(self):
+        return min(self.total, self.capacity)
+
+    def append(self, timestamp, temperature, pressure, humidity):
+        """1サンプル追加する (書き込みは1つのスレッドから行うこと)"""
+        total = self.total
+        self.started = total + 1
+        i = total % self.slots
+        self.timestamps[i] = timestamp
+        self.temperature[i] = temperature
+        self.pressure[i] = pressure
+        self.humidity[i] = humidity
+        self.total = total + 1
+
+    def read(self, reader):
+        """reader(view) を実行し、読んだ範囲が上書きされていなければその結果を返す
+
+        上書きされていた場合は新しい窓で読み直します。
+        """
+        while True:
+            view = RingBufferView(self, self.total)
+            result = reader(view)
+            if view.intact():
+                return result
+
+    def timestamp_at(self, index):
+        return self.read(lambda view: view.timestamp_at(index))
+
+    def bisect_left(self, timestamp):
+        return self.read(lambda view: view.bisect_left(timestamp))
+
+    def bisect_right(self, timestamp):
+        return self.read(lambda view: view.bisect_right(timestamp))
+
+    def window(self, start=None, end=None):
+        """期間 [start, end) のサンプルを返す"""
+        return self.read(lambda view: view.window(start, end))
+
+    def last(self, count):
+        """新しい方から count 件を古い順で返す"""
+        return self.read(lambda view: view.last(count))
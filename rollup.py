@@ -0,0 +1,257 @@
+# coding: utf-8
+
+# ---------------------------------------------------------------------------
+# 集計値 (1分・1時間・1日) の逐次更新
+#
+# サンプルが届くたびに各階層の現在の集計区間に
+# 件数・合計・最小・最大・最新値をチャンネルごとに加算します。
+# 区間が終わった集計値はメモリに保持し、rollup_1m.csv などに追記して永続化します。
+# 集計中の区間は終了時に rollup_current.json に保存し、次の起動時に続きから集計します。
+# 保存先のディレクトリは1つのプロセスだけが使えます (rollup.lock をロックする)。
+# 粗い表示範囲の問い合わせには生データではなくこの集計値を返します。
+# ---------------------------------------------------------------------------
+
+import bisect
+import csv
+import fcntl
+import json
+import os
+import time
+
+from log_writer import BufferedCSVWriter
+
+# (階層名, 区間の秒数, メモリに保持する区間数)
+TIERS = [
+    ('1m', 60, 7 * 24 * 60),      # 1分 × 7日分
+    ('1h', 3600, 366 * 24),       # 1時間 × 1年分
+    ('1d', 86400, 10 * 366),      # 1日 × 10年分
+]
+CURRENT_STATE_FILE = 'rollup_current.json'
+LOCK_FILE = 'rollup.lock'
+CHANNELS = ('temperature', 'pressure', 'humidity')
+STATS = ('sum', 'min', 'max', 'last')
+
+
+def bucket_start(timestamp, size):
+    """timestamp を含む区間の開始時刻 (ローカル時刻の区切り)"""
+    offset = time.localtime(timestamp).tm_gmtoff
+    return (int(timestamp + offset) // size) * size - offset
+
+
+class Bucket:
+    """1区間の集計値"""
+    __slots__ = ('start', 'count', 'stats')
+
+    def __init__(self, start, count=0, stats=None):
+        self.start = start
+        self.count = count
+        # チャンネルごとに [合計, 最小, 最大, 最新]
+        self.stats = stats if stats is not None else [None] * len(CHANNELS)
+
+    def add(self, values):
+        self.count += 1
+        stats = self.stats
+        for i, v in enumerate(values):
+            s = stats[i]
+            if s is None:
+                stats[i] = [v, v, v, v]
+            else:
+                s[0] += v
+                if v < s[1]: s[1] = v
+                if v > s[2]: s[2] = v
+                s[3] = v
+
+    def to_dict(self):
+        """APIで返す形式 (チャンネルごとの mean/min/max/last)"""
+        result = {'start': self.start, 'count': self.count}
+        for name, s in zip(CHANNELS, self.stats):
+            if s is None:
+                result[name] = None
+            else:
+                result[name] = {'mean': s[0] / self.count, 'min': s[1], 'max': s[2], 'last': s[3]}
+        return result
+
+    def to_row(self):
+        row = [self.start, self.count]
+        for s in self.stats:
+            row.extend(s if s is not None else [''] * len(STATS))
+        return row
+
+    @classmethod
+    def from_row(cls, row):
+        stats = []
+        for i in range(len(CHANNELS)):
+            values = row[2 + i * len(STATS):2 + (i + 1) * len(STATS)]
+            stats.append([float(v) for v in values] if values and values[0] != '' else None)
+        return cls(int(row[0]), int(row[1]), stats)
+
+
+def _header():
+    return ['start', 'count'] + [f"{ch}_{st}" for ch in CHANNELS for st in STATS]
+
+
+class RollupTier:
+    """1つの階層の集計値 (区間が終わったものと集計中のもの)"""
+
+    def __init__(self, name, size, capacity, base_dir=None, **writer_options):
+        self.name = name
+        self.size = size
+        self.capacity = capacity
+        # 区間が終わった集計値と、その開始時刻 (二分探索用) を古い順に並べたリスト。
+        # 先頭の削除は capacity の1/8 溜まるごとにまとめて行う (query は新しい capacity 件だけを返す)
+        self.closed = []
+        self.starts = []
+        self.current = None
+        self.writer = None
+        if base_dir is not None:
+            path = os.path.join(base_dir, f"rollup_{name}.csv")
+            self._load(path)
+            self.writer = BufferedCSVWriter(path, _header(), **writer_options)
+
+    def _load(self, path):
+        try:
+            with open(path, 'r', newline='', encoding='utf-8') as f:
+                reader = csv.reader(f)
+                next(reader, None)
+                for row in reader:
+                    try:
+                        self._append(Bucket.from_row(row))
+                    except (ValueError, IndexError):
+                        continue
+        except FileNotFoundError:
+            pass
+
+    def add(self, timestamp, values):
+        start = bucket_start(timestamp, self.size)
+        current = self.current
+        if current is None or current.start != start:
+            if current is not None:
+                self._close(current)
+            current = self.current = Bucket(start)
+        current.add(values)
+
+    def _append(self, bucket):
+        self.closed.append(bucket)
+        self.starts.append(bucket.start)
+        excess = len(self.closed) - self.capacity
+        if excess > self.capacity // 8:
+            del self.closed[:excess]
+            del self.starts[:excess]
+
+    def _close(self, bucket):
+        self._append(bucket)
+        if self.writer is not None:
+            self.writer.writerow(bucket.to_row())
+
+    def query(self, start=None, end=None):
+        """期間 [start, end) と重なる区間の集計値を古い順に返す (集計中の区間を含む)"""
+        buckets = self.closed
+        lo = max(0, len(buckets) - self.capacity)
+        if start is not None:
+            # start を含む区間から返す
+            lo = bisect.bisect_right(self.starts, start - self.size, lo)
+        result = []
+        for i in range(lo, len(buckets)):
+            b = buckets[i]
+            if end is not None and b.start >= end:
+                break
+            result.append(b)
+        cur = self.current
+        if cur is not None and (start is None or cur.start + self.size > start) \
+                and (end is None or cur.start < end):
+            result.append(cur)
+        return result
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+class RollupStore:
+    """全階層の集計値をまとめて更新・検索する
+
+    base_dir を指定すると区間が終わった集計値をCSVに追記し、起動時に読み込みます。
+    base_dir を別のプロセスが使っていれば IOError になります。
+    """
+
+    def __init__(self, base_dir=None, tiers=TIERS, **writer_options):
+        self.base_dir = base_dir
+        self.lock_file = None
+        if base_dir is not None:
+            os.makedirs(base_dir, exist_ok=True)
+            self._lock()
+        self.tiers = [RollupTier(name, size, capacity, base_dir, **writer_options)
+                      for name, size, capacity in tiers]
+        self.by_name = {tier.name: tier for tier in self.tiers}
+        self._restore_current()
+
+    def _lock(self):
+        self.lock_file = open(os.path.join(self.base_dir, LOCK_FILE), 'a')
+        try:
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self.lock_file.close()
+            self.lock_file = None
+            raise IOError(f"集計値の保存先 {self.base_dir} は別のプロセスが使用中です")
+
+    def _state_path(self):
+        return os.path.join(self.base_dir, CURRENT_STATE_FILE)
+
+    def _restore_current(self):
+        """前回終了時に集計中だった区間を読み込む (区間が終わっていれば確定させる)"""
+        if self.base_dir is None:
+            return
+        try:
+            with open(self._state_path(), 'r', encoding='utf-8') as f:
+                state = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return
+        # 異常終了後に同じ区間を二重に読み込まないよう、読んだら削除する
+        os.remove(self._state_path())
+        now = time.time()
+        for tier in self.tiers:
+            row = state.get(tier.name)
+            if not row:
+                continue
+            bucket = Bucket.from_row(row)
+            if bucket_start(now, tier.size) == bucket.start:
+                tier.current = bucket
+            else:
+                tier._close(bucket)
+
+    def add(self, timestamp, values):
+        """1サンプル (温度, 気圧, 湿度) を全階層に加算する"""
+        for tier in self.tiers:
+            tier.add(timestamp, values)
+
+    def choose_tier(self, start, end, max_points):
+        """区間数が max_points 以下になる最も細かい階層を返す"""
+        span = end - start
+        for tier in self.tiers:
+            if span / tier.size <= max_points:
+                return tier
+        return self.tiers[-1]
+
+    def query(self, tier_name, start=None, end=None):
+        return self.by_name[tier_name].query(start, end)
+
+    def flush(self):
+        for tier in self.tiers:
+            if tier.writer is not None:
+                tier.writer.flush()
+
+    def close(self):
+        try:
+            if self.base_dir is not None:
+                state = {tier.name: tier.current.to_row() for tier in self.tiers
+                         if tier.current is not None}
+                with open(self._state_path(), 'w', encoding='utf-8') as f:
+                    json.dump(state, f)
+        finally:
+            try:
+                for tier in self.tiers:
+                    tier.close()
+            finally:
+                if self.lock_file is not None:
+                    self.lock_file.close()  # ロックも外れる
+                    self.lock_file = None
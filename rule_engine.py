@@ -0,0 +1,342 @@
+# coding: utf-8
+
+# ---------------------------------------------------------------------------
+# アラート条件のルールエンジン (スライディングウィンドウの逐次集計)
+#
+# アラートの条件を文字列のルールで書き、測定値を1件受け取るたびに評価します。
+#
+#   Rule('高温多湿', 'mean(temperature, 15m) >= 28 and humidity >= 75',
+#        clear='mean(temperature, 15m) < 27 or humidity < 70')
+#   Rule('気圧の急低下', 'delta(pressure, 3h) <= -3')
+#
+# 条件の書き方:
+#   項目 比較 数値              … 最新の値 (項目は測定値の dict のキー: temperature / humidity /
+#                                   pressure / wbgt など)
+#   集計(項目, 時間幅) 比較 数値 … 直近の時間幅 (例: 90s / 15m / 3h, 単位なしは秒) の集計
+#       mean: 平均, min: 最小, max: 最大, delta: 最新 - 最古, rate: 1時間あたりの変化量
+#   比較は >= / > / <= / < 。条件は and / or でつなぐ (and が先, かっこは使えない)
+#   「ずっと31℃以上」は min(temperature, 10m) >= 31 のように書けます。
+# clear は解除の条件です (省略時は条件を満たさなくなったら解除)。しきい値を少しずらして
+# 書くと、しきい値付近で通知と解除を繰り返さなくなります (ヒステリシス)。
+#
+# ルールは読み込み時に一度だけ解析し、センサーごとに (項目, 時間幅) ごとのウィンドウを
+# 1つだけ持ちます (同じウィンドウを使う集計・ルールで共有)。ウィンドウは合計値と、
+# 最小・最大用の単調なキュー (deque) を逐次更新するので、測定値1件あたりの処理は
+# 償却 O(1) で、履歴を見直すことはありません。同じ条件は全ルールで1回だけ評価します。
+#
+# 速度の確認: python bench_rule_engine.py
+# ---------------------------------------------------------------------------
+
+import json
+import math
+import operator
+import re
+from collections import deque, namedtuple
+
+# name: ルール名 (通知に表示), when: 条件, clear: 解除の条件 (None なら when を満たさなければ解除)
+Rule = namedtuple('Rule', ['name', 'when', 'clear'], defaults=(None,))
+
+# matched: 条件を満たしたルール名のリスト, cleared: すべてのルールの解除の条件を満たしたか
+Evaluation = namedtuple('Evaluation', ['matched', 'cleared'])
+
+AGGREGATES = ('mean', 'min', 'max', 'delta', 'rate')
+OPERATORS = {'>=': operator.ge, '>': operator.gt, '<=': operator.le, '<': operator.lt}
+DURATION_UNITS = {'': 1, 's': 1, 'm': 60, 'h': 3600}
+
+TOKEN_NAMES = {'num': '数値', 'name': '項目名', 'op': '比較 (>= / > / <= / <)', 'punct': '記号'}
+
+# 合計値は浮動小数点の誤差が溜まらないよう、これだけ取り除いたら計算し直す
+RESUM_INTERVAL = 4096
+
+_TOKEN = re.compile(r"\s*(?:(?P<num>-?\d+(?:\.\d+)?)(?P<unit>[a-z]?)(?![A-Za-z_0-9])"
+                    r"|(?P<name>[A-Za-z_][A-Za-z_0-9]*)|(?P<op>>=|<=|>|<)|(?P<punct>[(),]))")
+
+
+class SlidingWindow:
+    """1つの項目の直近 window 秒の測定値 (平均・最小・最大・変化量を逐次更新する)"""
+
+    __slots__ = ('window', 'samples', 'total', 'mins', 'maxs', '_removed')
+
+    def __init__(self, window, track_min=False, track_max=False):
+        self.window = window
+        self.samples = deque()  # (時刻, 値)
+        self.total = 0.0
+        self.mins = deque() if track_min else None  # 値が増えていく順の (時刻, 値)。先頭が最小
+        self.maxs = deque() if track_max else None  # 値が減っていく順の (時刻, 値)。先頭が最大
+        self._removed = 0
+
+    def add(self, timestamp, value):
+        sample = (timestamp, value)
+        self.samples.append(sample)
+        self.total += value
+        mins = self.mins
+        if mins is not None:
+            while mins and mins[-1][1] >= value:
+                mins.pop()
+            mins.append(sample)
+        maxs = self.maxs
+        if maxs is not None:
+            while maxs and maxs[-1][1] <= value:
+                maxs.pop()
+            maxs.append(sample)
+
+        # 時間幅から外れた測定値を取り除く (追加したばかりの測定値は必ず残る)
+        cutoff = timestamp - self.window
+        samples = self.samples
+        while samples[0][0] <= cutoff:
+            self.total -= samples.popleft()[1]
+            self._removed += 1
+        if mins is not None:
+            while mins[0][0] <= cutoff:
+                mins.popleft()
+        if maxs is not None:
+            while maxs[0][0] <= cutoff:
+                maxs.popleft()
+        if self._removed >= RESUM_INTERVAL:
+            self.total = math.fsum(v for _, v in samples)
+            self._removed = 0
+
+    def mean(self):
+        return self.total / len(self.samples) if self.samples else None
+
+    def min(self):
+        return self.mins[0][1] if self.mins else None
+
+    def max(self):
+        return self.maxs[0][1] if self.maxs else None
+
+    def delta(self):
+        return self.samples[-1][1] - self.samples[0][1] if self.samples else None
+
+    def rate(self):
+        if len(self.samples) < 2:
+            return None
+        (t0, v0), (t1, v1) = self.samples[0], self.samples[-1]
+        return (v1 - v0) / (t1 - t0) * 3600.0 if t1 > t0 else None
+
+
+def parse_duration(number, unit):
+    if unit not in DURATION_UNITS:
+        raise ValueError(f"時間幅の単位は s / m / h のいずれかです ({number}{unit})")
+    seconds = float(number) * DURATION_UNITS[unit]
+    if seconds <= 0:
+        raise ValueError(f"時間幅は正の値にしてください ({number}{unit})")
+    return seconds
+
+
+def tokenize(text):
+    tokens = []
+    pos = 0
+    text = text.rstrip()
+    while pos < len(text):
+        m = _TOKEN.match(text, pos)
+        if m is None or m.end() == pos:
+            raise ValueError(f"解釈できない文字があります: '{text[pos:].strip()}' ({text})")
+        pos = m.end()
+        kind = m.lastgroup if m.lastgroup != 'unit' else 'num'
+        if kind == 'num':
+            tokens.append(('num', (m.group('num'), m.group('unit'))))
+        else:
+            tokens.append((kind, m.group(kind)))
+    return tokens
+
+
+def parse_condition_expression(text):
+    """条件の文字列を解析する
+
+    (集計, 項目, 時間幅, 比較, 数値) の組を and でまとめたリストを or でまとめたリスト
+    (選言標準形) を返します。集計が 'last' の組は最新の値 (時間幅は None) です。
+    """
+    tokens = tokenize(text)
+    pos = 0
+
+    def found():
+        if pos >= len(tokens):
+            return '(終わり)'
+        kind, value = tokens[pos]
+        return ''.join(value) if kind == 'num' else value
+
+    def expect(kind, value=None):
+        nonlocal pos
+        if pos >= len(tokens) or tokens[pos][0] != kind or (value is not None and tokens[pos][1] != value):
+            raise ValueError(f"{value or TOKEN_NAMES[kind]} が必要です ({found()}): {text}")
+        pos += 1
+        return tokens[pos - 1][1]
+
+    def condition():
+        nonlocal pos
+        name = expect('name')
+        if pos < len(tokens) and tokens[pos] == ('punct', '('):
+            if name not in AGGREGATES:
+                raise ValueError(f"集計は {', '.join(AGGREGATES)} のいずれかです ({name}): {text}")
+            pos += 1
+            field = expect('name')
+            expect('punct', ',')
+            window = parse_duration(*expect('num'))
+            expect('punct', ')')
+            aggregate = name
+        else:
+            aggregate, field, window = 'last', name, None
+        op = expect('op')
+        number, unit = expect('num')
+        if unit:
+            raise ValueError(f"しきい値に単位は付けられません ({number}{unit}): {text}")
+        return (aggregate, field, window, op, float(number))
+
+    clauses = []
+    while True:
+        terms = [condition()]
+        while pos < len(tokens) and tokens[pos] == ('name', 'and'):
+            pos += 1
+            terms.append(condition())
+        clauses.append(terms)
+        if pos < len(tokens) and tokens[pos] == ('name', 'or'):
+            pos += 1
+            continue
+        break
+    if pos != len(tokens):
+        raise ValueError(f"条件の後に余分なものがあります ({found()}): {text}")
+    return clauses
+
+
+class SensorRuleState:
+    """1台のセンサーのウィンドウと、各条件の評価に使う関数"""
+
+    __slots__ = ('windows', 'checks')
+
+    def __init__(self, engine):
+        self.windows = [(field, SlidingWindow(window, track_min, track_max))
+                        for field, window, track_min, track_max in engine.window_specs]
+        self.checks = []
+        for aggregate, field, slot, op, threshold in engine.conditions:
+            if slot is None:
+                self.checks.append((field, True, OPERATORS[op], threshold))
+            else:
+                self.checks.append((getattr(self.windows[slot][1], aggregate), False, OPERATORS[op], threshold))
+
+
+class RuleEngine:
+    """ルールをまとめて解析し、センサーごとに逐次評価する
+
+    fields (数値の項目名の集まり) を渡すと、それ以外の項目を使うルールを ValueError にします
+    (項目名の書き間違いは、条件を満たすことも解除することもなくなるため)。
+    """
+
+    def __init__(self, rules, fields=None):
+        self.rules = list(rules)
+        self.window_specs = []  # (項目, 時間幅, 最小を使うか, 最大を使うか)
+        self.conditions = []    # (集計, 項目, ウィンドウの番号 (最新の値なら None), 比較, 数値)
+        self.compiled = []      # (ルール名, 条件の番号の選言標準形, 解除の条件の選言標準形 or None)
+        self.sensors = {}
+        window_slots = {}
+        condition_slots = {}
+        names = set()
+
+        def compile_expression(name, text):
+            clauses = []
+            for terms in parse_condition_expression(text):
+                indexes = []
+                for aggregate, field, window, op, threshold in terms:
+                    if fields is not None and field not in fields:
+                        raise ValueError(f"ルール '{name}' の項目 '{field}' は使えません "
+                                         f"(使える項目: {', '.join(sorted(fields))}): {text}")
+                    slot = None
+                    if window is not None:
+                        slot = window_slots.get((field, window))
+                        if slot is None:
+                            slot = window_slots[(field, window)] = len(self.window_specs)
+                            self.window_specs.append([field, window, False, False])
+                        if aggregate == 'min':
+                            self.window_specs[slot][2] = True
+                        elif aggregate == 'max':
+                            self.window_specs[slot][3] = True
+                    key = (aggregate, field, slot, op, threshold)
+                    if key not in condition_slots:
+                        condition_slots[key] = len(self.conditions)
+                        self.conditions.append(key)
+                    indexes.append(condition_slots[key])
+                clauses.append(tuple(indexes))
+            return clauses
+
+        for rule in self.rules:
+            if rule.name in names:
+                raise ValueError(f"ルール名が重複しています: {rule.name}")
+            names.add(rule.name)
+            when = compile_expression(rule.name, rule.when)
+            clear = compile_expression(rule.name, rule.clear) if rule.clear else None
+            self.compiled.append((rule.name, when, clear))
+
+    def fields(self):
+        """ルールが使う測定値の項目"""
+        return sorted({field for _, field, _, _, _ in self.conditions})
+
+    def evaluate(self, sensor_id, timestamp, values):
+        """測定値を1件追加し、各ルールの条件と解除の条件を評価する
+
+        values は項目名 → 値の dict です。値がない (None の) 項目の条件は満たさないものとします。
+        """
+        state = self.sensors.get(sensor_id)
+        if state is None:
+            state = self.sensors[sensor_id] = SensorRuleState(self)
+        for field, window in state.windows:
+            value = values.get(field)
+            if value is not None:
+                window.add(timestamp, value)
+
+        # 条件ごとに1回だけ評価する
+        get = values.get
+        results = []
+        append = results.append
+        for getter, is_field, op, threshold in state.checks:
+            value = get(getter) if is_field else getter()
+            append(value is not None and op(value, threshold))
+
+        # 各ルールは「and でつないだ条件の番号のタプル」を or でまとめたもの
+        matched = []
+        cleared = True
+        for name, when, clear in self.compiled:
+            hit = False
+            for terms in when:
+                for i in terms:
+                    if not results[i]:
+                        break
+                else:
+                    hit = True
+                    break
+            if hit:
+                matched.append(name)
+            if not cleared:
+                continue
+            if clear is None:
+                cleared = not hit
+                continue
+            cleared = False
+            for terms in clear:
+                for i in terms:
+                    if not results[i]:
+                        break
+                else:
+                    cleared = True
+                    break
+        return Evaluation(matched, cleared)
+
+    def forget(self, sensor_id):
+        """センサーのウィンドウを捨てる (センサーを外したときなど)"""
+        self.sensors.pop(sensor_id, None)
+
+
+def load_rules(path):
+    """JSONファイルからルールを読み込む
+
+    形式: [{"name": "高温", "when": "temperature >= 31", "clear": "temperature < 30"}, ...]
+    """
+    with open(path, encoding='utf-8') as f:
+        entries = json.load(f)
+    if not isinstance(entries, list):
+        raise ValueError(f"ルールはリストで書いてください: {path}")
+    rules = []
+    for entry in entries:
+        if not isinstance(entry, dict) or 'name' not in entry or 'when' not in entry:
+            raise ValueError(f"ルールには name と when が必要です: {entry}")
+        rules.append(Rule(entry['name'], entry['when'], entry.get('clear')))
+    return rules
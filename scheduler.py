@@ -0,0 +1,136 @@
+# coding: utf-8
+
+# ---------------------------------------------------------------------------
+# 周期実行のスケジューラー (ずれが蓄積しない)
+#
+# n 回目の実行時刻を「開始時刻 + n × 間隔」(time.monotonic の絶対時刻) で決めるため、
+# 測定にかかった時間や sleep の遅れが次の周期に持ち越されません。
+# 実行ごとに予定時刻からの遅れ (ジッター) をヒストグラムに記録し、
+# 処理が次の予定時刻を過ぎた回数 (オーバーラン) も数えます。
+#
+# 予定時刻に間に合わなかったときの動作 (policy):
+#   'skip'    : 過ぎてしまった予定時刻は飛ばし、次の予定時刻から再開する (既定)
+#   'catchup' : 過ぎてしまった分を待たずに続けて実行し、予定の回数を守る
+#               (max_catchup 回を超えて遅れた分は飛ばす)
+#
+# 使い方:
+#   scheduler = PeriodicScheduler(5.0)
+#   for tick in scheduler.ticks(duration=3600):
+#       ... 測定 ...
+#   print(scheduler.format_stats())
+# ---------------------------------------------------------------------------
+
+import bisect
+import time
+from collections import namedtuple
+
+POLICIES = ('skip', 'catchup')
+# ジッターのヒストグラムの区切り (ミリ秒, 各区間の上限)
+JITTER_BUCKETS_MS = (0.1, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+
+# index: 予定の通し番号, deadline: 予定時刻 (monotonic), jitter: 予定時刻からの遅れ (秒)
+Tick = namedtuple('Tick', ['index', 'deadline', 'jitter'])
+
+
+class PeriodicScheduler:
+    """絶対時刻の予定に合わせて周期実行する"""
+
+    def __init__(self, interval, policy='skip', max_catchup=10,
+                 clock=time.monotonic, sleep=time.sleep):
+        if interval <= 0:
+            raise ValueError("interval は正の値にしてください")
+        if policy not in POLICIES:
+            raise ValueError(f"policy は {POLICIES} のいずれかです")
+        self.interval = interval
+        self.policy = policy
+        self.max_catchup = max_catchup
+        self.clock = clock
+        self.sleep = sleep
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.ticks_run = 0
+        self.skipped = 0        # 飛ばした予定の数
+        self.overruns = 0       # 処理が次の予定時刻を過ぎた回数
+        self.max_overrun = 0.0  # 次の予定時刻を過ぎた時間の最大値 (秒)
+        self.jitter_sum = 0.0
+        self.jitter_max = 0.0
+        self.histogram = [0] * (len(JITTER_BUCKETS_MS) + 1)  # 最後は上限を超えたもの
+
+    def _record_jitter(self, jitter):
+        self.ticks_run += 1
+        self.jitter_sum += jitter
+        if jitter > self.jitter_max:
+            self.jitter_max = jitter
+        self.histogram[bisect.bisect_left(JITTER_BUCKETS_MS, jitter * 1000)] += 1
+
+    def ticks(self, duration=None, is_running=lambda: True):
+        """予定時刻ごとに Tick を返すジェネレーター
+
+        duration 秒 (None なら無制限) が経つか is_running() が False になると終了します。
+        最初の Tick はすぐに返します。
+        """
+        start = self.clock()
+        index = 0
+        while is_running():
+            deadline = start + index * self.interval
+            if duration is not None and deadline - start >= duration:
+                return
+            now = self.clock()
+            if now < deadline:
+                self.sleep(deadline - now)
+                now = self.clock()
+            jitter = max(0.0, now - deadline)
+            self._record_jitter(jitter)
+            yield Tick(index, deadline, jitter)
+
+            # 処理が終わった時点で次の予定時刻を過ぎていればオーバーラン
+            index += 1
+            now = self.clock()
+            late = now - (start + index * self.interval)
+            if late <= 0:
+                continue
+            self.overruns += 1
+            if late > self.max_overrun:
+                self.max_overrun = late
+            overdue_last = int((now - start) // self.interval)  # 過ぎた予定のうち最後の番号
+            if self.policy == 'catchup':
+                # 過ぎた予定を続けて実行する (遅れが max_catchup 回分を超えたら古い分を飛ばす)
+                next_index = max(index, overdue_last + 1 - self.max_catchup)
+            else:
+                next_index = overdue_last + 1
+            self.skipped += next_index - index
+            index = next_index
+
+    def stats(self):
+        """統計値 (JSONに変換できる dict)"""
+        count = self.ticks_run
+        histogram = [{'le_ms': edge, 'count': n}
+                     for edge, n in zip(JITTER_BUCKETS_MS + (None,), self.histogram)]
+        return {
+            'interval': self.interval,
+            'policy': self.policy,
+            'ticks': count,
+            'skipped': self.skipped,
+            'overruns': self.overruns,
+            'max_overrun_ms': round(self.max_overrun * 1000, 3),
+            'jitter_ms': {
+                'mean': round(self.jitter_sum / count * 1000, 3) if count else None,
+                'max': round(self.jitter_max * 1000, 3),
+                'histogram': histogram,
+            },
+        }
+
+    def format_stats(self):
+        """統計値を表示用の文字列にする"""
+        s = self.stats()
+        jitter = s['jitter_ms']
+        lines = [f"実行回数: {s['ticks']}, 飛ばした予定: {s['skipped']}, "
+                 f"オーバーラン: {s['overruns']} (最大 {s['max_overrun_ms']} ms)",
+                 f"ジッター: 平均 {jitter['mean']} ms, 最大 {jitter['max']} ms"]
+        for bucket in jitter['histogram']:
+            if bucket['count']:
+                label = (f"≦{bucket['le_ms']} ms" if bucket['le_ms'] is not None
+                         else f">{JITTER_BUCKETS_MS[-1]} ms")
+                lines.append(f"  {label:>10}: {bucket['count']}")
+        return '\n'.join(lines)
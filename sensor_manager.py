@@ -0,0 +1,197 @@
+# coding: utf-8
+
+# ---------------------------------------------------------------------------
+# 複数のBME280の管理
+#
+# 指定したI2Cバスのアドレス (既定 0x76, 0x77) のチップIDを読み、BME280 (0x60) が
+# 応答したものを管理します。バスはバスごとに1つだけ開き、同じバスへの通信は
+# バスごとのロックで直列化するので、通信が重なることはありません。
+#
+# read_all() は全センサーを1回ずつ読みます。フォースドモードのセンサーは先に全て
+# 計測を開始してから順に結果を読み出すので、計測待ちは全体で約1回分で済みます。
+#
+# センサーIDは「バス番号-アドレス(16進)」です (例: バス1の0x76 → '1-76')。
+# ファイル名やURLのパラメーターにそのまま使えます。
+# ---------------------------------------------------------------------------
+
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+
+from bme280_calib import BME280_CHIP_ID, CHIP_ID_REG, load_calibration
+from bme280_compensation import CompensationEngine
+from bme280_profiles import apply_profile, select_profile
+from bme280_timing import DATA_LENGTH, REG_DATA
+from raw_log import decode_raw_block
+
+logger = logging.getLogger(__name__)
+
+SENSOR_ADDRESSES = (0x76, 0x77)
+
+# センサーID付きの補正済みの測定値 (timestamp はUNIX秒)
+Reading = namedtuple('Reading', ['sensor_id', 'timestamp', 'temperature', 'pressure', 'humidity'])
+
+
+def make_sensor_id(bus_number, address):
+    return f"{bus_number}-{address:02x}"
+
+
+def sensor_path(path, sensor_id):
+    """保存先をセンサーごとに分ける (ファイルは名前の末尾に、ディレクトリはその下にIDを付ける)
+
+    'bme280_log.csv' → 'bme280_log_1-76.csv', 'bme280_logs' → 'bme280_logs/1-76'
+    """
+    root, ext = os.path.splitext(path)
+    if ext:
+        return f"{root}_{sensor_id}{ext}"
+    return os.path.join(path, sensor_id)
+
+
+def open_smbus(bus_number):
+    from smbus2 import SMBus
+    return SMBus(bus_number)
+
+
+class ManagedSensor:
+    """管理下の1台のBME280"""
+
+    def __init__(self, bus_number, address, bus, calibration, profile, reader, integer=False):
+        self.sensor_id = make_sensor_id(bus_number, address)
+        self.bus_number = bus_number
+        self.address = address
+        self.bus = bus
+        self.calibration = calibration
+        self.engine = CompensationEngine(calibration, integer=integer)
+        self.profile = profile
+        self.reader = reader  # フォースドモードの読み出し (ノーマルモードなら None)
+        self.reads = 0
+        self.failures = 0
+        self.last_error = None
+        self.last_read_ms = None  # 直前の読み出しにかかった時間 (計測待ちを含む)
+
+    def status(self):
+        return {
+            'sensor_id': self.sensor_id,
+            'bus': self.bus_number,
+            'address': f"{self.address:#04x}",
+            'profile': self.profile.name,
+            'reads': self.reads,
+            'failures': self.failures,
+            'last_error': self.last_error,
+            'last_read_ms': None if self.last_read_ms is None else round(self.last_read_ms, 3),
+        }
+
+
+class SensorManager:
+    """複数のバス・アドレスのBME280をまとめて検出・読み出しする"""
+
+    def __init__(self, bus_numbers=(1,), addresses=SENSOR_ADDRESSES, profile=None,
+                 integer=False, open_bus=open_smbus):
+        self.bus_numbers = tuple(bus_numbers)
+        self.addresses = tuple(addresses)
+        self.profile = profile or select_profile()
+        self.integer = integer
+        self.open_bus = open_bus
+        self.buses = {}       # バス番号 → バス
+        self.bus_locks = {}   # バス番号 → そのバスの通信を直列化するロック
+        self.sensors = []     # 検出した順 (バス番号順・アドレス順)
+        self.by_id = {}
+
+    def discover(self):
+        """チップIDでBME280を探し、見つかったセンサーを設定して返す"""
+        for bus_number in self.bus_numbers:
+            if bus_number in self.buses:
+                continue
+            try:
+                bus = self.open_bus(bus_number)
+            except ImportError:
+                logger.warning("smbus2がインストールされていません。センサーは使用できません。")
+                break
+            except OSError as e:
+                logger.error(f"I2Cバス {bus_number} を開けませんでした: {e}")
+                continue
+            found = [sensor for sensor in (self._probe(bus, bus_number, address)
+                                           for address in self.addresses) if sensor is not None]
+            if not found:
+                logger.info(f"I2Cバス {bus_number} にBME280はありませんでした")
+                bus.close()
+                continue
+            self.buses[bus_number] = bus
+            self.bus_locks[bus_number] = threading.Lock()
+            for sensor in found:
+                self.sensors.append(sensor)
+                self.by_id[sensor.sensor_id] = sensor
+                logger.info(f"BME280を検出しました: {sensor.sensor_id} (バス {bus_number}, アドレス {sensor.address:#04x})")
+        return self.sensors
+
+    def _probe(self, bus, bus_number, address):
+        try:
+            chip_id = bus.read_byte_data(address, CHIP_ID_REG)
+        except OSError:
+            return None  # 応答なし (そのアドレスには何も接続されていない)
+        if chip_id != BME280_CHIP_ID:
+            logger.info(f"バス {bus_number} のアドレス {address:#04x} はBME280ではありません (チップID {chip_id:#04x})")
+            return None
+        calib = load_calibration(bus, address, bus_number)
+        if calib is None:
+            return None
+        try:
+            reader = apply_profile(bus, address, self.profile)
+        except OSError as e:
+            logger.error(f"センサー {make_sensor_id(bus_number, address)} の設定に失敗しました: {e}")
+            return None
+        return ManagedSensor(bus_number, address, bus, calib, self.profile, reader, self.integer)
+
+    def _failed(self, sensor, error):
+        sensor.failures += 1
+        sensor.last_error = str(error)
+        logger.error(f"センサー {sensor.sensor_id} の読み出しに失敗しました: {error}")
+
+    def read_all(self):
+        """全センサーを1回ずつ読み、読めたものの Reading のリストを返す"""
+        # フォースドモードのセンサーはまず全て計測を開始する (計測はセンサーの中で並行して進む)
+        started = {}
+        for sensor in self.sensors:
+            if sensor.reader is None:
+                continue
+            try:
+                with self.bus_locks[sensor.bus_number]:
+                    started[sensor.sensor_id] = sensor.reader.clock()
+                    sensor.reader.trigger()
+            except OSError as e:
+                self._failed(sensor, e)
+
+        readings = []
+        for sensor in self.sensors:
+            if sensor.reader is not None and sensor.sensor_id not in started:
+                continue
+            begin = time.perf_counter()
+            try:
+                with self.bus_locks[sensor.bus_number]:
+                    if sensor.reader is not None:
+                        sensor.reader.wait_ready(started[sensor.sensor_id])
+                    block = sensor.bus.read_i2c_block_data(sensor.address, REG_DATA, DATA_LENGTH)
+            except OSError as e:
+                self._failed(sensor, e)
+                continue
+            now = time.time()
+            sensor.reads += 1
+            sensor.last_error = None
+            if sensor.reader is not None:
+                sensor.last_read_ms = sensor.reader.last_wait * 1000
+            else:
+                sensor.last_read_ms = (time.perf_counter() - begin) * 1000
+            temp, pres, hum = sensor.engine.compensate(*decode_raw_block(block))
+            readings.append(Reading(sensor.sensor_id, now, temp, pres, hum))
+        return readings
+
+    def status(self):
+        return [sensor.status() for sensor in self.sensors]
+
+    def close(self):
+        for bus_number, bus in self.buses.items():
+            with self.bus_locks[bus_number]:
+                bus.close()
+        self.buses.clear()
@@ -0,0 +1,199 @@
+# coding: utf-8
+
+# ---------------------------------------------------------------------------
+# SMTPセッションの再利用 (アラートメール用)
+#
+# smtplib.SMTP で毎回接続すると、1通ごとに TCP接続・EHLO・STARTTLS (TLSハンドシェイク)・
+# ログインが必要で、Gmailでは送信1回に1秒前後かかります。
+# SMTPTransport はログイン済みのセッションを保持して使い回します。
+#
+#   ・接続は最初に送るときに行う (遅延接続)
+#   ・しばらく使っていないセッションは送信前に NOOP で生きているか確認する
+#   ・start_keepalive() で、使っていない間も keepalive_interval 秒ごとに NOOP を送る
+#     (max_idle 秒使わなければ切断し、次に送るときに接続し直す)
+#   ・サーバーに切断されていたら1回だけ接続し直して送り直す
+#   ・send_batch() で複数のメールを1つのセッションでまとめて送る
+#
+# 使い方:
+#   transport = SMTPTransport('smtp.gmail.com', 587, 'me@gmail.com', 'app-password')
+#   transport.send(msg)          # msg は email.message.Message
+#   transport.close()
+#
+# 送信時間の比較: python bench_smtp.py (ローカルのSMTPサーバー aiosmtpd を使用)
+# ---------------------------------------------------------------------------
+
+import logging
+import smtplib
+import socket
+import ssl
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+KEEPALIVE_INTERVAL = 60   # この秒数使っていなければ、送信前 (または keepalive スレッド) で NOOP を送る
+MAX_IDLE = 30 * 60        # この秒数使っていないセッションは keepalive スレッドが切断する
+
+# 接続し直せば送れる可能性があるエラー (サーバーからの切断・タイムアウト・接続の切断)
+# SMTPException も OSError のサブクラスなので、OSError 全体は入れない (宛先の拒否などを送り直さないため)
+RECONNECT_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, socket.timeout)
+
+
+class SMTPTransport:
+    """ログイン済みのSMTPセッションを使い回してメールを送る (スレッドセーフ)"""
+
+    def __init__(self, host, port=587, username=None, password=None, starttls=True,
+                 timeout=20, keepalive_interval=KEEPALIVE_INTERVAL, max_idle=MAX_IDLE,
+                 smtp_class=smtplib.SMTP, clock=time.monotonic):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+        self.keepalive_interval = keepalive_interval
+        self.max_idle = max_idle
+        self.smtp_class = smtp_class
+        self.clock = clock
+        self.lock = threading.Lock()  # セッションを使うのは1スレッドずつ
+        self.server = None
+        self.last_used = 0.0     # 最後に接続・送信した時刻 (max_idle の判定に使う)
+        self.last_checked = 0.0  # 最後にセッションが生きていることを確認した時刻
+        self.connects = 0   # 接続した回数 (再接続を含む)
+        self.sent = 0
+        self._stop = threading.Event()
+        self._keepalive_thread = None
+
+    def _connect(self):
+        server = self.smtp_class(self.host, self.port, timeout=self.timeout)
+        try:
+            server.ehlo()
+            if self.starttls:
+                server.starttls(context=ssl.create_default_context())
+                server.ehlo()
+            if self.username:
+                server.login(self.username, self.password)
+        except Exception:
+            self._quit(server)
+            raise
+        self.server = server
+        self.last_used = self.last_checked = self.clock()
+        self.connects += 1
+        logger.debug(f"SMTPサーバー {self.host}:{self.port} に接続しました")
+
+    @staticmethod
+    def _quit(server):
+        try:
+            server.quit()
+        except (smtplib.SMTPException, OSError):
+            server.close()
+
+    def _disconnect(self):
+        if self.server is not None:
+            self._quit(self.server)
+            self.server = None
+
+    def _alive(self):
+        """NOOP を送ってセッションが使えるか確認する"""
+        try:
+            code, _ = self.server.noop()
+        except smtplib.SMTPException:
+            return False
+        except RECONNECT_ERRORS:
+            return False
+        if code != 250:
+            return False
+        self.last_checked = self.clock()
+        return True
+
+    def _session(self):
+        """使えるセッションを返す (なければ接続し、しばらく使っていなければ確認する)"""
+        if self.server is not None and self.clock() - self.last_checked >= self.keepalive_interval:
+            if not self._alive():
+                logger.info("SMTPセッションが切れていたため接続し直します")
+                self._disconnect()
+        if self.server is None:
+            self._connect()
+        return self.server
+
+    def _send_one(self, msg, timeout):
+        """1通送る。切断されていたら1回だけ接続し直して送り直す"""
+        for attempt in (1, 2):
+            server = self._session()
+            if timeout is not None and server.sock is not None:
+                server.sock.settimeout(timeout)
+            try:
+                server.send_message(msg)
+            except smtplib.SMTPException as e:
+                if not isinstance(e, smtplib.SMTPServerDisconnected):
+                    # 宛先の拒否などはセッションの問題ではないが、状態が分からないので RSET しておく
+                    try:
+                        server.rset()
+                    except RECONNECT_ERRORS:
+                        self._disconnect()
+                    raise
+                self._disconnect()
+                if attempt == 2:
+                    raise
+                continue
+            except RECONNECT_ERRORS:
+                self._disconnect()
+                if attempt == 2:
+                    raise
+                continue
+            self.last_used = self.last_checked = self.clock()
+            self.sent += 1
+            return
+
+    def send(self, msg, timeout=None):
+        """メールを1通送る (失敗したら例外。timeout は今回の送信の制限時間 (秒))"""
+        with self.lock:
+            self._send_one(msg, timeout)
+
+    def send_batch(self, messages, timeout=None):
+        """複数のメールを1つのセッションで送る。送れなかったメールと例外の組のリストを返す"""
+        failures = []
+        with self.lock:
+            for msg in messages:
+                try:
+                    self._send_one(msg, timeout)
+                except (smtplib.SMTPException, OSError) as e:
+                    failures.append((msg, e))
+        return failures
+
+    def keepalive(self):
+        """使っていないセッションに NOOP を送る (max_idle 秒使っていなければ切断する)"""
+        with self.lock:
+            if self.server is None:
+                return
+            now = self.clock()
+            if now - self.last_used >= self.max_idle:
+                logger.debug("使っていないSMTPセッションを切断します")
+                self._disconnect()
+            elif now - self.last_checked >= self.keepalive_interval and not self._alive():
+                self._disconnect()  # 次に送るときに接続し直す
+
+    def start_keepalive(self):
+        """keepalive_interval 秒ごとに keepalive() を呼ぶスレッドを開始する"""
+        self._keepalive_thread = threading.Thread(target=self._keepalive_loop,
+                                                  name='smtp-keepalive', daemon=True)
+        self._keepalive_thread.start()
+        return self
+
+    def _keepalive_loop(self):
+        while not self._stop.wait(self.keepalive_interval):
+            self.keepalive()
+
+    def close(self):
+        self._stop.set()
+        if self._keepalive_thread is not None:
+            self._keepalive_thread.join()
+            self._keepalive_thread = None
+        with self.lock:
+            self._disconnect()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
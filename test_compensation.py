@@ -0,0 +1,59 @@
+# coding: utf-8
+
+import pytest
+
+from bench_compensation import SAMPLE_CALIBRATION, LegacyCompensation
+from bme280_calib import decode_calibration
+from bme280_compensation import CompensationEngine
+
+# データシートの計算例の補正パラメータ (0x88〜0xA1, 0xE1〜0xE7 の生バイト列)
+CALIB_BLOB = bytes.fromhex(
+    '706b436718fc7d8e43d6d00b270b8c00f9ff8c3cf8c67017004b'
+    '6a01001329031e'
+)
+
+RAW_TEMPS = range(400000, 620001, 20000)
+RAW_PRESSURES = range(250000, 500001, 25000)
+RAW_HUMIDITIES = range(20000, 45001, 2500)
+
+
+@pytest.fixture(scope='module')
+def calib():
+    return decode_calibration(CALIB_BLOB)
+
+
+def raw_grid():
+    for raw_t in RAW_TEMPS:
+        for raw_p in RAW_PRESSURES:
+            for raw_h in RAW_HUMIDITIES:
+                yield raw_t, raw_p, raw_h
+
+
+def legacy_values(calib, raw_t, raw_p, raw_h):
+    legacy = LegacyCompensation(calib)
+    return (legacy.compensate_temp(raw_t),
+            legacy.compensate_pressure(raw_p),
+            legacy.compensate_humidity(raw_h))
+
+
+def test_blob_decodes_to_datasheet_example(calib):
+    assert calib.digT == SAMPLE_CALIBRATION.digT
+    assert calib.digP == SAMPLE_CALIBRATION.digP
+    assert calib.digH == SAMPLE_CALIBRATION.digH
+
+
+def test_float_matches_legacy_bit_for_bit(calib):
+    engine = CompensationEngine(calib)
+    for raw in raw_grid():
+        assert engine.compensate(*raw) == legacy_values(calib, *raw), raw
+
+
+def test_int_matches_legacy_within_resolution(calib):
+    engine = CompensationEngine(calib, integer=True)
+    for raw in raw_grid():
+        temp, pres, humi = engine.compensate(*raw)
+        l_temp, l_pres, l_humi = legacy_values(calib, *raw)
+        assert temp == pytest.approx(l_temp, abs=0.01), raw
+        assert pres == pytest.approx(l_pres, abs=0.01), raw
+        assert humi == pytest.approx(l_humi, abs=0.01), raw
+
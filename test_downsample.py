@@ -0,0 +1,33 @@
+# coding: utf-8
+
+import pytest
+
+from downsample import lttb, minmax
+
+
+def make_samples(n):
+    return [(float(i), 20.0 + (i % 7), 1000.0, 50.0) for i in range(n)]
+
+
+@pytest.mark.parametrize('n', [0, 1, 2, 3])
+@pytest.mark.parametrize('points', [0, 1, 2, 3])
+def test_lttb_small_input_is_returned_as_is(n, points):
+    samples = make_samples(n)
+    assert lttb(samples, points) == samples
+
+
+@pytest.mark.parametrize('points', [0, 1, 2, 3])
+def test_lttb_keeps_first_and_last(points):
+    samples = make_samples(50)
+    result = lttb(samples, points)
+    assert len(result) == 3
+    assert result[0] == samples[0] and result[-1] == samples[-1]
+
+
+@pytest.mark.parametrize('n', [0, 1, 2, 3])
+@pytest.mark.parametrize('points', [0, 1, 2, 3])
+def test_minmax_small_input(n, points):
+    samples = make_samples(n)
+    result = minmax(samples, points)
+    assert all(s in samples for s in result)
+    assert len(result) <= max(n, 1)
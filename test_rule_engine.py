@@ -0,0 +1,36 @@
+# coding: utf-8
+
+import json
+
+import pytest
+
+from alert_engine import numeric_fields
+from rule_engine import Rule, RuleEngine, load_rules
+
+
+def load_engine(tmp_path, entries):
+    path = tmp_path / 'rules.json'
+    path.write_text(json.dumps(entries, ensure_ascii=False), encoding='utf-8')
+    return RuleEngine(load_rules(path), fields=numeric_fields())
+
+
+def test_known_numeric_fields_load(tmp_path):
+    engine = load_engine(tmp_path, [
+        {'name': '高温', 'when': 'mean(temperature, 15m) >= 28 and wbgt >= 25',
+         'clear': 'temperature < 27'},
+    ])
+    assert engine.fields() == ['temperature', 'wbgt']
+
+
+@pytest.mark.parametrize('when, field', [
+    ('temprature >= 30', 'temprature'),         # 書き間違い
+    ('humidity >= 70 or risk >= 2', 'risk'),    # 数値でない項目
+])
+def test_unusable_field_raises_at_load(tmp_path, when, field):
+    with pytest.raises(ValueError, match=f"'{field}'"):
+        load_engine(tmp_path, [{'name': '高温', 'when': when}])
+
+
+def test_unusable_field_in_clear_raises():
+    with pytest.raises(ValueError, match="'risk'"):
+        RuleEngine([Rule('高温', 'temperature >= 31', clear='risk < 1')], fields=numeric_fields())